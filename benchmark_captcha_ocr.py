@@ -0,0 +1,150 @@
+import io
+import os
+import sys
+import csv
+import time
+import django
+
+# Setup Django environment
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'web_interface'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_interface.settings')
+django.setup()
+
+from worker.utils.captcha_cache import MAX_DISTANCE, image_hash, hash_distance
+from worker.utils.captcha_solver import (
+    BACKENDS, CaptchaImage, CaptchaTicket, TwoCaptchaBackend, solver_stats
+)
+
+# Labelled captchas saved from the site: either a labels.csv (file,answer) in the
+# directory or files named after their answer (A7K9QZ.png, A7K9QZ_2.jpg)
+SAMPLES_DIR = os.getenv('CAPTCHA_SAMPLES_DIR', os.path.join(BASE_DIR, 'captcha_samples'))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def load_samples(directory):
+    labels_path = os.path.join(directory, 'labels.csv')
+    samples = []
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[0] != 'file':
+                    samples.append((os.path.join(directory, row[0]), row[1].strip().upper()))
+    else:
+        for filename in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() in IMAGE_EXTENSIONS:
+                samples.append((os.path.join(directory, filename), stem.split('_')[0].upper()))
+
+    loaded = []
+    for path, label in samples:
+        with open(path, 'rb') as f:
+            loaded.append((f.read(), label))
+    return loaded
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run_pipeline(samples, backends, policy):
+    """Solves every sample through CaptchaTicket; returns (answers, latencies_ms, winners)."""
+    answers, latencies, winners = [], [], []
+    for raw, _ in samples:
+        started = time.perf_counter()
+        ticket = CaptchaTicket(None, CaptchaImage(raw), backends, policy)
+        answers.append(ticket.result(timeout=180))
+        latencies.append((time.perf_counter() - started) * 1000)
+        winners.append(ticket.winner)
+    return answers, latencies, winners
+
+
+def report(title, samples, answers, latencies):
+    correct = sum(1 for (_, label), answer in zip(samples, answers) if answer == label)
+    print(f"{title:<28} accuracy {correct / len(samples):6.1%} ({correct}/{len(samples)})  "
+          f"p50 {percentile(latencies, 50):7.0f} ms  p95 {percentile(latencies, 95):7.0f} ms")
+
+
+def confidence_table(samples, backend):
+    """Accuracy per confidence bucket, to pick LOCAL_OCR_MIN_CONFIDENCE."""
+    rows = []
+    for raw, label in samples:
+        code, confidence, _ = backend.solve(CaptchaImage(raw))
+        rows.append((confidence, code == label))
+
+    print(f"\n--- {backend.name} CONFIDENCE THRESHOLDS ---")
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95):
+        kept = [ok for confidence, ok in rows if confidence >= threshold]
+        accuracy = sum(kept) / len(kept) if kept else 0.0
+        print(f">= {threshold:.2f}: {len(kept) / len(rows):6.1%} answered locally, {accuracy:6.1%} of them correct")
+
+
+def hash_distance_table(samples):
+    """Hash distance of re-encoded vs different captchas, to pick CAPTCHA_CACHE_MAX_DISTANCE."""
+    from PIL import Image
+
+    hashes = [(image_hash(raw), label) for raw, label in samples]
+    print("\n--- ANSWER CACHE HASH DISTANCE ---")
+    for quality in (95, 75, 60):
+        distances = []
+        for (raw, _), (key, _) in zip(samples, hashes):
+            with Image.open(io.BytesIO(raw)) as img:
+                out = io.BytesIO()
+                img.convert('RGB').save(out, 'JPEG', quality=quality)
+            distances.append(hash_distance(key, image_hash(out.getvalue())))
+        print(f"same captcha, JPEG q{quality}: max {max(distances)} bits, p50 {percentile(distances, 50):.0f}")
+
+    different = [
+        hash_distance(a, b) for i, (a, label_a) in enumerate(hashes) for b, label_b in hashes[:i]
+        if label_a != label_b and hash_distance(a, b) is not None
+    ]
+    if different:
+        print(f"different answers: min {min(different)} bits, p1 {percentile(different, 1):.0f}")
+    print(f"current max distance: {MAX_DISTANCE}")
+
+
+def main():
+    if not os.path.isdir(SAMPLES_DIR):
+        print(f"No samples directory at {SAMPLES_DIR} (set CAPTCHA_SAMPLES_DIR).")
+        sys.exit(1)
+    samples = load_samples(SAMPLES_DIR)
+    if not samples:
+        print(f"No labelled captchas in {SAMPLES_DIR}.")
+        sys.exit(1)
+    print(f"{len(samples)} labelled captchas from {SAMPLES_DIR}\n")
+
+    local = BACKENDS['ddddocr']()
+    remote = TwoCaptchaBackend(os.getenv("CAPTCH_API_KEY"))
+    if not local.available():
+        print("ddddocr is not installed (pip install ddddocr), local backend skipped.")
+    if not remote.available():
+        print("CAPTCH_API_KEY is not set, remote backend skipped.")
+
+    print("--- PER BACKEND ---")
+    if local.available():
+        answers, latencies, _ = run_pipeline(samples, [local], 'race')
+        report('ddddocr (local)', samples, answers, latencies)
+    if remote.available():
+        answers, latencies, _ = run_pipeline(samples, [remote], 'race')
+        report('2captcha (remote)', samples, answers, latencies)
+
+    if local.available() and remote.available():
+        print(f"\n--- ESCALATE (local >= {local.min_confidence:.2f}, else remote) ---")
+        answers, latencies, winners = run_pipeline(samples, [local, remote], 'escalate')
+        report('ddddocr -> 2captcha', samples, answers, latencies)
+        remote_calls = solver_stats().get('2captcha', {})
+        print(f"answered locally: {winners.count('ddddocr')}/{len(samples)}, "
+              f"remote calls skipped: {remote_calls.get('skipped', 0)}")
+
+    if local.available():
+        confidence_table(samples, local)
+
+    hash_distance_table(samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import os
+import re
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import django
+
+# Setup Django environment
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'web_interface'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_interface.settings')
+django.setup()
+
+from worker.services.matik_api import MatikAPIService
+
+SIZES = [int(n) for n in os.getenv('XML_BENCH_SIZES', '1000,10000,50000').split(',')]
+# Simulated download speed of the Matik response (0 = no throttling)
+MBPS = float(os.getenv('XML_BENCH_MBPS', '50'))
+CHUNK_SIZE = MatikAPIService.CHUNK_SIZE
+
+
+def matik_response(count: int) -> bytes:
+    taleps = ''.join(
+        f"<talep><id>{5500000 + i}</id><numara>53{i:08d}</numara><operator>turkcellses</operator>"
+        f"<kontor>{100 + i % 50}</kontor><paketadi>Süper Paket {i % 20} GB</paketadi></talep>\n"
+        for i in range(count)
+    )
+    return f'<?xml version="1.0" encoding="ISO-8859-9"?>\n<turkcell>\n{taleps}</turkcell>'.encode('iso-8859-9')
+
+
+def download(body: bytes):
+    """Yields the body in CHUNK_SIZE pieces at MBPS, like response.iter_content."""
+    per_chunk = CHUNK_SIZE * 8 / (MBPS * 1_000_000) if MBPS else 0
+    for start in range(0, len(body), CHUNK_SIZE):
+        if per_chunk:
+            time.sleep(per_chunk)
+        yield body[start:start + CHUNK_SIZE]
+
+
+def legacy_parse(chunks):
+    """The previous fetch_pending_orders: whole body, decode, regex, fromstring, root.iter(), tostring per order."""
+    content = b''.join(chunks)  # response.content
+    content_str = content.decode('iso-8859-9', errors='ignore').strip()
+    content_str = re.sub(r'<\?xml.*?\?>', '', content_str).strip()
+    root = ET.fromstring(f"<dummy_root>{content_str}</dummy_root>")
+    for child in root.iter():
+        if child.tag in ['talep', 'islem']:
+            data = {}
+            for item in child:
+                data[item.tag] = item.text
+            if 'id' in data and 'numara' in data:
+                yield {
+                    'ref': data.get('id'),
+                    'phone': data.get('numara'),
+                    'operator': data.get('operator'),
+                    'kontor': data.get('kontor'),
+                    'raw': ET.tostring(child, encoding='unicode')
+                }
+
+
+def measure(parse, body):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_ms, count = None, 0
+    for _ in parse(download(body)):
+        if first_ms is None:
+            first_ms = (time.perf_counter() - started) * 1000
+        count += 1
+    total_ms = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, first_ms or 0.0, total_ms, peak / 1024 / 1024
+
+
+def main():
+    print(f"Matik XML parsing, {CHUNK_SIZE // 1024} KB chunks at {MBPS or 'unthrottled'} Mbit/s\n")
+    print(f"{'orders':>7} {'parser':<10} {'body MB':>8} {'first order':>12} {'total':>10} {'peak MB':>8}")
+    parsers = [
+        ('legacy', legacy_parse),
+        ('streaming', MatikAPIService.parse_orders),
+    ]
+    for size in SIZES:
+        body = matik_response(size)
+        for name, parse in parsers:
+            count, first_ms, total_ms, peak_mb = measure(parse, body)
+            assert count == size, f"{name} parsed {count}/{size}"
+            print(f"{size:>7} {name:<10} {len(body) / 1024 / 1024:>8.2f} {first_ms:>9.1f} ms {total_ms:>7.0f} ms {peak_mb:>8.2f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import random
+import django
+
+# Setup Django environment
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'web_interface'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_interface.settings')
+django.setup()
+
+from worker.engine.turkcell.matching import match_score, PackageMatchIndex
+
+# Golden set: (query, catalog names) cases the scorer has to get right
+GOLDEN_CATALOG = [
+    "Turkcell GNÇ 1GB", "GNÇ 2GB Paket", "Haftalık 5GB", "Aylık 10GB Süper Paket",
+    "11GB Fırsat Paketi", "1000 Dakika Paketi", "250 Dk Her Yöne", "500 SMS",
+    "Sosyal Medya Paketi 4GB", "Youtube 8 GB", "Gün Boyu İnternet 1 GB", "Yurtdışı 2 GB",
+    "Her Yöne 1000 DK 10 GB", "Fırsat 1GB", "Platinum 20GB", "Platinum 20 GB Plus", "",
+]
+GOLDEN_QUERIES = [
+    "Turkcell GNÇ 1GB", "1GB", "1 GB", "gnç 2gb", "5GB Haftalık", "10GB Aylık", "11GB",
+    "1000 Dakika", "250 Dakika", "500sms", "Sosyal 4GB", "YouTube 8GB", "turkcell 20gb",
+    "Platinum 20GB", "Yurt Dışı 2GB", "Her Yöne 1000DK", "Bilinmeyen Paket", "", "GNÇ",
+]
+
+WORDS = ["Süper", "Fırsat", "Haftalık", "Aylık", "Gün Boyu", "Sosyal", "Her Yöne", "Platinum",
+         "GNÇ", "Turkcell", "Yurtdışı", "Gece", "Oyun", "Müzik", "Video", "Ekstra", "Bonus"]
+UNITS = ["GB", "Dk", "Dakika", "SMS", "MB"]
+
+
+def random_name(rng):
+    parts = rng.sample(WORDS, rng.randint(1, 3))
+    parts.insert(rng.randint(0, len(parts)), f"{rng.choice([1, 2, 3, 4, 5, 8, 10, 15, 20, 50, 100, 250, 500, 1000])}{rng.choice(['', ' '])}{rng.choice(UNITS)}")
+    if rng.random() < 0.3:
+        parts.append("Paketi")
+    return " ".join(parts)
+
+
+def mutate(rng, name):
+    """A query as the API would send it: different case, spacing, abbreviations."""
+    query = name.lower() if rng.random() < 0.5 else name
+    query = query.replace("Dakika", "Dk") if rng.random() < 0.5 else query.replace("Dk", "Dakika")
+    if rng.random() < 0.3:
+        query = query.replace(" ", "")
+    if rng.random() < 0.3:
+        words = query.split()
+        rng.shuffle(words)
+        query = " ".join(words)
+    if rng.random() < 0.2:
+        query = "Turkcell " + query
+    return query
+
+
+def brute_force(search_texts, names):
+    """The select_package loop: first card with the strictly best score wins."""
+    best_score, best_index = 0.0, None
+    for i, name in enumerate(names):
+        for text in search_texts:
+            score = match_score(text, name)
+            if score > best_score:
+                best_score, best_index = score, i
+    return best_score, best_index
+
+
+def check_parity(names, query_sets):
+    index = PackageMatchIndex(names)
+    mismatches = 0
+    for search_texts in query_sets:
+        expected = brute_force(search_texts, names)
+        got = index.best(search_texts)
+        if expected != got:
+            mismatches += 1
+            print(f"  MISMATCH {search_texts}: expected {expected}, got {got}")
+        for text in search_texts:
+            for i, name in enumerate(names):
+                if index.score(text, i) != match_score(text, name):
+                    mismatches += 1
+                    print(f"  SCORE MISMATCH '{text}' vs '{name}'")
+    return mismatches
+
+
+def main():
+    rng = random.Random(42)
+
+    print("--- GOLDEN SET PARITY ---")
+    golden_sets = [[q] for q in GOLDEN_QUERIES] + [[a, b] for a, b in zip(GOLDEN_QUERIES, GOLDEN_QUERIES[1:])]
+    mismatches = check_parity(GOLDEN_CATALOG, golden_sets)
+    print(f"{len(golden_sets)} query sets, {mismatches} mismatches")
+
+    catalog_size = int(os.getenv('BENCH_CATALOG_SIZE', '300'))
+    names = [random_name(rng) for _ in range(catalog_size)]
+    query_sets = [[mutate(rng, rng.choice(names))] for _ in range(150)]
+    query_sets += [[mutate(rng, rng.choice(names)), random_name(rng)] for _ in range(50)]
+
+    print(f"\n--- RANDOM CATALOG PARITY ({catalog_size} packages) ---")
+    random_mismatches = check_parity(names, query_sets[:60])
+    print(f"60 query sets, {random_mismatches} mismatches")
+
+    print(f"\n--- MICROBENCHMARK ({catalog_size} packages, {len(query_sets)} lookups) ---")
+    started = time.perf_counter()
+    for search_texts in query_sets:
+        brute_force(search_texts, names)
+    brute_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    index = PackageMatchIndex(names)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for search_texts in query_sets:
+        index.best(search_texts)
+    index_ms = (time.perf_counter() - started) * 1000
+
+    print(f"match_score loop : {brute_ms:8.1f} ms ({brute_ms / len(query_sets):.2f} ms/lookup)")
+    print(f"index build      : {build_ms:8.1f} ms (once per catalog snapshot)")
+    print(f"index lookups    : {index_ms:8.1f} ms ({index_ms / len(query_sets):.2f} ms/lookup)")
+    print(f"speedup          : {brute_ms / max(index_ms, 0.001):.1f}x")
+
+    if mismatches or random_mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import django
+
+# Setup Django environment
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'web_interface'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_interface.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Order, Operator, SystemSetting
+from worker import tasks
+from worker.services.matik_api import MatikAPIService
+
+# Pending <talep> entries in the mocked Matik response
+ORDER_COUNT = int(os.getenv('LOADTEST_ORDERS', '1000'))
+# Share of them that already exist as FAILED orders (re-sent by Matik)
+FAILED_SHARE = float(os.getenv('LOADTEST_FAILED_SHARE', '0.1'))
+
+
+class FakeResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.text = content.decode('iso-8859-9')
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Stands in for the pooled Matik session: every GET returns the same big response."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        return FakeResponse(self.content)
+
+
+def matik_response(count: int) -> bytes:
+    taleps = ''.join(
+        f"<talep><id>LT{i:06d}</id><numara>53{i:08d}</numara><operator>turkcell</operator>"
+        f"<kontor>{100 + i % 50}</kontor></talep>"
+        for i in range(count)
+    )
+    return f'<?xml version="1.0" encoding="ISO-8859-9"?>{taleps}'.encode('iso-8859-9')
+
+
+def legacy_ingest(orders):
+    """The previous per-<talep> loop (lookup, operator, create, delay one by one), for comparison."""
+    dispatched = 0
+    for order_data in orders:
+        ref = order_data.get('ref')
+        existing_order = Order.objects.filter(external_ref=ref).first()
+        if existing_order:
+            if existing_order.status == Order.Status.FAILED:
+                existing_order.status = Order.Status.PENDING
+                existing_order.save()
+                dispatched += 1
+            continue
+        Order.objects.create(
+            phone_number=order_data['phone'],
+            operator=Operator.objects.first(),
+            external_ref=ref,
+            api_source='MATIK',
+            raw_api_data='{}',
+            status=Order.Status.PENDING
+        )
+        dispatched += 1
+    return dispatched
+
+
+def seed_failed(count: int):
+    operator = Operator.objects.first()
+    Order.objects.bulk_create([
+        Order(phone_number=f"53{i:08d}", operator=operator, external_ref=f"LT{i:06d}",
+              api_source='MATIK', status=Order.Status.FAILED)
+        for i in range(0, ORDER_COUNT, max(int(1 / FAILED_SHARE), 1))[:count]
+    ])
+
+
+def measure(title, func):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        result = func()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"{title:<42} {len(queries):6d} queries  {elapsed_ms:9.1f} ms  -> {result}")
+
+
+def main():
+    dispatched = []
+    tasks.dispatch_autonomous_orders = lambda order_ids: order_ids and dispatched.append(len(order_ids))
+    MatikAPIService._session = FakeSession(matik_response(ORDER_COUNT))
+
+    print(f"Mocked Matik response: {ORDER_COUNT} <talep>, {FAILED_SHARE:.0%} already FAILED "
+          f"({connection.vendor} database, everything is rolled back)\n")
+
+    with transaction.atomic():
+        if not Operator.objects.exists():
+            Operator.objects.create(name='Turkcell', slug='turkcell', base_url='https://www.turkcell.com.tr')
+        SystemSetting.objects.update_or_create(id=1, defaults={'is_autonomous_active': True})
+
+        started = time.perf_counter()
+        orders = MatikAPIService.fetch_pending_orders()
+        print(f"Fetch + parse: {len(orders)} orders in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+        print("--- BATCHED (poll_matik_api) ---")
+        sid = transaction.savepoint()
+        seed_failed(int(ORDER_COUNT * FAILED_SHARE))
+        measure("first poll (new + retried FAILED)", lambda: tasks._poll_matik_once(None))
+        measure("second poll (all known, dedup only)", lambda: tasks._poll_matik_once(30.0))
+        print(f"grouped dispatches: {len(dispatched)} ({sum(dispatched)} orders)\n")
+        transaction.savepoint_rollback(sid)
+
+        print("--- LEGACY (one query set per <talep>) ---")
+        seed_failed(int(ORDER_COUNT * FAILED_SHARE))
+        measure("first poll (new + retried FAILED)", lambda: legacy_ingest(orders))
+        measure("second poll (all known, dedup only)", lambda: legacy_ingest(orders))
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -41,6 +41,13 @@ class MockResponse:
         if self.status_code != 200:
             raise Exception("HTTP Error")
 
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
 def test_poll_and_process():
     print("--- Starting Integration Test ---")
     
@@ -48,13 +55,13 @@ def test_poll_and_process():
     initial_count = Order.objects.count()
     print(f"Initial Order count: {initial_count}")
     
-    # 1. Mock requests.get inside fetch_pending_orders
-    with patch('requests.get') as mock_get:
-        mock_get.return_value = MockResponse(MOCK_XML_RESPONSE.encode('utf-8'))
+    # 1. Mock the pooled session's get inside fetch_pending_orders
+    with patch('worker.services.matik_api.MatikAPIService.session') as mock_session:
+        mock_session.return_value.get.return_value = MockResponse(MOCK_XML_RESPONSE.encode('utf-8'))
         
-        # 2. Mock process_autonomous_order.delay so it just calls the function synchronously for testing purposes
+        # 2. Mock the grouped dispatch so it just calls the function synchronously for testing purposes
         # but prevents playwright from actually running to save time.
-        with patch('worker.tasks.process_autonomous_order.delay') as mock_process:
+        with patch('worker.tasks.dispatch_autonomous_orders') as mock_process:
             
             print("Running poll_matik_api task...")
             poll_matik_api()
@@ -72,8 +79,8 @@ def test_poll_and_process():
                 
                 print(f"--- Firing Logic for {order.external_ref} ---")
                 
-                # We want to test the logic BEFORE playwright launch. We can mock sync_playwright
-                with patch('worker.tasks.sync_playwright') as mock_playwright:
+                # We want to test the logic BEFORE playwright launch. We can mock the browser pool lease
+                with patch('worker.tasks.browser_pool.lease') as mock_playwright:
                     # Make it raise an exception so it stops right before launching browser,
                     # UNLESS it hits return early (e.g. for WAITING_MANUAL_ACTION)
                     mock_playwright.side_effect = Exception("Browser Launch Prevented")
@@ -52,7 +52,7 @@ class OrderForm(forms.ModelForm):
 class CreditCardForm(forms.ModelForm):
     class Meta:
         model = CreditCard
-        fields = ['alias', 'holder_name', 'card_number', 'exp_month', 'exp_year', 'cvv', 'balance']
+        fields = ['alias', 'holder_name', 'card_number', 'exp_month', 'exp_year', 'cvv', 'balance', 'sms_sender']
         widgets = {
             'alias': forms.TextInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500', 'placeholder': 'Örn: Bonus Kartım'}),
             'holder_name': forms.TextInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500'}),
@@ -61,6 +61,7 @@ class CreditCardForm(forms.ModelForm):
             'exp_year': forms.TextInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500', 'placeholder': 'YYYY', 'maxlength': '4'}),
             'cvv': forms.TextInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500', 'maxlength': '4'}),
             'balance': forms.NumberInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500', 'placeholder': '0.00', 'step': '0.01'}),
+            'sms_sender': forms.TextInput(attrs={'class': 'w-full px-4 py-2 border rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500', 'placeholder': 'Örn: GARANTI'}),
         }
 
     def clean_exp_month(self):
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_order_final_screenshot_order_resolved_package_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditcard',
+            name='sms_sender',
+            field=models.CharField(blank=True, default='', help_text="Sender name of the bank's 3DS SMS (e.g. GARANTI), used to match codes to orders", max_length=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='three_ds_started_at',
+            field=models.DateTimeField(blank=True, help_text='When the robot started waiting for the 3DS SMS', null=True),
+        ),
+        migrations.AddField(
+            model_name='smslog',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='smslog',
+            name='claimed_by',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
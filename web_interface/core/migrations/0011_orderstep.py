@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_callbackoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run', models.PositiveSmallIntegerField(default=1, help_text='Processing attempt of the order the step belongs to')),
+                ('name', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('OK', 'OK'), ('FAILED', 'Failed'), ('SKIPPED', 'Skipped')], max_length=10)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('detail', models.CharField(blank=True, default='', max_length=255)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='core.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['order', 'run'], name='core_orders_order_i_1295a2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_orderstep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditcard',
+            name='use_for_autonomous',
+            field=models.BooleanField(default=False, help_text='Otomatik işlemlerde kart havuzuna dahil (varsayılan kart her zaman dahildir)'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='card_decision',
+            field=models.CharField(blank=True, default='', help_text='Why the card scheduler assigned selected_card', max_length=255),
+        ),
+    ]
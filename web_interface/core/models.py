@@ -34,6 +34,8 @@ class CreditCard(models.Model):
     exp_year = models.CharField(max_length=4)
     cvv = models.CharField(max_length=4)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    sms_sender = models.CharField(max_length=50, blank=True, default='', help_text="Sender name of the bank's 3DS SMS (e.g. GARANTI), used to match codes to orders")
+    use_for_autonomous = models.BooleanField(default=False, help_text="Otomatik işlemlerde kart havuzuna dahil (varsayılan kart her zaman dahildir)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -89,6 +91,8 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     balance_went_negative = models.BooleanField(default=False)
+    three_ds_started_at = models.DateTimeField(null=True, blank=True, help_text="When the robot started waiting for the 3DS SMS")
+    card_decision = models.CharField(max_length=255, blank=True, default='', help_text="Why the card scheduler assigned selected_card")
 
     # Scrape Results
     resolved_package_name = models.CharField(max_length=200, null=True, blank=True, help_text="The exact package name found and clicked by the robot")
@@ -105,6 +109,28 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.id} - {self.phone_number} ({self.status})"
 
+class OrderStep(models.Model):
+    """Outcome and timing of one step of an autonomous order run (navigate ... finalize)."""
+    class Status(models.TextChoices):
+        OK = 'OK', 'OK'
+        FAILED = 'FAILED', 'Failed'
+        SKIPPED = 'SKIPPED', 'Skipped'
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='steps')
+    run = models.PositiveSmallIntegerField(default=1, help_text="Processing attempt of the order the step belongs to")
+    name = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=Status.choices)
+    started_at = models.DateTimeField(default=timezone.now)
+    duration_ms = models.PositiveIntegerField(default=0)
+    detail = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['order', 'run'])]
+
+    def __str__(self):
+        return f"Order {self.order_id} run {self.run}: {self.name} ({self.status})"
+
 class SMSLog(models.Model):
     sender = models.CharField(max_length=50)
     message_content = models.TextField()
@@ -116,6 +142,9 @@ class SMSLog(models.Model):
         blank=True, 
         related_name='sms_logs'
     )
+    # Set once, atomically, by the 3DS session the SMS was matched to
+    claimed_by = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-received_at']
@@ -123,6 +152,40 @@ class SMSLog(models.Model):
     def __str__(self):
         return f"SMS from {self.sender} at {self.received_at}"
 
+class CallbackOutbox(models.Model):
+    """Result callbacks waiting to be delivered to the order's API provider (Matik)."""
+    class State(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        SENDING = 'SENDING', 'Sending'
+        SENT = 'SENT', 'Sent'
+        DEAD = 'DEAD', 'Gave Up'
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='callbacks'
+    )
+    external_ref = models.CharField(max_length=100, db_index=True)
+    result = models.PositiveSmallIntegerField(help_text="durum sent to the API: 1 (Success), 2 (Fail)")
+    state = models.CharField(max_length=20, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set by the dispatcher that is delivering the row
+    claim = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['state', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Callback {self.external_ref} -> {self.result} ({self.state})"
+
 class TestRun(models.Model):
     STATUS_CHOICES = [
         ('RUNNING', 'Running'),
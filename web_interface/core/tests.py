@@ -1,3 +1,159 @@
+import time
+import random
+from unittest import mock
+
+import redis
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from benchmark_package_matching import GOLDEN_CATALOG, GOLDEN_QUERIES, mutate, random_name
+from core.models import CreditCard, Operator, Order, SMSLog, SystemSetting
+from worker.engine.turkcell.matching import PackageMatchIndex
+from worker.engine.turkcell.scraper import ScraperMixin
+from worker.services.card_scheduler import CardScheduler
+from worker.services.sms_correlation import SMSCorrelator, ThreeDSSession, sms_amounts, sms_last4s
+
+
+class SMSParsingTests(TestCase):
+    def test_turkish_amount_formats(self):
+        self.assertEqual(sms_amounts("1.234,56 TL tutarli islem"), [1234.56])
+        self.assertEqual(sms_amounts("tutar: 149,90 TL"), [149.9])
+        self.assertEqual(sms_amounts("tutar: 149.90 TL"), [149.9])
+        self.assertEqual(sms_amounts("1,234.56 TRY"), [1234.56])
+        self.assertEqual(sms_amounts("TL 2.500 harcama"), [2500.0])
+        self.assertEqual(sms_amounts("150₺ odeme"), [150.0])
+        self.assertEqual(sms_amounts("Sifreniz 123456"), [])
+
+    def test_last4_patterns(self):
+        self.assertEqual(sms_last4s("Kartiniz ****1234 ile"), {'1234'})
+        self.assertEqual(sms_last4s("5678 ile biten kartinizla"), {'5678'})
+        self.assertEqual(sms_last4s("kart numarasi sonu 9012 olan"), {'9012'})
+        self.assertEqual(sms_last4s("Sifreniz 123456"), set())
+
+
+class ThreeDSSessionScoreTests(TestCase):
+    def setUp(self):
+        self.now = time.time()
+        self.session = ThreeDSSession('order:1', started_at=self.now, sender='GARANTI', last4='1234', amount=100)
+
+    def test_full_match(self):
+        body = "****1234 kartinizla TURKCELL 100,00 TL islem sifreniz 123456"
+        self.assertEqual(self.session.score('GARANTI BBVA', body, self.now), 12)
+
+    def test_sender_mismatch(self):
+        body = "****1234 kartinizla 100,00 TL islem sifreniz 123456"
+        self.assertIsNone(self.session.score('AKBANK', body, self.now))
+        self.assertIsNone(self.session.score('', body, self.now))
+
+    def test_other_card_or_amount(self):
+        self.assertIsNone(self.session.score('GARANTI', "****9999 kartinizla sifreniz 123456", self.now))
+        self.assertIsNone(self.session.score('GARANTI', "250,00 TL islem sifreniz 123456", self.now))
+
+    def test_sms_older_than_session(self):
+        received_at = self.now - SMSCorrelator.CLOCK_SKEW - 1
+        self.assertIsNone(self.session.score('GARANTI', "sifreniz 123456", received_at))
+
+
+class SMSClaimTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='test')
+        operator = Operator.objects.create(name='Turkcell', slug='turkcell', base_url='https://www.turkcell.com.tr')
+        card = CreditCard.objects.create(
+            user=user, alias='Kart', holder_name='Test', card_number='4000000000001234',
+            exp_month='12', exp_year='2030', cvv='000', sms_sender='GARANTI'
+        )
+        self.orders = [
+            Order.objects.create(operator=operator, phone_number='5550000000', amount=100, selected_card=card)
+            for _ in range(2)
+        ]
+        self.sessions = [
+            ThreeDSSession(f"order:{order.id}", started_at=time.time(), order_id=order.id,
+                           sender='GARANTI', last4='1234', amount=100)
+            for order in self.orders
+        ]
+        self.sms = SMSLog.objects.create(sender='GARANTI', message_content="****1234 100,00 TL sifreniz 123456")
+
+    def test_double_claim(self):
+        # Both sessions fit the SMS, only the first claim wins
+        self.assertTrue(SMSCorrelator.claim(SMSLog.objects.get(id=self.sms.id), self.sessions[0]))
+        self.assertFalse(SMSCorrelator.claim(SMSLog.objects.get(id=self.sms.id), self.sessions[1]))
+
+        self.sms.refresh_from_db()
+        self.assertEqual(self.sms.claimed_by, self.sessions[0].key)
+        self.assertEqual(self.sms.related_order_id, self.orders[0].id)
+        self.assertEqual(SMSCorrelator.claim_from_db(self.sessions[0]).id, self.sms.id)
+        self.assertIsNone(SMSCorrelator.claim_from_db(self.sessions[1]))
+
+    def test_stale_cleanup_without_redis(self):
+        client = mock.Mock()
+        client.hgetall.return_value = {b'order:1': b'not json'}
+        client.hdel.side_effect = redis.ConnectionError()
+        with mock.patch.object(SMSCorrelator, '_client', client):
+            self.assertEqual(SMSCorrelator.open_sessions(), [])
+
+
+class CardPoolPanelTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.other = User.objects.create(username='other')
+        card = dict(holder_name='Test', exp_month='12', exp_year='2030', cvv='000')
+        self.own_card = CreditCard.objects.create(
+            user=self.owner, alias='Benim', card_number='4000000000001111', use_for_autonomous=True, **card
+        )
+        self.other_card = CreditCard.objects.create(
+            user=self.other, alias='Onun', card_number='4000000000002222', use_for_autonomous=True, **card
+        )
+        self.default_card = CreditCard.objects.create(user=self.other, alias='Varsayilan', card_number='4000000000003333', **card)
+        CreditCard.objects.create(user=self.owner, alias='Disarida', card_number='4000000000004444', **card)
+        settings = SystemSetting.get_settings()
+        settings.default_card = self.default_card
+        settings.save()
+
+    def test_panel_lists_the_scheduler_pool(self):
+        cards, _ = CardScheduler.pool()
+        rows = CardScheduler.throughput(user=self.owner)
+        self.assertEqual([row['card'].id for row in rows], [card.id for card in cards])
+        self.assertEqual(
+            {row['card'].id: row['own'] for row in rows},
+            {self.own_card.id: True, self.other_card.id: False, self.default_card.id: False}
+        )
+
+    def test_other_users_cards_are_masked(self):
+        self.client.force_login(self.owner)
+        html = self.client.get('/auto-orders/').content.decode()
+        self.assertIn('Benim (1111)', html)
+        self.assertNotIn('Onun', html)
+        self.assertNotIn('2222', html)
+        self.assertNotIn('3333', html)
+        self.assertEqual(html.count('Başka kullanıcının kartı'), 2)
+
+
+class PackageMatchIndexParityTests(TestCase):
+    """PackageMatchIndex must pick exactly what the select_package scorer loop picks."""
+
+    def assert_parity(self, names, query_sets):
+        scorer = ScraperMixin()
+        index = PackageMatchIndex(names)
+        for search_texts in query_sets:
+            # The select_package loop: first card with the strictly best score wins
+            expected = (0.0, None)
+            for i, name in enumerate(names):
+                for text in search_texts:
+                    score = scorer._match_package_score(text, name)
+                    if score > expected[0]:
+                        expected = (score, i)
+            self.assertEqual(index.best(search_texts), expected, search_texts)
+            for text in search_texts:
+                for i, name in enumerate(names):
+                    self.assertEqual(index.score(text, i), scorer._match_package_score(text, name), (text, name))
+
+    def test_golden_set(self):
+        query_sets = [[q] for q in GOLDEN_QUERIES] + [[a, b] for a, b in zip(GOLDEN_QUERIES, GOLDEN_QUERIES[1:])]
+        self.assert_parity(GOLDEN_CATALOG, query_sets)
+
+    def test_random_catalog(self):
+        rng = random.Random(42)
+        names = [random_name(rng) for _ in range(100)]
+        query_sets = [[mutate(rng, rng.choice(names))] for _ in range(30)]
+        query_sets += [[mutate(rng, rng.choice(names)), random_name(rng)] for _ in range(10)]
+        self.assert_parity(names, query_sets)
@@ -203,26 +203,25 @@ def sms_webhook(request):
         match = re.search(r'\b\d{6}\b', body)
         code = match.group(0) if match else None
 
-        # Find the most recent PENDING or 3DS_WAITING order for this operator?
-        # Ideally, the SMS body might contain order ID, but usually it doesn't.
-        # We'll link it to the most recent '3DS_WAITING' order created in the last 5 minutes.
-        # For simplicity in this demo, we just save the log. The Worker poll will find it.
-        
-        # Link logic updates: find latest order in 3DS_WAITING state
-        # This is a heuristic.
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        recent_order = Order.objects.filter(
-            status='3DS_WAITING', 
-            updated_at__gte=timezone.now() - timedelta(minutes=5)
-        ).first()
-
-        SMSLog.objects.create(
+        sms_log = SMSLog.objects.create(
             sender=sender,
             message_content=body,
-            related_order=recent_order 
         )
+
+        # Give the SMS to the 3DS session it belongs to (bank sender, card digits,
+        # amount, start time) and push the code to it; unmatched codes go to the
+        # shared channel where waiting sessions may claim them
+        if code:
+            from worker.services.sms_bus import SMSBus
+            from worker.services.sms_correlation import SMSCorrelator
+            session = SMSCorrelator.assign(sms_log)
+            receivers = SMSBus.publish(
+                code, sender, body,
+                order_id=session.order_id if session else None,
+                sms_id=sms_log.id,
+                session_key=session.key if session else None
+            )
+            logger.info(f"SMS code pushed to {receivers} waiting session(s).")
         
         logger.info(f"SMS received from {sender}: {code}")
         return JsonResponse({'status': 'success', 'code': code})
@@ -429,11 +428,21 @@ def check_transaction_status_api(request, task_id):
     }
     
     if status == "WAITING_SELECTION":
-        # Fetch fresh packages
+        # Serve the shared catalog cache (instant), fall back to the Package table
         try:
-            turkcell = Operator.objects.get(name__icontains='Turkcell')
-            packages = Package.objects.filter(operator=turkcell).values('id', 'name', 'price', 'category', 'package_id')
-            pack_list = list(packages)
+            from worker.services.catalog import PackageCatalogService, TL_CATEGORY
+            transaction_type = r.get(f"transaction:{task_id}:type")
+            transaction_type = transaction_type.decode('utf-8') if transaction_type else "Package"
+
+            pack_list = PackageCatalogService.packages('turkcell', transaction_type)
+            if not pack_list:
+                turkcell = Operator.objects.get(name__icontains='Turkcell')
+                packages = Package.objects.filter(operator=turkcell)
+                if transaction_type == "TL":
+                    packages = packages.filter(category=TL_CATEGORY)
+                else:
+                    packages = packages.exclude(category=TL_CATEGORY)
+                pack_list = list(packages.values('id', 'name', 'price', 'category', 'package_id'))
             print(f"DEBUG API: Found {len(pack_list)} packages for Turkcell") # DEBUG LOG
             response['packages'] = pack_list
         except Exception as e:
@@ -533,11 +542,12 @@ def bulk_orders(request):
 def auto_orders(request):
     """View to list orders handled by the autonomous API integration."""
     from core.models import SystemSetting, CreditCard
+    from worker.services.card_scheduler import CardScheduler
     
     settings = SystemSetting.get_settings()
     cards = CreditCard.objects.filter(user=request.user)
     
-    orders_query = Order.objects.filter(api_source='MATIK').order_by('-created_at')
+    orders_query = Order.objects.filter(api_source='MATIK').order_by('-created_at').select_related('selected_card').prefetch_related('steps')
     
     # Filter by status if provided
     status_filter = request.GET.get('status')
@@ -552,7 +562,9 @@ def auto_orders(request):
         'orders': orders,
         'status_filter': status_filter,
         'system_settings': settings,
-        'cards': cards
+        'cards': cards,
+        # Cards the scheduler spreads orders over, with their load and throughput (other users' cards masked)
+        'card_pool': CardScheduler.throughput(user=request.user),
     }
     return render(request, 'core/auto_orders.html', context)
 
@@ -565,6 +577,7 @@ def update_system_settings(request):
         data = json.loads(request.body)
         is_active = data.get('is_autonomous_active')
         default_card_id = data.get('default_card_id')
+        pool_card_id = data.get('pool_card_id')
         
         settings = SystemSetting.get_settings()
         
@@ -577,6 +590,12 @@ def update_system_settings(request):
             else:
                 card = CreditCard.objects.get(id=default_card_id, user=request.user)
                 settings.default_card = card
+
+        if pool_card_id is not None:
+            # Card pool membership for the card scheduler
+            card = CreditCard.objects.get(id=pool_card_id, user=request.user)
+            card.use_for_autonomous = bool(data.get('use_for_autonomous'))
+            card.save(update_fields=['use_for_autonomous'])
                 
         settings.save()
         return JsonResponse({'status': 'success', 'is_active': settings.is_autonomous_active, 'default_card_id': settings.default_card.id if settings.default_card else None})
@@ -624,8 +643,8 @@ def define_package(request):
         order.log_message = "Küpür tanımlandı, yeniden deneniyor."
         order.save()
         
-        from worker.tasks import process_autonomous_order
-        process_autonomous_order.delay(order.id)
+        from worker.tasks import dispatch_autonomous_orders
+        dispatch_autonomous_orders([order.id])
         
         return redirect('auto_orders')
 
@@ -655,9 +674,9 @@ def cancel_order(request):
         order.log_message = "Kullanıcı tarafından iptal edildi."
         order.save()
         
-        # Send callback to the API provider so they know it's cancelled
-        from worker.services.matik_api import MatikAPIService
-        MatikAPIService.send_callback(order.external_ref, 2)
+        # Queue the callback to the API provider so they know it's cancelled
+        from worker.services.callback_outbox import CallbackOutboxService
+        CallbackOutboxService.enqueue(order.external_ref, 2, order.id)
         
         return redirect('auto_orders')
 
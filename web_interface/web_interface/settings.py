@@ -176,11 +176,43 @@ LOGGING = {
     },
 }
 
+# Worker processes launch Chromium and pre-navigate standby pages at boot,
+# which takes longer than Celery's default 4s process startup timeout.
+CELERY_WORKER_PROC_ALIVE_TIMEOUT = 60
+
+# Queues (each served by its own compose service):
+# - browser: Playwright flows, one task per slot. Not acks_late: a payment must never run twice.
+# - io: Matik polling and callbacks, short and idempotent (acks_late on the tasks).
+# - catalog: background Package table syncs after a scrape.
+# Polling and callbacks never wait behind multi-minute browser flows.
+CELERY_TASK_DEFAULT_QUEUE = 'browser'
+CELERY_TASK_ROUTES = {
+    'worker.tasks.process_autonomous_order': {'queue': 'browser'},
+    'worker.tasks.start_interactive_flow': {'queue': 'browser'},
+    'worker.tasks.run_test_flow': {'queue': 'browser'},
+    'worker.tasks.refresh_standby_pages': {'queue': 'browser'},
+    'worker.tasks.poll_matik_api': {'queue': 'io'},
+    'worker.tasks.dispatch_callbacks': {'queue': 'io'},
+    'worker.tasks.sync_package_catalog': {'queue': 'catalog'},
+}
+
 # Celery Beat Schedule - Periodic Tasks
 CELERY_BEAT_SCHEDULE = {
-    'poll-matik-api-every-30s': {
+    'poll-matik-api': {
         'task': 'worker.tasks.poll_matik_api',
-        'schedule': 30.0,  # Every 30 seconds
+        # Only a tick: the adaptive interval (MATIK_POLL_MIN/MAX_INTERVAL) decides when Matik is polled
+        'schedule': float(os.getenv('MATIK_POLL_TICK', '2')),
+        'options': {'expires': float(os.getenv('MATIK_POLL_TICK', '2'))},  # a late tick is useless
+    },
+    'dispatch-callbacks-every-15s': {
+        'task': 'worker.tasks.dispatch_callbacks',
+        'schedule': 15.0,  # Retries and anything a missed trigger left behind
+    },
+    'refresh-standby-pages': {
+        'task': 'worker.tasks.refresh_standby_pages',
+        # Each tick refreshes one idle browser process; pages are replaced at 80% of BROWSER_POOL_STANDBY_MAX_AGE
+        'schedule': float(os.getenv('BROWSER_POOL_STANDBY_REFRESH', '60')),
+        'options': {'expires': float(os.getenv('BROWSER_POOL_STANDBY_REFRESH', '60'))},  # no backlog while all slots are busy
     },
 }
 
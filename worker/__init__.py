@@ -0,0 +1,5 @@
+# Load the Celery app whenever the worker package is imported (also from the web
+# process), so shared_task uses its config and CELERY_TASK_ROUTES apply everywhere
+from .celery_app import app as celery_app
+
+__all__ = ('celery_app',)
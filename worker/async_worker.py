@@ -0,0 +1,264 @@
+"""
+Async order worker: autonomous orders as coroutines of one process, sharing
+one Chromium (AsyncBrowserPool) and driven by AsyncTurkcellOperator.
+
+    python -m worker.async_worker
+
+Orders reach it through AsyncOrderQueue when ORDER_ENGINE=async. Up to
+ASYNC_MAX_ORDERS run at once, at most ASYNC_MAX_PER_OPERATOR per operator
+and ASYNC_MAX_PER_CARD per card in payment/3DS. The order is settled by
+AutonomousOrderService, exactly as process_autonomous_order does.
+"""
+import os
+import time
+import signal
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from .engine.async_pool import AsyncBrowserPool
+from .engine.turkcell.aio import AsyncTurkcellOperator
+from .services.catalog import PackageCatalogService
+from .services.order_flow import AutonomousOrderService
+from .services.order_pipeline import OrderPipeline
+from .services.order_queue import AsyncOrderQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimits:
+    """One semaphore of the same size per key (card id, operator slug), created on first use."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._semaphores = {}
+
+    def __call__(self, key) -> asyncio.Semaphore:
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.size)
+        return self._semaphores[key]
+
+    def in_use(self) -> dict:
+        return {key: self.size - sem._value for key, sem in self._semaphores.items() if sem._value < self.size}
+
+
+class AsyncOrderWorker:
+    MAX_ORDERS = int(os.getenv('ASYNC_MAX_ORDERS', '24'))
+    MAX_PER_OPERATOR = int(os.getenv('ASYNC_MAX_PER_OPERATOR', '16'))
+    # Payments on one card wait for SMS from the same bank; the correlator tells
+    # them apart, but the bank may rate limit 3DS on a single card
+    MAX_PER_CARD = int(os.getenv('ASYNC_MAX_PER_CARD', '2'))
+
+    def __init__(self):
+        self.pool = AsyncBrowserPool()
+        self.slots = asyncio.Semaphore(self.MAX_ORDERS)
+        self.operator_limits = ConcurrencyLimits(self.MAX_PER_OPERATOR)
+        self.card_limits = ConcurrencyLimits(self.MAX_PER_CARD)
+        self.stopping = asyncio.Event()
+        self.running = set()
+        self.stats = {'orders': 0, 'errors': 0}
+
+    def stop(self):
+        if not self.stopping.is_set():
+            logger.info(f"Async worker: stopping, {len(self.running)} orders still running.")
+            self.stopping.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # Captcha answers, SMS waits and ORM calls of every running order use threads
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.MAX_ORDERS * 2 + 4, thread_name_prefix='async-order'))
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        try:
+            await self.pool.start()
+        except Exception as e:
+            # Not fatal: the first lease launches it
+            logger.warning(f"Async worker: browser could not start at boot: {e}")
+
+        client = AsyncOrderQueue.async_client()
+        logger.info(
+            f"Async worker ready: {self.MAX_ORDERS} orders at once, {self.MAX_PER_OPERATOR} per operator, "
+            f"{self.MAX_PER_CARD} per card in payment."
+        )
+        while not self.stopping.is_set():
+            await self.slots.acquire()
+            if self.stopping.is_set():
+                self.slots.release()
+                break
+            try:
+                order_id = await AsyncOrderQueue.pop(client)
+            except Exception as e:
+                self.slots.release()
+                logger.warning(f"Async worker: order queue unavailable: {e}")
+                await asyncio.sleep(5)
+                continue
+            if order_id is None:
+                self.slots.release()
+                continue
+
+            task = asyncio.create_task(self._run_slot(order_id))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+        # Orders already paying must finish: they cannot be retried safely
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+        await client.aclose()
+        logger.info(f"Async worker stopped: {self.stats}, browser {self.pool.summary()}")
+        await self.pool.stop()
+
+    async def _run_slot(self, order_id):
+        try:
+            await self.run_order(order_id)
+        finally:
+            self.slots.release()
+            self.stats['orders'] += 1
+            logger.info(
+                f"Async worker: {len(self.running) - 1} orders in flight, cards in payment "
+                f"{self.card_limits.in_use()}, browser {self.pool.summary()}"
+            )
+
+    async def run_order(self, order_id):
+        started = time.perf_counter()
+        try:
+            order = await sync_to_async(AutonomousOrderService.start)(order_id)
+            plan = await sync_to_async(AutonomousOrderService.plan)(order)
+            if not plan:
+                return
+            card = await sync_to_async(AutonomousOrderService.assign_card)(order, plan)
+            if not card:
+                return
+            async with self.operator_limits('turkcell'):
+                await self._browser_flow(order, card, plan, started)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Autonomous Processing Error: {e}\n{traceback.format_exc()}")
+            await sync_to_async(AutonomousOrderService.fail_by_id)(order_id, str(e))
+
+    @staticmethod
+    def _refresh_catalog(upload_type, scraped_data):
+        from core.models import Operator
+
+        try:
+            turkcell = Operator.objects.filter(name__icontains='Turkcell').first()
+            PackageCatalogService.refresh_in_background(turkcell, 'turkcell', upload_type, scraped_data)
+        except Exception as catalog_err:
+            logger.warning(f"Failed to refresh package catalog: {catalog_err}")
+
+    async def _browser_flow(self, order, card, plan, started):
+        pipeline = await sync_to_async(OrderPipeline)(order, plan['upload_type'])
+        async with self.pool.lease(
+            state_key='turkcell', resume=pipeline.session_key if pipeline.checkpoint else None
+        ) as lease:
+            operator = await AsyncTurkcellOperator.create(lease.page, card, label=f"order_{order.id}")
+            try:
+                await self._order_steps(order, card, plan, pipeline, lease, operator, started)
+            finally:
+                # A session stopped at a checkpoint stays open for the retry of the order
+                if pipeline.park_at:
+                    lease.park(pipeline.session_key)
+                operator.cleanup_debug_output()
+
+    async def _order_steps(self, order, card, plan, pipeline, lease, operator, started):
+        service = AutonomousOrderService
+        pending = sync_to_async(pipeline.pending)
+
+        if lease.resumed and await operator.can_resume_at(pipeline.checkpoint):
+            pipeline.resume()
+        if await pending('navigate'):
+            async with pipeline.astep('navigate'):
+                await operator.navigate_to_base_url()
+                await operator.select_upload_type(plan['upload_type'])
+
+        if await pending('phone'):
+            async with pipeline.astep('phone'):
+                await operator.fill_phone(order.phone_number)
+
+        async def captcha_callback(msg):
+            if msg == "CAPTCHA_PHASE_2":
+                logger.info(f"Order {order.id}: Moving to Captcha Phase 2 (2. defa deneniyor)")
+                order.log_message = "2. defa captcha deneniyor"
+                await sync_to_async(order.save)()
+
+        if await pending('captcha'):
+            async with pipeline.astep('captcha') as step:
+                if not await operator.solve_captcha(log_callback=captcha_callback):
+                    step.fail(str(operator.captcha_summary()))
+            if step.failed:
+                logger.error(f"Captcha failed for order {order.id}")
+                await sync_to_async(service.fail)(order, "Captcha Failed")
+                return
+
+        if await pending('catalog'):
+            if await sync_to_async(PackageCatalogService.get)('turkcell', plan['upload_type']):
+                await sync_to_async(pipeline.skip)('catalog', 'cached catalog')
+            else:
+                async with pipeline.astep('catalog'):
+                    scraped_data = await operator.scrape_packages(is_tl=plan['is_tl'])
+                    await sync_to_async(self._refresh_catalog)(plan['upload_type'], scraped_data)
+
+        if await pending('select'):
+            async with pipeline.astep('select') as step:
+                selection_success = False
+                if plan['is_tl'] and plan['amount']:
+                    selection_success = await operator.select_package(amount=plan['amount'])
+                elif plan['package_id'] or plan['fallback_name']:
+                    selection_success = await operator.select_package(
+                        package_id=plan['package_id'], fallback_name=plan['fallback_name'],
+                        preferred_category=plan['preferred_category']
+                    )
+                if not selection_success:
+                    step.fail(f"no match for {plan['kontor']}")
+            if step.failed:
+                await sync_to_async(service.selection_failed)(order, plan)
+                return
+            await sync_to_async(service.selected)(order, plan, operator.last_selected_name, operator.last_selected_price)
+
+        async with self.card_limits(card.id):
+            async with pipeline.astep('pay') as step:
+                if not await operator.process_payment():
+                    step.fail("payment form not submitted")
+            if step.failed:
+                logger.error("Payment processing failed")
+                await sync_to_async(service.fail)(order)
+                return
+            await sync_to_async(service.waiting_3ds)(order)
+            async with pipeline.astep('3ds') as step:
+                success, message = await operator.handle_3d_secure(
+                    log_callback=lambda msg: logger.info(f"Order {order.id}: {msg}"),
+                    order_id=order.id,
+                    amount=order.amount
+                )
+                if not success:
+                    step.fail(message)
+
+        async with pipeline.astep('finalize'):
+            await sync_to_async(service.finish)(order, card, success, message)
+            try:
+                await operator.take_screenshot("final")
+                await sync_to_async(service.attach_screenshot)(order, operator.screenshot_path("final"))
+            except Exception as ss_err:
+                logger.error(f"Failed to capture final screenshot: {ss_err}")
+
+        logger.info(f"Order {order.id}: {operator.routing_summary()}")
+        logger.info(f"Order {order.id}: {operator.wait_summary()}")
+        logger.info(f"Order {order.id}: {operator.phase_summary()}")
+        logger.info(f"Order {order.id}: {operator.captcha_summary()}")
+        logger.info(f"Order {order.id}: {pipeline.summary()}")
+        logger.info(f"Order {order.id}: processing {(time.perf_counter() - started) * 1000:.0f} ms (async worker, Matik callback queued)")
+
+
+def main():
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        format='[%(asctime)s: %(levelname)s/%(name)s] %(message)s'
+    )
+    asyncio.run(AsyncOrderWorker().run())
+
+
+if __name__ == '__main__':
+    main()
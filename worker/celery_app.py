@@ -1,6 +1,8 @@
 import os
+import logging
 import django
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 # We need to make sure the worker can find the implementation
@@ -11,6 +13,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../web_interface'))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_interface.settings')
 django.setup()
 
+logger = logging.getLogger(__name__)
+
 app = Celery('worker')
 
 # Using a string here means the worker doesn't have to serialize
@@ -22,6 +26,29 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+@worker_process_init.connect
+def start_browser_pool(**kwargs):
+    """Launch Chromium once per worker process instead of once per task."""
+    # Workers without browser tasks (callbacks) skip it
+    if os.getenv('BROWSER_POOL', 'True') != 'True':
+        return
+    from worker.engine.browser_pool import browser_pool
+    import worker.tasks  # registers operators and their standby page preparers
+    try:
+        browser_pool.start()
+        browser_pool.fill_standby()
+    except Exception as e:
+        # Not fatal: the first task will launch it lazily
+        logger.warning(f"Browser pool could not start at boot: {e}")
+
+@worker_process_shutdown.connect
+def stop_browser_pool(**kwargs):
+    if os.getenv('BROWSER_POOL', 'True') != 'True':
+        return
+    from worker.engine.browser_pool import browser_pool
+    logger.info(f"Browser pool stats: {browser_pool.summary()}")
+    browser_pool.stop()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
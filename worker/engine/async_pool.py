@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from . import storage_state
+from .browser_pool import BrowserLease, StandbyPage, LAUNCH_ARGS, _process_tree_rss_mb
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBrowserPool:
+    """
+    One Chromium shared by every order coroutine of the async worker.
+
+    Like BrowserPool, each order leases its own BrowserContext (seeded with
+    the persisted consent state) and the browser is recycled after
+    max_orders leases or past max_memory_mb. A recycle waits until the
+    contexts still in use are released; new leases wait for the relaunch.
+    There are no standby pages: the worker keeps many orders in flight
+    instead. Sessions parked by an order that stopped at a checkpoint are
+    kept (park_size, park_max_age) for lease(resume=key), as in BrowserPool.
+    """
+
+    def __init__(self, max_orders: int = None, max_memory_mb: int = None, headless: bool = True):
+        self.max_orders = max_orders or int(os.getenv('ASYNC_BROWSER_MAX_ORDERS', '200'))
+        self.max_memory_mb = max_memory_mb or int(os.getenv('ASYNC_BROWSER_MAX_MEMORY_MB', '4000'))
+        self.park_size = int(os.getenv('ASYNC_BROWSER_PARKED_PAGES', '8'))
+        self.park_max_age = int(os.getenv('BROWSER_POOL_PARK_MAX_AGE', '300'))
+        self.headless = headless
+
+        self._playwright = None
+        self._browser = None
+        self._orders_served = 0
+        self._active = 0
+        # Reason of a pending recycle; set while the browser drains
+        self._draining = None
+        self._condition = asyncio.Condition()
+        # key -> StandbyPage, oldest first
+        self._parked = {}
+
+        self.stats = {
+            'launches': 0,
+            'recycles': 0,
+            'leases': 0,
+            'peak_active': 0,
+            'parked': 0,
+            'resumed': 0,
+            'total_launch_ms': 0.0,
+            'total_lease_ms': 0.0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def start(self):
+        async with self._condition:
+            if not self.is_running:
+                await self._launch()
+
+    async def stop(self):
+        for key in list(self._parked):
+            await self._drop_parked(key)
+        try:
+            if self._browser:
+                await self._browser.close()
+        except Exception as e:
+            logger.warning(f"Async browser pool: error while closing browser: {e}")
+        try:
+            if self._playwright:
+                await self._playwright.stop()
+        except Exception as e:
+            logger.warning(f"Async browser pool: error while stopping playwright: {e}")
+        self._browser = None
+        self._playwright = None
+        self._orders_served = 0
+
+    async def _launch(self):
+        started = time.perf_counter()
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+        self._orders_served = 0
+
+        launch_ms = (time.perf_counter() - started) * 1000
+        self.stats['launches'] += 1
+        self.stats['total_launch_ms'] += launch_ms
+        logger.info(f"Async browser pool: Chromium launched in {launch_ms:.0f} ms (pid {os.getpid()}).")
+
+    def _recycle_reason(self):
+        if self._orders_served >= self.max_orders:
+            return f"served {self._orders_served} orders"
+        rss_mb = _process_tree_rss_mb(os.getpid())
+        if rss_mb >= self.max_memory_mb:
+            return f"memory {rss_mb:.0f} MB >= {self.max_memory_mb} MB"
+        return None
+
+    async def _new_context(self, state_key: str = None, **context_options):
+        if state_key and 'storage_state' not in context_options:
+            path = storage_state.load_state(state_key)
+            if path:
+                context_options['storage_state'] = path
+        try:
+            return await self._browser.new_context(**context_options)
+        except Exception as e:
+            if 'storage_state' not in context_options:
+                raise
+            logger.warning(f"Async browser pool: storage state for '{state_key}' unusable ({e}), discarding.")
+            storage_state.invalidate(state_key)
+            context_options.pop('storage_state')
+            return await self._browser.new_context(**context_options)
+
+    async def _drop_parked(self, key):
+        slot = self._parked.pop(key, None)
+        if slot is None:
+            return
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    async def _park(self, key, lease) -> bool:
+        for parked_key, slot in list(self._parked.items()):
+            if slot.age > self.park_max_age or slot.page.is_closed():
+                await self._drop_parked(parked_key)
+        if self.park_size <= 0 or self._draining or time.time() - lease.opened_at > self.park_max_age:
+            return False
+        while len(self._parked) >= self.park_size:
+            await self._drop_parked(next(iter(self._parked)))
+        self._parked[key] = StandbyPage(lease.context, lease.page, prepared_at=lease.opened_at)
+        self.stats['parked'] += 1
+        logger.info(f"Async browser pool: session {key} parked ({len(self._parked)} parked).")
+        return True
+
+    async def _take_parked(self, key):
+        slot = self._parked.get(key)
+        if slot is None:
+            return None
+        if slot.age > self.park_max_age or slot.page.is_closed():
+            await self._drop_parked(key)
+            return None
+        self.stats['resumed'] += 1
+        return self._parked.pop(key)
+
+    async def _acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._draining is None)
+            if not self.is_running:
+                if self._browser is not None:
+                    logger.warning("Async browser pool: browser disconnected, relaunching.")
+                    await self.stop()
+                await self._launch()
+            self._active += 1
+            self.stats['peak_active'] = max(self.stats['peak_active'], self._active)
+
+    async def _release(self):
+        async with self._condition:
+            self._active -= 1
+            self._orders_served += 1
+            if self._draining is None:
+                self._draining = self._recycle_reason()
+                if self._draining and self._active:
+                    logger.info(f"Async browser pool: recycle pending ({self._draining}), draining {self._active} orders.")
+            if self._draining and not self._active:
+                logger.info(f"Async browser pool: recycling browser ({self._draining}).")
+                self.stats['recycles'] += 1
+                await self.stop()
+                self._draining = None
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def lease(self, state_key: str = None, resume=None, **context_options):
+        """
+        Yields a BrowserLease with a fresh context and page of the shared browser,
+        or the session parked under resume (lease.resumed) when there is one.
+        """
+        started = time.perf_counter()
+        await self._acquire()
+        context = None
+        lease = None
+        try:
+            parked = await self._take_parked(resume) if resume is not None else None
+            if parked:
+                context = parked.context
+                lease = BrowserLease(context, parked.page, warm=True, resumed=True, opened_at=parked.prepared_at)
+            else:
+                context = await self._new_context(state_key, **context_options)
+                lease = BrowserLease(context, await context.new_page())
+            lease_ms = (time.perf_counter() - started) * 1000
+            self.stats['leases'] += 1
+            self.stats['total_lease_ms'] += lease_ms
+            logger.info(
+                f"Async browser pool: {'parked session' if parked else 'context'} leased in {lease_ms:.0f} ms "
+                f"({self._active} in use)."
+            )
+            yield lease
+        finally:
+            if lease is not None and lease.park_key is not None:
+                try:
+                    if await self._park(lease.park_key, lease):
+                        context = None
+                except Exception as e:
+                    logger.warning(f"Async browser pool: could not park session {lease.park_key}: {e}")
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Async browser pool: error while closing context: {e}")
+            await self._release()
+
+    def summary(self) -> dict:
+        launches = self.stats['launches'] or 1
+        leases = self.stats['leases'] or 1
+        return {
+            'launches': self.stats['launches'],
+            'recycles': self.stats['recycles'],
+            'leases': self.stats['leases'],
+            'active': self._active,
+            'peak_active': self.stats['peak_active'],
+            'parked': len(self._parked),
+            'resumed': self.stats['resumed'],
+            'avg_launch_ms': round(self.stats['total_launch_ms'] / launches, 1),
+            'avg_lease_ms': round(self.stats['total_lease_ms'] / leases, 1),
+        }
@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+import re
 from core.models import CreditCard
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +12,62 @@ class BaseOperator(ABC):
     """
     Abstract Base Class for all Operator implementations using Playwright.
     """
+
+    # Request routing profile applied with page.route().
+    # Requests to a tracker domain are aborted, and so are requests of a
+    # blocked resource type to the operator's own hosts (type_block_domains),
+    # unless their host is in allow_domains or their URL contains one of
+    # allow_url_patterns. Other hosts, e.g. the bank's 3DS (ACS) page, are
+    # never blocked by type: some render the OTP screen with images/fonts.
+    # Documents, scripts, XHR and stylesheets are never blocked by type.
+    #
+    # Only matching URLs are routed (route_pattern): tracker hosts, and the
+    # operator's own static files by extension. With the sync API a routed
+    # request waits until the next Playwright call dispatches its handler,
+    # so requests routed during time.sleep() or an SMS wait are held until
+    # then; this keeps the page's XHRs, documents and the ACS page off the
+    # route. Operators extend this with their own hosts and allowlists.
+    ROUTING_PROFILE = {
+        'block_resource_types': ['image', 'media', 'font'],
+        'type_block_domains': [],
+        'block_extensions': [
+            'png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico',
+            'woff', 'woff2', 'ttf', 'otf', 'eot', 'mp4', 'webm', 'mp3',
+        ],
+        'block_domains': [
+            'google-analytics.com',
+            'googletagmanager.com',
+            'googleadservices.com',
+            'googlesyndication.com',
+            'doubleclick.net',
+            'facebook.net',
+            'facebook.com',
+            'hotjar.com',
+            'clarity.ms',
+            'bat.bing.com',
+            'criteo.com',
+            'criteo.net',
+            'yandex.ru',
+            'adform.net',
+            'ads-twitter.com',
+            'analytics.twitter.com',
+            'ads.linkedin.com',
+            'analytics.tiktok.com',
+            'useinsider.com',
+            'api.useinsider.com',
+            'nr-data.net',
+            'newrelic.com',
+            'demdex.net',
+            'omtrdc.net',
+            'appsflyer.com',
+            'adjust.com',
+            'onesignal.com',
+            'segment.io',
+            'optimizely.com',
+        ],
+        'allow_domains': [],
+        'allow_url_patterns': [],
+    }
     
     def __init__(self, page, card: Optional[CreditCard] = None):
         """
@@ -17,6 +76,9 @@ class BaseOperator(ABC):
         self.page = page
         self.card = card
         self.maps = self.Maps
+        self.route_stats = {'allowed': 0, 'blocked': 0, 'blocked_by_reason': {}}
+        if os.getenv('BLOCK_NONESSENTIAL_REQUESTS', 'True') == 'True':
+            self.apply_routing_profile()
 
     @property
     @abstractmethod
@@ -71,6 +133,101 @@ class BaseOperator(ABC):
         """
         pass
 
+    @classmethod
+    def route_pattern(cls):
+        """
+        Regex of the URLs the routing profile may block, matched by the
+        Playwright driver: only these requests reach _route_request.
+        """
+        profile = cls.ROUTING_PROFILE
+
+        def hosts(domains):
+            return '|'.join(re.escape(d) for d in domains)
+
+        alternatives = []
+        if profile.get('block_domains'):
+            alternatives.append(rf"^[a-z]+://([^/?#]*\.)?({hosts(profile['block_domains'])})(:\d+)?([/?#]|$)")
+        if profile.get('type_block_domains') and profile.get('block_extensions'):
+            extensions = '|'.join(re.escape(e) for e in profile['block_extensions'])
+            alternatives.append(
+                rf"^[a-z]+://([^/?#]*\.)?({hosts(profile['type_block_domains'])})(:\d+)?/[^?#]*\.({extensions})([?#]|$)"
+            )
+        if not alternatives:
+            return None
+        return re.compile('|'.join(f"({a})" for a in alternatives), re.IGNORECASE)
+
+    def apply_routing_profile(self):
+        """
+        Installs the routing profile on the page. Any handler a previous
+        operator put on the same page (standby pages) is replaced, so the
+        counters always belong to this operator/order.
+        """
+        pattern = self.route_pattern()
+        if pattern is None:
+            return
+        try:
+            self.page.unroute(pattern)
+            self.page.route(pattern, self._route_request)
+        except Exception as e:
+            logger.warning(f"Could not apply routing profile: {e}")
+
+    def _block_reason(self, url: str, resource_type: str) -> Optional[str]:
+        """Returns why a request should be blocked, or None to let it through."""
+        profile = self.ROUTING_PROFILE
+        host = (urlparse(url).hostname or '').lower()
+
+        def on(domains):
+            return any(host == d or host.endswith('.' + d) for d in domains)
+
+        if on(profile.get('allow_domains', [])):
+            return None
+        if any(p in url for p in profile.get('allow_url_patterns', [])):
+            return None
+
+        if on(profile.get('block_domains', [])):
+            return f"domain:{host}"
+        if resource_type in profile.get('block_resource_types', []) and on(profile.get('type_block_domains', [])):
+            return f"type:{resource_type}"
+        return None
+
+    def _route_request(self, route):
+        request = route.request
+        reason = self._block_reason(request.url, request.resource_type)
+        self._count_route(reason)
+        try:
+            if reason:
+                route.abort()
+            else:
+                route.continue_()
+        except Exception:
+            # Page/context closed while the request was in flight
+            pass
+
+    def _count_route(self, reason: Optional[str]):
+        if reason:
+            self.route_stats['blocked'] += 1
+            by_reason = self.route_stats['blocked_by_reason']
+            by_reason[reason] = by_reason.get(reason, 0) + 1
+        else:
+            self.route_stats['allowed'] += 1
+
+    def routing_summary(self) -> str:
+        """One-line summary of blocked vs allowed requests for this order."""
+        stats = self.route_stats
+        total = stats['allowed'] + stats['blocked']
+        top = sorted(stats['blocked_by_reason'].items(), key=lambda kv: kv[1], reverse=True)[:5]
+        top_str = ", ".join(f"{k}={v}" for k, v in top)
+        pct = (stats['blocked'] * 100 / total) if total else 0
+        return f"Requests: {total} total, {stats['allowed']} allowed, {stats['blocked']} blocked ({pct:.0f}%) [{top_str}]"
+
+    def prepare_standby(self, upload_type: str) -> bool:
+        """
+        Optional: bring a fresh page to the point where fill_phone can start,
+        so the browser pool can keep it as a hot standby page.
+        Return False if the operator does not support standby pages.
+        """
+        return False
+
     def take_screenshot(self, name: str):
         """
         Helper to take screenshots for debugging/logging.
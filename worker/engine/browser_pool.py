@@ -0,0 +1,478 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from playwright.sync_api import sync_playwright
+from . import storage_state
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_ARGS = ['--no-sandbox', '--disable-dev-shm-usage']
+
+
+def _process_tree_rss_mb(root_pid: int) -> float:
+    """
+    Sums the resident memory (MB) of root_pid and all of its descendants.
+    Chromium and the Playwright driver run as children of the worker process,
+    so this is the memory the pool is responsible for. Linux only (/proc).
+    """
+    children = {}
+    rss_pages = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    stat = f.read()
+                # comm may contain spaces, fields after the closing paren are fixed
+                fields = stat[stat.rfind(')') + 2:].split()
+                pid = int(entry)
+                ppid = int(fields[1])
+                children.setdefault(ppid, []).append(pid)
+                rss_pages[pid] = int(fields[21])
+            except (OSError, ValueError, IndexError):
+                continue
+    except OSError:
+        return 0.0
+
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class BrowserLease:
+    """
+    A task's slice of the pooled browser: a fresh BrowserContext and page.
+    The context is closed when the lease is released, the browser is not.
+    warm is True when the page came from the standby pool and is already
+    sitting on the operator form (navigation and upload type done).
+    resumed is True when the page is a session parked by an earlier run of
+    the same order; park(key) keeps this one open for a later run.
+    """
+
+    def __init__(self, context, page, warm: bool = False, resumed: bool = False, opened_at: float = None):
+        self.context = context
+        self.page = page
+        self.warm = warm
+        self.resumed = resumed
+        self.leased_at = time.time()
+        self.opened_at = opened_at or self.leased_at
+        self.park_key = None
+
+    def park(self, key):
+        """Keep the context open on release, for a lease with resume=key."""
+        self.park_key = key
+
+
+class StandbyPage:
+    """A pre-navigated context waiting in the pool for the next order."""
+
+    def __init__(self, context, page, prepared_at: float = None):
+        self.context = context
+        self.page = page
+        self.prepared_at = prepared_at or time.time()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.prepared_at
+
+
+class BrowserPool:
+    """
+    Keeps one warm Chromium per worker process.
+    Celery starts it in worker_process_init, every task leases a fresh context
+    from it instead of running sync_playwright() + chromium.launch() itself.
+    The browser is recycled after max_orders leases or when the process tree
+    grows past max_memory_mb.
+
+    Operators can also register standby preparers: the pool then keeps
+    standby_size contexts per key already sitting on the operator form, so an
+    order can start directly at fill_phone. Standby pages are never handed
+    out once older than standby_max_age seconds. They are prepared when the
+    worker process boots and kept fresh by refresh_standby(), which the
+    refresh_standby_pages beat task runs in an idle process, outside any
+    order. Sync Playwright objects can only be used from the thread that
+    created them, so a process cannot refresh its pages while it runs an
+    order and a beat tick reaches one process at a time.
+    With standby_refill > 0, release() also tops each key up to that many
+    pages before the task returns, as part of the task's time (off by default).
+
+    A lease can also be parked instead of closed (an order stopped at a
+    checkpoint it can resume from): up to park_size sessions are kept per
+    process and handed back to lease(resume=key) until park_max_age
+    seconds after the session was opened.
+    """
+
+    def __init__(self, max_orders: int = None, max_memory_mb: int = None, headless: bool = True):
+        self.max_orders = max_orders or int(os.getenv('BROWSER_POOL_MAX_ORDERS', '25'))
+        self.max_memory_mb = max_memory_mb or int(os.getenv('BROWSER_POOL_MAX_MEMORY_MB', '1500'))
+        self.standby_size = int(os.getenv('BROWSER_POOL_STANDBY_PAGES', '1'))
+        self.standby_max_age = int(os.getenv('BROWSER_POOL_STANDBY_MAX_AGE', '300'))
+        self.standby_refill = int(os.getenv('BROWSER_POOL_STANDBY_REFILL', '0'))
+        self.park_size = int(os.getenv('BROWSER_POOL_PARKED_PAGES', '2'))
+        self.park_max_age = int(os.getenv('BROWSER_POOL_PARK_MAX_AGE', '300'))
+        self.headless = headless
+
+        self._playwright = None
+        self._browser = None
+        self._orders_served = 0
+
+        # key -> callable(page) -> bool, key -> [StandbyPage]
+        self._standby_preparers = {}
+        self._standby = {}
+        # key -> StandbyPage, oldest first
+        self._parked = {}
+
+        self.stats = {
+            'launches': 0,
+            'recycles': 0,
+            'leases': 0,
+            'last_launch_ms': 0.0,
+            'total_launch_ms': 0.0,
+            'total_lease_ms': 0.0,
+            'total_release_ms': 0.0,
+            'standby_hits': 0,
+            'standby_misses': 0,
+            'total_standby_prepare_ms': 0.0,
+            'total_refill_ms': 0.0,
+            'refreshes': 0,
+            'total_refresh_ms': 0.0,
+            'parked': 0,
+            'resumed': 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    def start(self):
+        """Launch Chromium now (called when the worker process boots)."""
+        if not self.is_running:
+            self._launch()
+
+    def stop(self):
+        """Close the browser and the Playwright driver."""
+        self._drop_standby()
+        self._drop_parked()
+        try:
+            if self._browser:
+                self._browser.close()
+        except Exception as e:
+            logger.warning(f"Browser pool: error while closing browser: {e}")
+        try:
+            if self._playwright:
+                self._playwright.stop()
+        except Exception as e:
+            logger.warning(f"Browser pool: error while stopping playwright: {e}")
+
+        self._browser = None
+        self._playwright = None
+        self._orders_served = 0
+
+    def _launch(self):
+        started = time.perf_counter()
+
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+        self._orders_served = 0
+
+        launch_ms = (time.perf_counter() - started) * 1000
+        self.stats['launches'] += 1
+        self.stats['last_launch_ms'] = launch_ms
+        self.stats['total_launch_ms'] += launch_ms
+        logger.info(f"Browser pool: Chromium launched in {launch_ms:.0f} ms (pid {os.getpid()}).")
+
+    def _recycle_reason(self):
+        if self._orders_served >= self.max_orders:
+            return f"served {self._orders_served} orders"
+
+        rss_mb = _process_tree_rss_mb(os.getpid())
+        if rss_mb >= self.max_memory_mb:
+            return f"memory {rss_mb:.0f} MB >= {self.max_memory_mb} MB"
+
+        return None
+
+    def recycle(self, reason: str = "manual"):
+        logger.info(f"Browser pool: recycling browser ({reason}).")
+        self.stats['recycles'] += 1
+        self.stop()
+        self._launch()
+
+    def register_standby(self, key, prepare, state_key: str = None):
+        """
+        prepare(page) must leave the page ready for the order (e.g. on the form
+        with cookies accepted) and return True, or return False on failure.
+        state_key selects the persisted storage state the standby contexts start with.
+        """
+        self._standby_preparers[key] = (prepare, state_key)
+        self._standby.setdefault(key, [])
+
+    def _new_context(self, state_key: str = None, **context_options):
+        """New context, seeded with the persisted consent state for state_key if still valid."""
+        if state_key and 'storage_state' not in context_options:
+            path = storage_state.load_state(state_key)
+            if path:
+                context_options['storage_state'] = path
+        try:
+            return self._browser.new_context(**context_options)
+        except Exception as e:
+            if 'storage_state' not in context_options:
+                raise
+            logger.warning(f"Browser pool: storage state for '{state_key}' unusable ({e}), discarding.")
+            storage_state.invalidate(state_key)
+            context_options.pop('storage_state')
+            return self._browser.new_context(**context_options)
+
+    def _drop_standby(self, key=None):
+        keys = [key] if key is not None else list(self._standby.keys())
+        for k in keys:
+            for slot in self._standby.get(k, []):
+                try:
+                    slot.context.close()
+                except Exception:
+                    pass
+            self._standby[k] = []
+
+    def _drop_parked(self, expired_only: bool = False):
+        for key, slot in list(self._parked.items()):
+            if expired_only and slot.age <= self.park_max_age and not slot.page.is_closed():
+                continue
+            self._drop_parked_key(key)
+
+    def _park(self, key, context, page, opened_at: float):
+        self._drop_parked(expired_only=True)
+        if self.park_size <= 0 or time.time() - opened_at > self.park_max_age:
+            return False
+        if key in self._parked:
+            self._drop_parked_key(key)
+        while len(self._parked) >= self.park_size:
+            self._drop_parked_key(next(iter(self._parked)))
+        self._parked[key] = StandbyPage(context, page, prepared_at=opened_at)
+        self.stats['parked'] += 1
+        logger.info(f"Browser pool: session {key} parked ({len(self._parked)} parked).")
+        return True
+
+    def _drop_parked_key(self, key):
+        slot = self._parked.pop(key)
+        try:
+            slot.context.close()
+        except Exception:
+            pass
+
+    def _take_parked(self, key):
+        slot = self._parked.pop(key, None)
+        if slot and slot.age <= self.park_max_age and not slot.page.is_closed():
+            return slot
+        if slot:
+            try:
+                slot.context.close()
+            except Exception:
+                pass
+        return None
+
+    def fill_standby(self, keys=None, depth: int = None):
+        """
+        Replace standby pages that are close to going stale (80% of
+        standby_max_age) and top every key back up to standby_size
+        (or depth, if lower).
+        """
+        target = self.standby_size if depth is None else min(depth, self.standby_size)
+        if target <= 0 or not self._standby_preparers:
+            return
+        if not self.is_running:
+            return
+
+        for key in (keys or list(self._standby_preparers.keys())):
+            if key not in self._standby_preparers:
+                continue
+            prepare, state_key = self._standby_preparers[key]
+            slots = self._standby.setdefault(key, [])
+
+            refresh_after = self.standby_max_age * 0.8
+            for slot in [sl for sl in slots if sl.age > refresh_after]:
+                logger.info(f"Browser pool: refreshing standby page {key} ({slot.age:.0f}s old).")
+                slots.remove(slot)
+                try:
+                    slot.context.close()
+                except Exception:
+                    pass
+
+            while len(slots) < target:
+                started = time.perf_counter()
+                context = self._new_context(state_key)
+                page = context.new_page()
+                try:
+                    ready = prepare(page)
+                except Exception as e:
+                    logger.warning(f"Browser pool: standby preparation for {key} failed: {e}")
+                    ready = False
+
+                if not ready:
+                    try:
+                        context.close()
+                    except Exception:
+                        pass
+                    break
+
+                slots.append(StandbyPage(context, page))
+                prepare_ms = (time.perf_counter() - started) * 1000
+                self.stats['total_standby_prepare_ms'] += prepare_ms
+                logger.info(f"Browser pool: standby page {key} ready in {prepare_ms:.0f} ms.")
+
+    def refresh_standby(self):
+        """fill_standby() between orders (idle process), timed outside any task's lease."""
+        if not self.is_running or not self._standby_preparers:
+            return
+        started = time.perf_counter()
+        try:
+            self.fill_standby()
+        except Exception as e:
+            logger.warning(f"Browser pool: standby refresh failed: {e}")
+        refresh_ms = (time.perf_counter() - started) * 1000
+        self.stats['refreshes'] += 1
+        self.stats['total_refresh_ms'] += refresh_ms
+        ready = {key: len(slots) for key, slots in self._standby.items()}
+        logger.info(f"Browser pool: standby refresh took {refresh_ms:.0f} ms, ready pages {ready}.")
+
+    def _take_standby(self, key):
+        slots = self._standby.get(key) or []
+        while slots:
+            slot = slots.pop(0)
+            if slot.age <= self.standby_max_age and not slot.page.is_closed():
+                return slot
+            try:
+                slot.context.close()
+            except Exception:
+                pass
+        return None
+
+    @contextmanager
+    def lease(self, standby=None, state_key: str = None, resume=None, **context_options):
+        """
+        Yields a BrowserLease with a fresh context and page.
+        Launches lazily if the worker did not start the pool (e.g. --pool=solo).
+        With standby=<key> a pre-navigated page is handed out when one is ready
+        (lease.warm is True), otherwise a blank page as usual.
+        With resume=<key> the session parked under key is handed out first
+        (lease.resumed is True); it only exists in the process that parked it.
+        With state_key the new context starts from the persisted consent state.
+        """
+        started = time.perf_counter()
+        cold = not self.is_running
+        if cold:
+            if self._browser is not None:
+                logger.warning("Browser pool: browser disconnected, relaunching.")
+                self.stop()
+            self._launch()
+
+        parked = self._take_parked(resume) if resume is not None else None
+        slot = self._take_standby(standby) if standby is not None and not context_options and not parked else None
+        if parked:
+            context, page, warm = parked.context, parked.page, True
+            self.stats['resumed'] += 1
+        elif slot:
+            context, page, warm = slot.context, slot.page, True
+            self.stats['standby_hits'] += 1
+        else:
+            context = self._new_context(state_key, **context_options)
+            page = context.new_page()
+            warm = False
+            if standby is not None and not parked:
+                self.stats['standby_misses'] += 1
+
+        lease_ms = (time.perf_counter() - started) * 1000
+        self.stats['leases'] += 1
+        self.stats['total_lease_ms'] += lease_ms
+        logger.info(
+            f"Browser pool: context leased in {lease_ms:.0f} ms "
+            f"({'cold' if cold else 'warm'} browser, "
+            f"{'parked session' if parked else 'standby page' if warm else 'blank page'}, "
+            f"order #{self._orders_served + 1} on this browser)."
+        )
+
+        lease = BrowserLease(
+            context, page, warm=warm, resumed=parked is not None, opened_at=parked.prepared_at if parked else None
+        )
+        try:
+            yield lease
+        finally:
+            parked_now = False
+            if lease.park_key is not None:
+                try:
+                    parked_now = self._park(lease.park_key, context, page, lease.opened_at)
+                except Exception as e:
+                    logger.warning(f"Browser pool: could not park session {lease.park_key}: {e}")
+            self.release(context, close=not parked_now)
+
+    def release(self, context, close: bool = True):
+        started = time.perf_counter()
+        if close:
+            try:
+                context.close()
+            except Exception as e:
+                logger.warning(f"Browser pool: error while closing context: {e}")
+
+        self._orders_served += 1
+        release_ms = (time.perf_counter() - started) * 1000
+        self.stats['total_release_ms'] += release_ms
+
+        reason = self._recycle_reason()
+        if reason:
+            try:
+                self.recycle(reason)
+            except Exception as e:
+                # Next lease will relaunch lazily
+                logger.error(f"Browser pool: recycle failed: {e}")
+                self.stop()
+                logger.info(f"Browser pool: context released in {release_ms:.0f} ms.")
+                return
+
+        # Opt-in refill before the task returns; otherwise the refresh task tops the pages up
+        refill_ms = 0.0
+        if self.standby_refill > 0:
+            refill_started = time.perf_counter()
+            try:
+                self.fill_standby(depth=self.standby_refill)
+            except Exception as e:
+                logger.warning(f"Browser pool: standby refill failed: {e}")
+            refill_ms = (time.perf_counter() - refill_started) * 1000
+            self.stats['total_refill_ms'] += refill_ms
+        logger.info(
+            f"Browser pool: context released in {release_ms:.0f} ms, standby refill {refill_ms:.0f} ms "
+            f"(both part of the task's time)."
+        )
+
+    def summary(self) -> dict:
+        """Averages for the timing counters, for logging/monitoring."""
+        launches = self.stats['launches'] or 1
+        leases = self.stats['leases'] or 1
+        return {
+            'launches': self.stats['launches'],
+            'recycles': self.stats['recycles'],
+            'leases': self.stats['leases'],
+            'avg_launch_ms': round(self.stats['total_launch_ms'] / launches, 1),
+            'avg_lease_ms': round(self.stats['total_lease_ms'] / leases, 1),
+            'avg_release_ms': round(self.stats['total_release_ms'] / leases, 1),
+            'avg_refill_ms': round(self.stats['total_refill_ms'] / leases, 1),
+            'refreshes': self.stats['refreshes'],
+            'avg_refresh_ms': round(self.stats['total_refresh_ms'] / (self.stats['refreshes'] or 1), 1),
+            'standby_hits': self.stats['standby_hits'],
+            'standby_misses': self.stats['standby_misses'],
+            'parked': self.stats['parked'],
+            'resumed': self.stats['resumed'],
+            # Every warm lease skips one launch
+            'saved_launch_ms': round(
+                max(self.stats['leases'] - self.stats['launches'], 0) * self.stats['total_launch_ms'] / launches, 1
+            ),
+        }
+
+
+# One pool per worker process
+browser_pool = BrowserPool()
@@ -18,15 +18,15 @@ class OperatorFactory:
         cls._operators[name.lower()] = operator_cls
 
     @classmethod
-    def get_operator(cls, name: str, page, card=None) -> BaseOperator:
+    def get_operator(cls, name: str, page, card=None, **options) -> BaseOperator:
         """
-        Get an instance of the requested operator.
+        Get an instance of the requested operator; options go to its constructor.
         """
         operator_cls = cls._operators.get(name.lower())
         if not operator_cls:
             raise ValueError(f"Operator '{name}' not found or not registered.")
         
-        return operator_cls(page, card)
+        return operator_cls(page, card, **options)
 
 # Pre-register known operators (to be uncommented as implemented)
 # OperatorFactory.register('turkcell', TurkcellOperator)
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = os.getenv('BROWSER_STATE_DIR', 'browser_state')
+STATE_TTL = int(os.getenv('BROWSER_STATE_TTL', str(12 * 3600)))
+
+# Only consent related cookies are persisted. Session cookies, localStorage
+# etc. must not leak from one order into the next one.
+CONSENT_COOKIE_MARKERS = ('optanon', 'consent', 'cookiepolicy', 'cookie_policy', 'eupubconsent')
+
+
+def state_path(key: str) -> str:
+    return os.path.join(STATE_DIR, f"{key}.json")
+
+
+def load_state(key: str):
+    """
+    Returns the storage_state file path for key if it exists and is younger
+    than STATE_TTL, else None (expired files are removed).
+    """
+    path = state_path(key)
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if age > STATE_TTL:
+        logger.info(f"Storage state '{key}' expired ({age:.0f}s old), will re-capture.")
+        invalidate(key)
+        return None
+    return path
+
+
+def save_state(key: str, context) -> bool:
+    """
+    Captures the consent cookies of context and writes them atomically, so
+    several worker processes can save the same key without corrupting it.
+    """
+    try:
+        return _write_consent(key, context.storage_state())
+    except Exception as e:
+        logger.warning(f"Could not save storage state '{key}': {e}")
+        return False
+
+
+async def save_state_async(key: str, context) -> bool:
+    """save_state for a playwright.async_api context."""
+    try:
+        return _write_consent(key, await context.storage_state())
+    except Exception as e:
+        logger.warning(f"Could not save storage state '{key}': {e}")
+        return False
+
+
+def _write_consent(key: str, state: dict) -> bool:
+    cookies = [
+        c for c in state.get('cookies', [])
+        if any(marker in c.get('name', '').lower() for marker in CONSENT_COOKIE_MARKERS)
+    ]
+    if not cookies:
+        logger.info(f"Storage state '{key}': no consent cookies found, nothing saved.")
+        return False
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'cookies': cookies, 'origins': []}, f)
+    os.replace(tmp_path, path)
+
+    logger.info(f"Storage state '{key}' saved ({len(cookies)} consent cookies).")
+    return True
+
+
+def invalidate(key: str):
+    try:
+        os.remove(state_path(key))
+    except OSError:
+        pass
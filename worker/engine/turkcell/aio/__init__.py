@@ -0,0 +1,3 @@
+from .core import AsyncTurkcellOperator
+
+__all__ = ["AsyncTurkcellOperator"]
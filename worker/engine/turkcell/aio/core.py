@@ -0,0 +1,94 @@
+import os
+import glob
+import logging
+
+from worker.engine.base_operator import BaseOperator
+from worker.utils.captcha_solver import CaptchaSolver
+
+from ..core import TurkcellOperator
+from .navigator import AsyncNavigatorMixin
+from .scraper import AsyncScraperMixin
+from .payment import AsyncPaymentMixin
+from .security import AsyncSecurityMixin
+from .waits import AsyncWaitMixin
+
+logger = logging.getLogger(__name__)
+
+class AsyncTurkcellOperator(AsyncNavigatorMixin, AsyncScraperMixin, AsyncPaymentMixin, AsyncSecurityMixin, AsyncWaitMixin, BaseOperator):
+    """
+    TurkcellOperator on playwright.async_api, used by the async worker to run
+    many orders in one process. Same selectors, routing profile, wait budgets,
+    matching and catalog as the sync operator; every page call is awaited.
+
+    Orders share the process, so screenshots are prefixed with the order's
+    label and debug_output is never cleared wholesale. Build it with
+    create(), which also installs the routing profile.
+    """
+
+    BASE_URL = TurkcellOperator.BASE_URL
+    CATALOG_NAME = TurkcellOperator.CATALOG_NAME
+    ROUTING_PROFILE = TurkcellOperator.ROUTING_PROFILE
+    Maps = TurkcellOperator.Maps
+
+    def __init__(self, page, card=None, label: str = 'order'):
+        # Not BaseOperator.__init__: it installs the routing profile synchronously, create() awaits it
+        self.page = page
+        self.card = card
+        self.maps = self.Maps
+        self.route_stats = {'allowed': 0, 'blocked': 0, 'blocked_by_reason': {}}
+        self.label = label
+        self.wait_timings = []
+        self.phase_timings = []
+        self.screenshots_taken = 0
+        self.captcha_solver = CaptchaSolver()
+        self.captcha_tickets = []
+
+    @classmethod
+    async def create(cls, page, card=None, label: str = 'order'):
+        operator = cls(page, card, label)
+        if os.getenv('BLOCK_NONESSENTIAL_REQUESTS', 'True') == 'True':
+            await operator.apply_routing_profile()
+        return operator
+
+    async def apply_routing_profile(self):
+        pattern = self.route_pattern()
+        if pattern is None:
+            return
+        try:
+            await self.page.unroute(pattern)
+            await self.page.route(pattern, self._route_request)
+        except Exception as e:
+            logger.warning(f"Could not apply routing profile: {e}")
+
+    async def _route_request(self, route):
+        request = route.request
+        reason = self._block_reason(request.url, request.resource_type)
+        self._count_route(reason)
+        try:
+            if reason:
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception:
+            # Page/context closed while the request was in flight
+            pass
+
+    def screenshot_path(self, name: str) -> str:
+        return f"debug_output/{self.label}_{name}.png"
+
+    async def take_screenshot(self, name: str):
+        try:
+            path = self.screenshot_path(name)
+            self.screenshots_taken += 1
+            await self.page.screenshot(path=path)
+            logger.info(f"Screenshot saved: {path}")
+        except Exception as e:
+            logger.error(f"Failed to take screenshot: {e}")
+
+    def cleanup_debug_output(self):
+        """Removes this order's screenshots only."""
+        for f in glob.glob(f"debug_output/{self.label}_*"):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
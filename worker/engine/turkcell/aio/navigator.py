@@ -0,0 +1,110 @@
+import logging
+from worker.engine.storage_state import save_state_async
+from ..rules import (
+    CONSENT_CHECK_JS, CONSENT_OR_BANNER_JS, PHONE_DIGITS_JS, COOKIE_SELECTORS, COOKIE_BANNER_SELECTOR,
+    UPLOAD_TYPE_FALLBACKS, FOCUSED_JS, CHECKED_JS, PHONE_VALUE_JS, PHONE_CLEARED_JS, PHONE_ERROR_SELECTOR,
+    phone_digits, phone_value, resume_selector
+)
+
+logger = logging.getLogger(__name__)
+
+async def handle_cookies(page, state_key: str = 'turkcell'):
+    """navigator.handle_cookies for an async page."""
+    try:
+        try:
+            consent = await page.evaluate(CONSENT_CHECK_JS)
+            if consent.get('consent') and not consent.get('banner'):
+                return
+            if consent.get('banner'):
+                logger.info("Cookie banner visible, accepting and re-capturing storage state.")
+        except Exception:
+            pass
+
+        for selector in COOKIE_SELECTORS:
+            btn = await page.query_selector(selector)
+            if btn and await btn.is_visible():
+                logger.info(f"Found cookie button with selector: {selector}")
+                await btn.click()
+                try:
+                    await page.wait_for_selector(COOKIE_BANNER_SELECTOR, state='hidden', timeout=2000)
+                except Exception:
+                    pass
+                # Persist consent so new contexts skip the banner entirely
+                await save_state_async(state_key, page.context)
+                return
+    except Exception:
+        pass
+
+class AsyncNavigatorMixin:
+    """NavigatorMixin on playwright.async_api."""
+
+    async def navigate_to_base_url(self):
+        logger.info(f"Navigating to {self.BASE_URL}")
+        await self.page.goto(self.BASE_URL, wait_until="domcontentloaded")
+        await self.wait_for_selector_step('form_ready', self.Maps["radio_package"], state="attached")
+        await self.wait_for_function_step('cookie_banner', CONSENT_OR_BANNER_JS)
+        await handle_cookies(self.page)
+
+    async def select_upload_type(self, upload_type: str = "Package"):
+        logger.info(f"Selecting upload type: {upload_type}")
+        try:
+            target_radio = self.Maps["radio_tl"] if upload_type == "TL" else self.Maps["radio_package"]
+            await self.page.wait_for_selector(target_radio, timeout=10000)
+            await self.page.click(target_radio, force=True)
+            if not await self.wait_for_function_step('upload_type_checked', CHECKED_JS, arg=target_radio):
+                logger.warning(f"Upload type radio {upload_type} not reported as checked, continuing.")
+        except Exception as e:
+            logger.error(f"Failed to select upload type {upload_type}: {e}")
+            for text_selector in UPLOAD_TYPE_FALLBACKS.get(upload_type, []):
+                try:
+                    await self.page.click(text_selector, timeout=2000)
+                    break
+                except Exception:
+                    pass
+
+    async def can_resume_at(self, step: str) -> bool:
+        selector = resume_selector(self.Maps, step)
+        if not selector or self.page.is_closed():
+            return False
+        try:
+            if step == 'pay' and await self.page.query_selector(self.Maps["iframe_wrapper"]):
+                return False
+            return await self.page.locator(selector).first.is_visible()
+        except Exception as e:
+            logger.warning(f"Parked session not usable at '{step}': {e}")
+            return False
+
+    async def fill_phone(self, phone_number: str):
+        logger.info(f"Filling phone number: {phone_number}")
+        phone_input = self.Maps["phone_input"]
+        await self.page.wait_for_selector(phone_input)
+        await self.page.click(phone_input)
+        await self.wait_for_function_step('phone_focus', FOCUSED_JS, arg=phone_input)
+
+        clean_number = phone_digits(phone_number)
+        logger.info(f"Typing clean number (without prefix): {clean_number}")
+        base_digits = len(''.join(ch for ch in await self.page.input_value(phone_input) if ch.isdigit()))
+        for typed, digit in enumerate(clean_number, start=1):
+            await self.page.keyboard.type(digit)
+            await self.wait_for_function_step('phone_digit', PHONE_DIGITS_JS, arg=[phone_input, base_digits + typed])
+        await self.wait_for_function_step('phone_value', PHONE_VALUE_JS, arg=[phone_input, clean_number])
+
+        for attempt in range(2):
+            input_val = await self.page.input_value(phone_input)
+            clean_val = phone_value(input_val)
+            logger.info(f"Input Value: {input_val} (Clean: {clean_val}) - Expected: {clean_number}")
+
+            error_el = await self.page.query_selector(PHONE_ERROR_SELECTOR)
+            if error_el and await error_el.is_visible():
+                logger.warning(f"Phone Error visible: {await error_el.inner_text()}")
+
+            if clean_number in clean_val:
+                logger.info("Phone number entered correctly.")
+                break
+            logger.warning(f"Phone mismatch! Retrying... Attempt {attempt+1}")
+            await self.page.fill(phone_input, "")
+            await self.wait_for_function_step('phone_cleared', PHONE_CLEARED_JS, arg=[phone_input, clean_number])
+        if not phone_value(await self.page.input_value(phone_input)).endswith(clean_number):
+            logger.error("Failed to verify phone number entry.")
+
+        await self.take_screenshot("after_phone_input")
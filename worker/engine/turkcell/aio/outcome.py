@@ -0,0 +1,61 @@
+import time
+import asyncio
+import logging
+
+from ..outcome import OBSERVER_JS, MATCHES_JS, ThreeDSOutcomeDetector
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncThreeDSOutcomeDetector(ThreeDSOutcomeDetector):
+    """
+    ThreeDSOutcomeDetector for an async page. The binding is exposed in
+    start(); wait() sleeps on the event loop between ticks, which is what
+    delivers the binding / navigation events in the async API.
+    """
+
+    def _attach(self):
+        pass
+
+    async def start(self):
+        await self.page.expose_binding(self.binding, self._on_signal)
+        self.page.on("framenavigated", self._on_navigated)
+        self._pending_frames.extend(self.page.frames)
+        return self
+
+    async def _in_3ds_iframe(self, frame) -> bool:
+        while frame.parent_frame:
+            element = await frame.frame_element()
+            try:
+                if await element.evaluate(MATCHES_JS, self.config['iframeSelector']):
+                    return True
+            finally:
+                await element.dispose()
+            frame = frame.parent_frame
+        return False
+
+    async def _install_pending(self):
+        pending, self._pending_frames = self._pending_frames, []
+        for frame in pending:
+            scope = 'page' if frame == self.page.main_frame else 'frame'
+            try:
+                if frame.is_detached():
+                    continue
+                if scope == 'frame' and not await self._in_3ds_iframe(frame):
+                    logger.debug(f"3DS outcome: not watching {frame.url[:60]}, outside the 3DS iframe")
+                    continue
+                if await frame.evaluate(OBSERVER_JS, dict(self.config, scope=scope)):
+                    self.installs += 1
+            except Exception as e:
+                logger.debug(f"3DS outcome: could not watch frame {frame.url[:60]}: {e}")
+
+    async def wait(self, timeout_s: float, closed_grace_ms: int = 3000, tick_ms: int = 200):
+        deadline = time.perf_counter() + timeout_s
+        while time.perf_counter() < deadline:
+            await self._install_pending()
+            if self.outcome:
+                return self.outcome
+            if self.closed_at and (time.perf_counter() - self.closed_at) * 1000 >= closed_grace_ms:
+                return {'outcome': 'closed', 'reason': 'no_result_text', 'scope': 'page', 'text': ''}
+            await asyncio.sleep(tick_ms / 1000)
+        return None
@@ -0,0 +1,90 @@
+import logging
+from ..rules import (
+    SET_SELECT_JS, CCV_SELECTOR, AGREEMENT_WRAPPER_SELECTOR, AGREEMENT_CHECKED_CLASS, CHECKBOX_SELECTOR,
+    FORM_ERROR_SELECTOR, CLICK_JS, card_expiry, payment_submitted_selector
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncPaymentMixin:
+    """PaymentMixin on playwright.async_api."""
+
+    async def process_payment(self) -> bool:
+        if not self.card:
+            logger.error("No credit card provided to operator")
+            return False
+
+        logger.info("Processing Payment")
+        try:
+            await self.page.wait_for_selector(self.Maps["card_holder"], timeout=15000)
+            await self.take_screenshot("payment_page_loaded")
+
+            await self.page.fill(self.Maps["card_holder"], self.card.holder_name)
+            await self.page.fill(self.Maps["card_number"], self.card.card_number)
+
+            month_val, year_val = card_expiry(self.card)
+            logger.info(f"Selecting expiry: {month_val}/{year_val}")
+            try:
+                await self.page.select_option(self.Maps["exp_month"], value=month_val)
+                await self.page.select_option(self.Maps["exp_year"], value=year_val)
+            except Exception:
+                pass
+            try:
+                await self.page.evaluate(SET_SELECT_JS, [self.Maps["exp_month"], month_val])
+                await self.page.evaluate(SET_SELECT_JS, [self.Maps["exp_year"], year_val])
+            except Exception as e:
+                logger.warning(f"Expiry selection failed: {e}")
+
+            await self.page.fill(CCV_SELECTOR, self.card.cvv)
+            await self.take_screenshot("card_details_filled")
+
+            try:
+                checkbox_wrapper = await self.page.query_selector(AGREEMENT_WRAPPER_SELECTOR)
+                if checkbox_wrapper:
+                    if AGREEMENT_CHECKED_CLASS not in (await checkbox_wrapper.get_attribute("class") or ""):
+                        await checkbox_wrapper.click()
+                        logger.info("Clicked agreement checkbox wrapper")
+                else:
+                    await self.page.check(CHECKBOX_SELECTOR)
+                    logger.info("Checked agreement checkbox input")
+            except Exception as e:
+                logger.warning(f"Agreement checkbox click failed: {e}. Trying generic checkbox.")
+                await self.page.click(CHECKBOX_SELECTOR)
+
+            await self.page.wait_for_selector(self.Maps["submit_payment"], state="visible")
+            submit_btn = self.page.locator(self.Maps["submit_payment"])
+
+            async def wait_enabled(t):
+                handle = await submit_btn.element_handle(timeout=t)
+                await handle.wait_for_element_state("enabled", timeout=t)
+
+            await self.wait_step('payment_submit_enabled', wait_enabled)
+            if await submit_btn.is_disabled():
+                logger.warning("Submit button is disabled! Checkbox might not be checked.")
+                await self.page.click(AGREEMENT_WRAPPER_SELECTOR)
+                await self.wait_step('payment_submit_enabled', wait_enabled)
+            if await submit_btn.is_disabled():
+                logger.error("Submit button still disabled despite retry. Attempting JS click anyway.")
+
+            logger.info("Clicking 'İşlemi Tamamla' button...")
+            try:
+                await submit_btn.click(timeout=3000)
+            except Exception as e:
+                logger.warning(f"Standard click failed: {e}. Trying JS click.")
+                await self.page.evaluate(CLICK_JS, await submit_btn.element_handle())
+
+            await self.wait_for_selector_step('payment_submitted', payment_submitted_selector(self.Maps), state="attached")
+            await self.take_screenshot("after_payment_submit")
+
+            error_el = await self.page.query_selector(FORM_ERROR_SELECTOR)
+            if error_el and await error_el.is_visible():
+                logger.error(f"Payment Form Error: {await error_el.inner_text()}")
+                await self.take_screenshot("payment_form_error")
+                return False
+
+            logger.info("Payment submission clicked. Proceeding to 3D Secure check.")
+            return True
+        except Exception as e:
+            logger.error(f"Payment failed: {e}")
+            await self.take_screenshot("payment_page_failed")
+            return False
@@ -0,0 +1,242 @@
+import time
+import logging
+from worker.services.catalog import PackageCatalogService
+from ..scraper import ScraperMixin
+from ..rules import (
+    EXTRACT_TABS_JS, TAB_TITLES_JS, INNER_TEXTS_JS, TL_SELECTED_JS, TAB_SELECTORS, PRICE_SELECTOR, TABS_SELECTOR,
+    TL_CARD_SELECTOR, TL_CONTINUE_SELECTORS, CONTINUE_ENABLED_JS, CLICK_JS, MATCH_THRESHOLD,
+    parse_price, unsettled_tabs, merge_resweep, tl_packages, tab_packages, tl_card_index, package_queries,
+    tab_search_order, best_card, package_continue_selectors, package_confirm_selector
+)
+from .navigator import handle_cookies
+
+logger = logging.getLogger(__name__)
+
+class AsyncScraperMixin:
+    """
+    ScraperMixin on playwright.async_api: DOM scraping and selection (one
+    roundtrip per tab, cached catalog first, predicted tab first). The
+    network catalog is not ported; the async worker scrapes from the DOM.
+    """
+
+    # Catalog lookup, shared with the sync mixin
+    _catalog_match = ScraperMixin._catalog_match
+
+    async def _extract_tabs(self, only_tabs=None) -> dict:
+        data = await self._sweep_tabs(only_tabs)
+        unsettled = unsettled_tabs(data)
+        if unsettled:
+            logger.warning(f"Cards of tabs {unsettled} did not settle, sweeping them again.")
+            dropped = merge_resweep(data, await self._sweep_tabs(unsettled))
+            if dropped:
+                logger.warning(f"Dropping the cards of tabs {dropped}: still not settled.")
+        return data
+
+    async def _sweep_tabs(self, only_tabs=None) -> dict:
+        started = time.perf_counter()
+        data = await self.page.evaluate(EXTRACT_TABS_JS, {
+            'tabSelectors': TAB_SELECTORS,
+            'cardSelector': self.Maps["package_card"],
+            'nameSelector': self.Maps["package_name"],
+            'priceSelector': PRICE_SELECTOR,
+            'onlyTabs': list(only_tabs) if only_tabs is not None else None,
+            'settleMs': 150,
+            'timeoutMs': self.WAIT_BUDGETS_MS.get('tab_cards', 3000),
+        })
+        card_count = sum(len(t['cards']) for t in data['tabs'])
+        logger.info(
+            f"Extracted {card_count} cards from {len(data['tabs'])}/{data['tab_count']} tabs "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms (1 roundtrip)."
+        )
+        return data
+
+    async def _card_handle(self, index: int):
+        return await self.page.locator(self.Maps["package_card"]).nth(index).element_handle(timeout=2000)
+
+    async def _wait_optional(self, selector: str, timeout: int) -> bool:
+        try:
+            await self.page.wait_for_selector(selector, timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    async def scrape_packages(self, is_tl=False) -> list:
+        logger.info(f"Scraping packages... (Mode: {'TL' if is_tl else 'Package'})")
+        try:
+            if is_tl:
+                if not await self._wait_optional(self.Maps["tl_card"], 10000):
+                    logger.error("TL amount cards not found.")
+                    return []
+                texts = await self.page.eval_on_selector_all(self.Maps["tl_card"], INNER_TEXTS_JS)
+                logger.info(f"Found {len(texts)} TL amount cards.")
+                return tl_packages(texts)
+
+            await self._wait_optional(self.Maps["tab_ek_paketler"], 5000)
+            if not await self._wait_optional(TABS_SELECTOR, 5000):
+                logger.warning("Timeout waiting for tabs (5s).")
+
+            data = await self._extract_tabs()
+            logger.info(f"Found {data['tab_count']} category tabs.")
+            packages = tab_packages(data)
+            logger.info(f"Scraping finished. Returning {len(packages)} packages.")
+            return packages
+        except Exception as e:
+            logger.error(f"Scraping failed: {e}")
+            return []
+
+    async def _click_continue(self, selectors: list):
+        for selector in selectors:
+            try:
+                btn = await self.page.query_selector(selector)
+                if btn and await btn.is_visible():
+                    logger.info(f"Found Continue button with selector: {selector}")
+                    return btn
+            except Exception:
+                continue
+        return None
+
+    async def _confirm_tl_selection(self, target_card, package_id: str) -> bool:
+        logger.info(f"Confirming TL selection for {package_id}")
+        click_target = await target_card.query_selector('div') or target_card
+        await click_target.click(force=True)
+
+        try:
+            if not await self.wait_for_function_step('tl_card_selected', TL_SELECTED_JS, arg=click_target):
+                logger.warning(f"TL Selection might have failed. Classes: {await click_target.get_attribute('class')}. Retrying click with JS...")
+                await self.page.evaluate(CLICK_JS, click_target)
+                await self.wait_for_function_step('tl_card_selected', TL_SELECTED_JS, arg=click_target)
+        except Exception as e:
+            logger.warning(f"Verification error: {e}")
+
+        await self.take_screenshot("after_tl_card_click")
+        await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await handle_cookies(self.page)
+            btn = await self._click_continue(TL_CONTINUE_SELECTORS)
+            if not btn:
+                logger.error("Continue button not found (TL Flow)!")
+                await self.take_screenshot("tl_continue_not_found")
+                return False
+
+            await btn.scroll_into_view_if_needed()
+            if await btn.is_disabled() or "disabled" in (await btn.get_attribute("class") or ""):
+                await self.wait_for_function_step('continue_enabled', CONTINUE_ENABLED_JS, arg=btn)
+            await self.page.evaluate(CLICK_JS, btn)
+            logger.info("Clicked Continue button (JS)")
+            return True
+        except Exception as e:
+            logger.error(f"Error clicking continue (TL Flow): {e}")
+            return False
+
+    async def _click_and_confirm_package(self, target_card, package_id: str) -> bool:
+        logger.info(f"Clicking package card for {package_id} (Panel Flow)")
+        try:
+            click_target = await target_card.query_selector(self.Maps["package_name"]) or target_card
+            await click_target.scroll_into_view_if_needed()
+            await click_target.click(force=True)
+            await self.take_screenshot("after_package_click")
+
+            await self.wait_for_selector_step('package_confirm_button', package_confirm_selector(self.Maps))
+            btn = await self._click_continue(package_continue_selectors(self.Maps))
+            if btn:
+                await btn.click()
+                logger.info("Clicked confirmation button.")
+            else:
+                logger.warning("No specific confirmation button found. Checking if url changed or we proceeded.")
+            # Verification happens in the payment step
+            return True
+        except Exception as e:
+            logger.error(f"Error in package confirmation: {e}")
+            return False
+
+    async def _select_amount(self, amount: float) -> bool:
+        logger.info(f"TL Load mode for amount: {amount}")
+        try:
+            await self.page.wait_for_selector(TL_CARD_SELECTOR, timeout=30000)
+            card_texts = await self.page.eval_on_selector_all(TL_CARD_SELECTOR, INNER_TEXTS_JS)
+            card_index = tl_card_index(card_texts, amount)
+            if card_index is not None:
+                logger.info(f"Found match for amount {amount} in card {card_index}")
+                target_card = await self.page.locator(TL_CARD_SELECTOR).nth(card_index).element_handle(timeout=2000)
+                return await self._confirm_tl_selection(target_card, f"{amount} TL")
+            logger.error(f"Card for amount {amount} not found! Cards saw: {card_texts}")
+            await self.take_screenshot("tl_amount_not_found")
+            return False
+        except Exception as e:
+            logger.error(f"Error selecting TL amount: {e}")
+            await self.take_screenshot("tl_selection_error")
+            return False
+
+    async def select_package(self, package_id: str = None, amount: float = None, fallback_name: str = None,
+                             preferred_category: str = None) -> bool:
+        logger.info(f"Selecting Package: {package_id} or Amount: {amount} or Fallback: {fallback_name}")
+        self.last_selected_price = 0.0
+        self.last_selected_name = ""
+        await handle_cookies(self.page)
+
+        if amount:
+            return await self._select_amount(amount)
+
+        search_texts = package_queries(package_id, fallback_name)
+        if not search_texts:
+            return False
+
+        try:
+            catalog_score, catalog_record = self._catalog_match(search_texts)
+            if catalog_score >= MATCH_THRESHOLD and catalog_record['name'] not in search_texts:
+                logger.info(f"Catalog cache resolved '{search_texts[0]}' to '{catalog_record['name']}' (Score: {catalog_score:.2f})")
+                search_texts.insert(0, catalog_record['name'])
+
+            if not await self._wait_optional(self.Maps["tab_ek_paketler"], 30000):
+                logger.warning("EK PAKETLER tab not found, trying generic tab selector...")
+            if not await self._wait_optional(TABS_SELECTOR, 20000):
+                logger.error("Timeout waiting for tabs.")
+                return False
+
+            tab_titles = await self.page.evaluate(TAB_TITLES_JS, TAB_SELECTORS)
+            tab_order, predicted_tab = tab_search_order(tab_titles, preferred_category)
+            if predicted_tab is None and preferred_category:
+                PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'unknown')
+
+            for position, tab_idx in enumerate(tab_order):
+                if position == 1 and predicted_tab is not None:
+                    logger.info("Tab prediction missed, sweeping the remaining tabs.")
+                    PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'miss')
+                tab_started = time.perf_counter()
+                try:
+                    data = await self._extract_tabs(only_tabs=[tab_idx])
+                    if not data['tabs']:
+                        continue
+                    tab = data['tabs'][0]
+                    category_name = tab['category'] or f"Kategori {tab_idx+1}"
+                    if tab['error'] or not tab['cards']:
+                        logger.warning(f"No package cards in tab {category_name}: {tab['error'] or 'empty'}")
+                        continue
+
+                    best_score, match = best_card(tab, search_texts)
+                    if not match:
+                        continue
+
+                    logger.info(f"✅ Best match selected in tab '{category_name}': {match['name']} (Score: {best_score:.2f})")
+                    if predicted_tab is not None and tab_idx == predicted_tab:
+                        PackageCatalogService.record_tab_prediction(
+                            self.CATALOG_NAME, 'hit', saved_ms=predicted_tab * (time.perf_counter() - tab_started) * 1000
+                        )
+                    price = parse_price(match['price_text'])
+                    if price:
+                        self.last_selected_price = price
+                        self.last_selected_name = match['name']
+                    target_card = await self._card_handle(match['index'])
+                    return await self._click_and_confirm_package(target_card, match['name'])
+                except Exception as e:
+                    logger.error(f"Error searching tab {tab_idx}: {e}")
+                    continue
+
+            if predicted_tab is not None and len(tab_titles) == 1:
+                PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'miss')
+            logger.error(f"Package queries '{search_texts}' not found in any of {len(tab_titles)} tabs.")
+            await self.take_screenshot("package_not_found_all_tabs")
+            return False
+        except Exception as e:
+            logger.error(f"Error selecting package: {e}")
+            return False
@@ -0,0 +1,398 @@
+import time
+import asyncio
+import inspect
+import logging
+from asgiref.sync import sync_to_async
+from worker.services.sms_bus import SMSBus
+from worker.services.sms_correlation import SMSCorrelator
+from ..security import SecurityMixin
+from .navigator import handle_cookies
+from ..rules import (
+    FOCUSED_JS, ENABLED_JS, CLICK_JS, CAPTCHA_MAX_RETRIES, CAPTCHA_MIN_LENGTH, CAPTCHA_ERROR_SELECTOR, MODAL_SELECTOR,
+    CAPTCHA_REFRESHED_JS, THREEDS_FORM_SELECTOR, CARD_FORM_SELECTOR, SMS_SCREEN_INPUTS, SMS_INPUT_SELECTORS,
+    SMS_SUBMIT_SELECTORS, FREE_INPUTS, captcha_outcome_selector, is_invalid_number, iframe_wrapper_selector,
+    iframe_selector, is_sms_screen, sms_code, threeds_verdict, closed_verdict, timeout_verdict
+)
+from .outcome import AsyncThreeDSOutcomeDetector
+
+logger = logging.getLogger(__name__)
+
+async def _notify(log_callback, message: str):
+    """log_callback may be a plain function or a coroutine function."""
+    if not log_callback:
+        return
+    result = log_callback(message)
+    if inspect.isawaitable(result):
+        await result
+
+class AsyncSecurityMixin:
+    """
+    SecurityMixin on playwright.async_api. Captcha answers, the SMS push
+    wait and the SMS claims run in threads so the loop keeps driving the
+    other orders meanwhile.
+    """
+
+    captcha_summary = SecurityMixin.captcha_summary
+    _claim_pushed_sms = SecurityMixin._claim_pushed_sms
+
+    async def _refresh_captcha(self, old_src: str = None):
+        try:
+            current = await self.page.get_attribute(self.Maps["captcha_img"], "src", timeout=1000)
+        except Exception:
+            current = None
+        if not old_src or not current or current == old_src:
+            await self.page.click(self.Maps["captcha_refresh"])
+            await self.wait_for_function_step('captcha_refreshed', CAPTCHA_REFRESHED_JS, arg=[self.Maps["captcha_img"], old_src or ""])
+            try:
+                current = await self.page.get_attribute(self.Maps["captcha_img"], "src", timeout=1000)
+            except Exception:
+                current = None
+        return current
+
+    async def _refresh_and_submit(self, old_src: str = None):
+        new_src = await self._refresh_captcha(old_src)
+        if not new_src or new_src == old_src or not new_src.startswith("data:"):
+            return None
+        return self.captcha_solver.submit(new_src)
+
+    async def solve_captcha(self, log_callback=None) -> bool:
+        await self.take_screenshot("before_captcha_check")
+        max_retries = CAPTCHA_MAX_RETRIES
+        prefetched = None
+        try:
+            for attempt in range(max_retries):
+                if attempt == 3:
+                    logger.info("Phase 2 reached: 3 failed attempts, starting next 3...")
+                    await _notify(log_callback, "CAPTCHA_PHASE_2")
+                logger.info(f"Captcha attempt {attempt + 1}/{max_retries}")
+
+                try:
+                    await self.page.wait_for_selector(self.Maps["captcha_img"], state="visible", timeout=5000)
+                except Exception:
+                    logger.info("Captcha image not visible after wait, assuming solved or not present.")
+                    return True
+
+                src = await self.page.get_attribute(self.Maps["captcha_img"], "src")
+                if not src:
+                    logger.error("Captcha source empty.")
+                    return False
+
+                if prefetched and prefetched.src == src:
+                    ticket = prefetched
+                    logger.info("Using captcha answer prefetched after refresh.")
+                else:
+                    ticket = self.captcha_solver.submit(src)
+                prefetched = None
+                self.captcha_tickets.append(ticket)
+
+                await self.page.click(self.Maps["captcha_input"])
+                await self.wait_for_function_step('captcha_focus', FOCUSED_JS, arg=self.Maps["captcha_input"])
+
+                try:
+                    code = await asyncio.to_thread(ticket.result)
+                except Exception as e:
+                    logger.error(f"Captcha solving failed: {e}")
+                    return False
+                logger.info(f"Solved Captcha: {code}")
+                if len(code) < CAPTCHA_MIN_LENGTH:
+                    logger.warning(f"Solved code '{code}' is too short. Refreshing...")
+                    ticket.report(False)
+                    prefetched = await self._refresh_and_submit(src)
+                    continue
+
+                # Typed one by one to trigger the React handlers
+                for char in code:
+                    await self.page.keyboard.type(char, delay=100)
+                await self.page.keyboard.press("Tab")
+                await self.page.keyboard.press("Tab")
+                await self.wait_for_function_step('captcha_submit_enabled', ENABLED_JS, arg=self.Maps["captcha_submit"])
+
+                submit_btn = await self.page.query_selector(self.Maps["captcha_submit"])
+                if not submit_btn:
+                    logger.error(f"Submit button not found with selector: {self.Maps['captcha_submit']}")
+                    await self.take_screenshot(f"captcha_submit_missing_{attempt}")
+                    return False
+                try:
+                    await submit_btn.click()
+                except Exception as e:
+                    logger.error(f"Failed to click submit button: {e}")
+
+                try:
+                    try:
+                        await self.page.wait_for_selector(self.Maps["captcha_input"], state="hidden", timeout=15000)
+                    except Exception:
+                        logger.warning("Captcha input not hidden within 15s, continuing checks.")
+                        await self.wait_for_selector_step('captcha_outcome', captcha_outcome_selector(self.Maps))
+
+                    if await self.page.is_visible(self.Maps["tab_ek_paketler"]):
+                        logger.info("Captcha successful (Next step visible)")
+                        ticket.report(True)
+                        return True
+
+                    error_el = await self.page.query_selector(CAPTCHA_ERROR_SELECTOR)
+                    if error_el and await error_el.is_visible():
+                        logger.warning(f"Captcha Error: {await error_el.inner_text()}. Retrying...")
+                        ticket.report(False)
+                        await self.take_screenshot(f"captcha_error_attempt_{attempt}")
+                        prefetched = await self._refresh_and_submit(src)
+                        continue
+
+                    modal_text_el = await self.page.query_selector(MODAL_SELECTOR)
+                    if modal_text_el and await modal_text_el.is_visible():
+                        text = await modal_text_el.inner_text()
+                        if is_invalid_number(text):
+                            logger.error(f"Invalid Phone Number Error: {text}")
+                            await self.take_screenshot("invalid_number_modal")
+                            return False
+
+                    if await self.page.is_hidden(self.Maps["captcha_input"]):
+                        logger.info("Captcha successful (Input hidden)")
+                        ticket.report(True)
+                        return True
+
+                    logger.warning("Captcha kabul edilmedi veya hata mesajı algılanamadı. Tekrar deneniyor...")
+                    ticket.report(False)
+                    await self.take_screenshot(f"captcha_unknown_state_attempt_{attempt}")
+                    prefetched = await self._refresh_and_submit(src)
+                except Exception as e:
+                    logger.error(f"Error checking captcha result: {e}")
+                    await self.take_screenshot(f"captcha_check_error_{attempt}")
+                    try:
+                        prefetched = await self._refresh_and_submit(src)
+                    except Exception:
+                        pass
+
+            logger.error("Max captcha retries exceeded.")
+            logger.error("CAPTCHA_RETRY_LIMIT_EXCEEDED") # Frontend detection key
+            await self.take_screenshot("captcha_failed_final")
+            return False
+        except Exception as e:
+            logger.error(f"Fatal Error in solve_captcha: {e}")
+            await self.take_screenshot("captcha_fatal_error")
+            return False
+
+    async def _sms_input(self, frame):
+        for sel in SMS_INPUT_SELECTORS:
+            input_el = await frame.query_selector(sel)
+            if input_el:
+                logger.info(f"Found input with selector: {sel}")
+                return input_el
+        # Smart Fallback: exactly one visible, editable input
+        visible_inputs = []
+        for inp in await frame.query_selector_all(FREE_INPUTS):
+            try:
+                if await inp.is_visible() and await inp.is_editable():
+                    visible_inputs.append(inp)
+            except Exception:
+                pass
+        if len(visible_inputs) == 1:
+            logger.info("Smart Fallback: Found exactly one visible input. Using it.")
+            return visible_inputs[0]
+        if visible_inputs:
+            logger.warning(f"Smart Fallback Failed: Found {len(visible_inputs)} visible inputs. Ambiguous.")
+        return None
+
+    async def _submit_sms_code(self, iframe_selector, code, log_callback=None) -> (bool, str):
+        try:
+            frame = None
+            for retry in range(3):
+                frame_element = await self.page.query_selector(iframe_selector)
+                frame = await frame_element.content_frame() if frame_element else None
+                if frame:
+                    break
+                logger.warning(f"Iframe not ready, retry {retry+1}/3...")
+                await self.wait_for_selector_step('iframe_ready', iframe_selector, state="attached")
+            if not frame:
+                return False, "Iframe not accessible after retries"
+
+            logger.info(f"Submitting code: {code}")
+            input_el = await self._sms_input(frame)
+            if not input_el:
+                return False, "Input field for code not found"
+
+            await input_el.click()
+            await input_el.type(code, delay=100)
+            await self.take_screenshot("3d_secure_code_filled")
+
+            submit_btn = None
+            for sel in SMS_SUBMIT_SELECTORS:
+                candidate = await frame.query_selector(sel)
+                if candidate and await candidate.is_visible():
+                    submit_btn = candidate
+                    break
+
+            if submit_btn:
+                try:
+                    await submit_btn.click(timeout=3000)
+                except Exception as e:
+                    logger.warning(f"Standard click failed ({e}). Trying JS click.")
+                    await frame.evaluate(CLICK_JS, submit_btn)
+                logger.info("Clicked Submit/Continue.")
+            else:
+                logger.warning("No submit button found by selectors. Attempting to press 'Enter' on the input field itself...")
+                try:
+                    await input_el.press("Enter")
+                except Exception as e:
+                    logger.error(f"Failed to press 'Enter' on input field: {e}")
+                    await self.take_screenshot("3d_secure_no_submit_btn")
+                    return False, "Submit button not found and Enter key failed"
+
+            logger.info("Waiting for transaction processing...")
+            async with self.measure_phase('3ds_result', mode='detector'):
+                return await self._await_3ds_result(iframe_selector, log_callback)
+        except Exception as e:
+            logger.error(f"Error in _submit_sms_code: {e}")
+            return False, str(e)
+
+    async def _await_3ds_result(self, iframe_selector, log_callback=None, timeout: int = 60) -> (bool, str):
+        detector = await AsyncThreeDSOutcomeDetector(self.page, iframe_selector, iframe_wrapper_selector(self.Maps)).start()
+        try:
+            signal = await detector.wait(timeout, closed_grace_ms=self.WAIT_BUDGETS_MS['post_3ds_result'])
+        finally:
+            detector.close()
+
+        if signal is None:
+            await self.take_screenshot("3d_secure_poll_timeout")
+            return timeout_verdict(bool(await self.page.query_selector(iframe_selector)))
+
+        verdict = threeds_verdict(signal)
+        if verdict:
+            ok, message, screenshot, notify = verdict
+            await self.take_screenshot(screenshot)
+            if notify:
+                await _notify(log_callback, notify)
+            return ok, message
+
+        await self.take_screenshot("post_3d_secure_check")
+        return closed_verdict(await self.page.is_visible(CARD_FORM_SELECTOR))
+
+    async def _next_sms(self, sms_session, sms_subscription, last_db_check: float):
+        """(sms_text, waited, last_db_check): DB claim when due, else up to 2s of push wait."""
+        sms_text, waited = None, False
+        if not sms_subscription or time.time() - last_db_check >= SMSBus.DB_FALLBACK_INTERVAL:
+            last_db_check = time.time()
+            claimed_sms = await sync_to_async(SMSCorrelator.claim_from_db)(sms_session)
+            if claimed_sms:
+                sms_text = claimed_sms.message_content
+                logger.info(f"SMS found in DB for {sms_session.key} from {claimed_sms.sender}: {sms_text}")
+        if not sms_text and sms_subscription:
+            waited = True
+            pushed = await asyncio.to_thread(sms_subscription.wait, 2)
+            if pushed:
+                sms_text = await sync_to_async(self._claim_pushed_sms)(pushed, sms_session)
+                if sms_text:
+                    logger.info(f"SMS pushed from {pushed['sender']}: {sms_text}")
+        return sms_text, waited, last_db_check
+
+    async def handle_3d_secure(self, log_callback=None, order_id=None, amount=None) -> (bool, str):
+        logger.info("Handling 3D Secure")
+        sms_session = await sync_to_async(SMSCorrelator.open_session)(
+            order_id=order_id,
+            card=self.card,
+            amount=amount or getattr(self, 'last_selected_price', None)
+        )
+        # Subscribed before anything else so an SMS arriving while the bank page loads is buffered
+        sms_subscription = await asyncio.to_thread(SMSBus.subscribe, session_key=sms_session.key)
+        try:
+            await handle_cookies(self.page)
+
+            timeout_seconds = 300
+            wrapper_selector = iframe_wrapper_selector(self.Maps)
+            frame_selector = iframe_selector(self.Maps)
+            logger.info(f"Waiting for 3D Secure iframe (up to {timeout_seconds}s)...")
+
+            started = time.time()
+            iframe_found = False
+            while time.time() - started < timeout_seconds:
+                if await self.wait_for_selector_step(
+                    'iframe_appear', f"{wrapper_selector}, {frame_selector}", state="attached", budget_ms=5000
+                ):
+                    iframe_found = True
+                    break
+                logger.info(f"Waiting for 3D Secure iframe... ({int(time.time() - started)}s passed)")
+            if not iframe_found:
+                logger.error("Timeout: 3D Secure iframe not found after waiting.")
+                await self.take_screenshot("3d_secure_timeout")
+                return False, "Timeout waiting for 3D Secure Iframe"
+
+            frame_element = await self.page.query_selector(frame_selector)
+            frame = await frame_element.content_frame() if frame_element else None
+            if not frame:
+                logger.error("Iframe found but content_frame() returned None.")
+                return False, "Iframe content inaccessible"
+
+            logger.info("Switched to 3D Secure Frame")
+            await self.take_screenshot("3d_secure_iframe_initial")
+            try:
+                await frame.wait_for_selector('body', timeout=30000)
+            except Exception as e:
+                logger.error(f"Error waiting for frame content: {e}")
+                await self.take_screenshot("3d_secure_frame_empty")
+                return False, f"Frame Content Error: {str(e)}"
+
+            sms_wait_timeout = 300
+            sms_started = time.time()
+            force_submit_attempted = False
+            last_db_check = 0.0
+            announced = 0
+            logger.info("Waiting for SMS Code Entry Screen...")
+            while time.time() - sms_started < sms_wait_timeout:
+                waited = False
+                elapsed = int(time.time() - sms_started)
+                try:
+                    content = await frame.content()
+                    body_text = (await frame.inner_text('body')).strip().replace('\n', ' ')
+
+                    # Empty iframe (the bank form did not post): submit it once from the main page
+                    if len(content) < 100 and not body_text and elapsed > 15 and not force_submit_attempted:
+                        logger.warning("Iframe seems empty/stuck > 15s. Attempting to force submit the form...")
+                        force_submit_attempted = True
+                        form = await self.page.query_selector(THREEDS_FORM_SELECTOR)
+                        if form:
+                            await self.page.evaluate("form => form.submit()", form)
+                            await self.wait_for_event_step('iframe_reload', 'framenavigated')
+                            continue
+                        logger.error("Could not find the 3D Secure form to force submit.")
+
+                    input_visible = False
+                    for sel in SMS_SCREEN_INPUTS:
+                        try:
+                            if await frame.is_visible(sel):
+                                input_visible = True
+                                break
+                        except Exception:
+                            pass
+
+                    if input_visible or is_sms_screen(content):
+                        if elapsed // 10 > announced:
+                            announced = elapsed // 10
+                            logger.info("Screen keywords matched or Input visible. Waiting for SMS...")
+                            await _notify(log_callback, "3DS_WAITING_SMS")
+
+                        sms_text, waited, last_db_check = await self._next_sms(sms_session, sms_subscription, last_db_check)
+                        if sms_text:
+                            await _notify(log_callback, f"3DS_SMS_RECEIVED: {sms_text[:10]}...")
+                            code = sms_code(sms_text)
+                            if code:
+                                logger.info(f"Extracted Code: {code}")
+                                return await self._submit_sms_code(frame_selector, code, log_callback)
+                            logger.warning("SMS found but no 6-digit code extracted.")
+
+                    if not waited:
+                        await asyncio.sleep(2)
+                except Exception as e:
+                    logger.warning(f"Error accessing frame content (Navigation?): {e}")
+                    await asyncio.sleep(1)
+
+            logger.warning("SMS Screen timed out (keywords not found). Taking screenshot.")
+            await self.take_screenshot("3d_secure_sms_timeout")
+            return False, "Timeout waiting for SMS Screen/Keywords"
+        except Exception as e:
+            logger.error(f"3D Secure Error: {e}")
+            logger.error("3D Secure ekranı açılmadı. Ödeme bilgileri hatalı olabilir veya banka reddetti.")
+            await self.take_screenshot("3d_secure_failed_exception")
+            return False, f"Exception: {str(e)}"
+        finally:
+            await sync_to_async(SMSCorrelator.close_session)(sms_session)
+            if sms_subscription:
+                sms_subscription.close()
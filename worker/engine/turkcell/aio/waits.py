@@ -0,0 +1,63 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+
+from ..waits import WaitMixin
+
+logger = logging.getLogger(__name__)
+
+class AsyncWaitMixin(WaitMixin):
+    """
+    WaitMixin for playwright.async_api pages: the same per-step budgets,
+    records and summaries, with awaited waits. Worker cpu in measure_phase is
+    the whole process's, which every order of the async worker shares.
+    """
+
+    async def wait_step(self, step: str, condition, budget_ms: int = None) -> bool:
+        """
+        Awaits condition(timeout_ms), a Playwright wait that raises on timeout.
+        Returns True if the condition was met within the step budget.
+        """
+        budget_ms = budget_ms or self.WAIT_BUDGETS_MS.get(step, 3000)
+        started = time.perf_counter()
+        try:
+            await condition(budget_ms)
+            met = True
+        except Exception:
+            met = False
+        self._record_wait(step, started, budget_ms, met)
+        return met
+
+    async def wait_for_selector_step(self, step: str, selector: str, state: str = "visible", frame=None, budget_ms: int = None) -> bool:
+        target = frame or self.page
+        return await self.wait_step(step, lambda t: target.wait_for_selector(selector, state=state, timeout=t), budget_ms)
+
+    async def wait_for_function_step(self, step: str, expression: str, arg=None, frame=None, budget_ms: int = None) -> bool:
+        target = frame or self.page
+        return await self.wait_step(
+            step,
+            lambda t: target.wait_for_function(expression, arg=arg, timeout=t, polling="raf"),
+            budget_ms
+        )
+
+    async def wait_for_event_step(self, step: str, event: str, budget_ms: int = None) -> bool:
+        return await self.wait_step(step, lambda t: self.page.wait_for_event(event, timeout=t), budget_ms)
+
+    async def _browser_task_seconds(self):
+        try:
+            if getattr(self, '_cdp_session', None) is None:
+                self._cdp_session = await self.page.context.new_cdp_session(self.page)
+                await self._cdp_session.send("Performance.enable")
+            metrics = (await self._cdp_session.send("Performance.getMetrics"))["metrics"]
+            return next((m["value"] for m in metrics if m["name"] == "TaskDuration"), None)
+        except Exception:
+            self._cdp_session = False
+            return None
+
+    @asynccontextmanager
+    async def measure_phase(self, phase: str, **labels):
+        marks = self._phase_marks(await self._browser_task_seconds())
+        try:
+            yield
+        finally:
+            self._record_phase(phase, marks, await self._browser_task_seconds(), labels)
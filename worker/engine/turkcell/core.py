@@ -12,11 +12,25 @@ from .navigator import NavigatorMixin
 from .scraper import ScraperMixin
 from .payment import PaymentMixin
 from .security import SecurityMixin
+from .waits import WaitMixin
+from .network_catalog import NetworkCatalog
 
 logger = logging.getLogger(__name__)
 
-class TurkcellOperator(NavigatorMixin, ScraperMixin, PaymentMixin, SecurityMixin, BaseOperator):
+class TurkcellOperator(NavigatorMixin, ScraperMixin, PaymentMixin, SecurityMixin, WaitMixin, BaseOperator):
     BASE_URL = "https://www.turkcell.com.tr/yukle/tl-yukle"
+    # Key of this operator's entries in the shared package catalog
+    CATALOG_NAME = "turkcell"
+
+    ROUTING_PROFILE = {
+        **BaseOperator.ROUTING_PROFILE,
+        # Images/fonts are only dropped on Turkcell's own hosts, never on the bank's 3DS page
+        'type_block_domains': ['turkcell.com.tr'],
+        # OneTrust serves the consent banner that handle_cookies clicks
+        'allow_domains': ['cookielaw.org', 'onetrust.com'],
+        # The captcha normally arrives inline as base64, keep it if it is ever served by URL
+        'allow_url_patterns': ['captcha'],
+    }
 
     @property
     def Maps(self) -> Dict[str, str]:
@@ -60,10 +74,20 @@ class TurkcellOperator(NavigatorMixin, ScraperMixin, PaymentMixin, SecurityMixin
             "iframe_name": 'three-d-iframe'
         }
 
-    def __init__(self, page: Page, card=None):
+    def __init__(self, page: Page, card=None, clear_debug: bool = True):
         super().__init__(page, card)
+        self.wait_timings = []
+        self.phase_timings = []
+        self.screenshots_taken = 0
         self.captcha_solver = CaptchaSolver()
-        self.cleanup_debug_output()
+        self.captcha_tickets = []
+        # Optional: build the package catalog from the listing XHRs instead of the DOM
+        self.network_catalog = None
+        if os.getenv('TURKCELL_NETWORK_CATALOG', 'False') == 'True':
+            self.network_catalog = NetworkCatalog(page)
+        # Standby pages are built between (and next to) running orders, whose debug files must survive
+        if clear_debug:
+            self.cleanup_debug_output()
 
     def cleanup_debug_output(self):
         """Clears the debug_output directory."""
@@ -78,6 +102,7 @@ class TurkcellOperator(NavigatorMixin, ScraperMixin, PaymentMixin, SecurityMixin
     def take_screenshot(self, name: str):
         try:
             path = f"debug_output/{name}.png"
+            self.screenshots_taken += 1
             self.page.screenshot(path=path)
             logger.info(f"Screenshot saved: {path}")
         except Exception as e:
@@ -0,0 +1,246 @@
+import re
+import difflib
+import logging
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+NUMBER_RE = re.compile(r'\d+')
+
+
+def match_score(package_id: str, title_text: str) -> float:
+    """
+    Reference scorer: how well package_id matches title_text, 0.0 to 1.0.
+    PackageMatchIndex must return exactly the same scores.
+    """
+    if not package_id or not title_text:
+        return 0.0
+
+    pid_clean = package_id.lower().strip()
+    title_clean = title_text.lower().strip()
+
+    # 1. Exact match
+    if pid_clean == title_clean:
+        return 1.0
+
+    # 2. Clean match (remove completely excessive spaces)
+    pid_nospace = pid_clean.replace(" ", "")
+    title_nospace = title_clean.replace(" ", "")
+
+    if pid_nospace == title_nospace:
+        return 1.0
+
+    # Number Guard: Ensure numeral quantities actually match to prevent "1GB" matching "11GB" if "1GB" was just a word.
+    pid_nums = set(NUMBER_RE.findall(pid_clean))
+    title_nums = set(NUMBER_RE.findall(title_clean))
+
+    # If the requested package has numbers, at least one must intersect
+    if pid_nums and not pid_nums.intersection(title_nums):
+        return 0.0
+
+    # 3. Substring match (If the letters are exactly inside the other)
+    # Give higher penalty if title is inside pid, because title is too generic for the query
+    if pid_nospace in title_nospace:
+        return 0.95
+    if title_nospace in pid_nospace:
+        return 0.90
+
+    # 4. Fuzzy match (Tolerates abbreviations like "Dk" vs "Dakika")
+    pid_no_brand = pid_clean.replace("turkcell", "").replace("gnç", "").strip()
+
+    ratio = difflib.SequenceMatcher(None, pid_no_brand, title_clean).ratio()
+    ratio_orig = difflib.SequenceMatcher(None, pid_clean, title_clean).ratio()
+
+    return max(ratio, ratio_orig)
+
+
+def _trigrams(text: str) -> set:
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Query:
+    __slots__ = ('raw', 'clean', 'nospace', 'nums', 'no_brand')
+
+    def __init__(self, text: str):
+        self.raw = text
+        self.clean = text.lower().strip() if text else ''
+        self.nospace = self.clean.replace(" ", "")
+        self.nums = set(NUMBER_RE.findall(self.clean))
+        self.no_brand = self.clean.replace("turkcell", "").replace("gnç", "").strip()
+
+
+class _Entry:
+    __slots__ = ('name', 'clean', 'nospace', 'nums', 'matcher')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.clean = name.lower().strip() if name else ''
+        self.nospace = self.clean.replace(" ", "")
+        self.nums = set(NUMBER_RE.findall(self.clean))
+        # seq2 is the title in match_score; SequenceMatcher caches its index of seq2,
+        # so every query against this title reuses it via set_seq1
+        self.matcher = difflib.SequenceMatcher(None, '', self.clean)
+
+
+class PackageMatchIndex:
+    """
+    Match index over one catalog snapshot (a list of package names).
+
+    Names are normalised once, numbers and trigrams go into inverted indexes.
+    best() narrows the candidates with the number guard, scores the
+    trigram-closest names first and skips a fuzzy comparison whenever the
+    SequenceMatcher upper bounds show it cannot beat the current best.
+    Scores and the chosen name are identical to looping match_score over the
+    names in order (first name wins ties, as in select_package).
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.entries = [_Entry(name) for name in self.names]
+        self._by_number = {}
+        self._by_nospace = {}
+        self._by_trigram = {}
+        # (API kontor code, search texts) -> (score, index) resolved on this snapshot
+        self._code_cache = {}
+
+        for i, entry in enumerate(self.entries):
+            if not entry.clean:
+                continue
+            self._by_nospace.setdefault(entry.nospace, []).append(i)
+            for num in entry.nums:
+                self._by_number.setdefault(num, set()).add(i)
+            for gram in _trigrams(entry.nospace):
+                self._by_trigram.setdefault(gram, set()).add(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _cheap_score(self, query: _Query, entry: _Entry):
+        """Score if decided without difflib, else None."""
+        if not query.raw or not entry.name:
+            return 0.0
+        if query.clean == entry.clean or query.nospace == entry.nospace:
+            return 1.0
+        if query.nums and not query.nums.intersection(entry.nums):
+            return 0.0
+        if query.nospace in entry.nospace:
+            return 0.95
+        if entry.nospace in query.nospace:
+            return 0.90
+        return None
+
+    def _fuzzy_score(self, query: _Query, entry: _Entry, must_beat: float, strict: bool):
+        """
+        max(ratio(no_brand), ratio(clean)) as in match_score, or None if the
+        SequenceMatcher upper bounds prove it cannot beat must_beat
+        (or reach it, when strict is False).
+        """
+        def wins(value):
+            return value > must_beat or (not strict and value == must_beat)
+
+        matcher = entry.matcher
+        best = None
+        for seq in (query.no_brand, query.clean):
+            matcher.set_seq1(seq)
+            # real_quick_ratio >= quick_ratio >= ratio
+            if not wins(matcher.real_quick_ratio()) or not wins(matcher.quick_ratio()):
+                continue
+            ratio = matcher.ratio()
+            if wins(ratio) and (best is None or ratio > best):
+                best = ratio
+        return best
+
+    def score(self, query_text: str, index: int) -> float:
+        """match_score(query_text, names[index]) using the precomputed entry."""
+        query = _Query(query_text)
+        entry = self.entries[index]
+        cheap = self._cheap_score(query, entry)
+        if cheap is not None:
+            return cheap
+        return self._fuzzy_score(query, entry, 0.0, False) or 0.0
+
+    def _candidates(self, query: _Query):
+        """Indexes that can score above 0.0, trigram-closest first."""
+        if not query.raw:
+            return []
+        if query.nums:
+            pool = set()
+            for num in query.nums:
+                pool |= self._by_number.get(num, set())
+            # nospace equality scores 1.0 before the number guard applies
+            pool.update(self._by_nospace.get(query.nospace, []))
+        else:
+            pool = None
+
+        overlap = Counter()
+        for gram in _trigrams(query.nospace):
+            for i in self._by_trigram.get(gram, ()):
+                if pool is None or i in pool:
+                    overlap[i] += 1
+
+        ordered = sorted(overlap, key=lambda i: (-overlap[i], i))
+        remaining = (pool if pool is not None else range(len(self.entries)))
+        ordered.extend(sorted(i for i in remaining if i not in overlap))
+        return ordered
+
+    def best(self, search_texts, min_score: float = 0.0):
+        """
+        (score, index) of the best name for any of search_texts, (0.0, None)
+        if nothing scores above 0.0 or the best is below min_score.
+        """
+        queries = [_Query(text) for text in search_texts]
+        best_score, best_rank = 0.0, None
+
+        for qi, query in enumerate(queries):
+            for i in self._candidates(query):
+                rank = (i, qi)
+                # Equal scores only win with an earlier rank (card-major, query-minor order)
+                strict = best_rank is None or rank > best_rank
+                entry = self.entries[i]
+
+                score = self._cheap_score(query, entry)
+                if score is None:
+                    score = self._fuzzy_score(query, entry, best_score, strict)
+                    if score is None:
+                        continue
+
+                if score > best_score or (not strict and score == best_score and score > 0):
+                    best_score, best_rank = score, rank
+
+        if best_rank is None or best_score < min_score:
+            return 0.0, None
+        return best_score, best_rank[0]
+
+    def resolve_code(self, code: str, search_texts, min_score: float = 0.75):
+        """best() memoised per API kontor code for the lifetime of this snapshot."""
+        if not code:
+            return self.best(search_texts, min_score=min_score)
+        # The texts are part of the key: a renamed panel package must not hit a stale entry
+        key = (code, tuple(search_texts), min_score)
+        if key not in self._code_cache:
+            self._code_cache[key] = self.best(search_texts, min_score=min_score)
+        return self._code_cache[key]
+
+
+_snapshot_indexes = OrderedDict()
+SNAPSHOT_CACHE_SIZE = 4
+
+
+def index_for_snapshot(key, names) -> PackageMatchIndex:
+    """
+    PackageMatchIndex for a catalog snapshot, built once per key
+    (e.g. catalog key + version) and kept in a small LRU.
+    """
+    index = _snapshot_indexes.get(key)
+    if index is not None:
+        _snapshot_indexes.move_to_end(key)
+        return index
+
+    index = PackageMatchIndex(names)
+    _snapshot_indexes[key] = index
+    while len(_snapshot_indexes) > SNAPSHOT_CACHE_SIZE:
+        _snapshot_indexes.popitem(last=False)
+    logger.debug(f"Built package match index for {key} ({len(index)} names).")
+    return index
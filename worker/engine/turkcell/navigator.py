@@ -1,36 +1,40 @@
 
-import time
 import logging
 from playwright.sync_api import Page
+from worker.engine.storage_state import save_state
+from .rules import (
+    CONSENT_CHECK_JS, CONSENT_OR_BANNER_JS, PHONE_DIGITS_JS, COOKIE_SELECTORS, COOKIE_BANNER_SELECTOR,
+    UPLOAD_TYPE_FALLBACKS, FOCUSED_JS, CHECKED_JS, PHONE_VALUE_JS, PHONE_CLEARED_JS, PHONE_ERROR_SELECTOR,
+    phone_digits, phone_value, resume_selector
+)
 
 logger = logging.getLogger(__name__)
 
-def handle_cookies(page: Page):
+def handle_cookies(page: Page, state_key: str = 'turkcell'):
     try:
-        # List of potential cookie button selectors
-        selectors = [
-            'button#onetrust-accept-btn-handler',
-            '#onetrust-accept-btn-handler', 
-            '.onetrust-close-btn-handler',
-            'button[class*="cookie-policy-popup__button"]',
-             # Any other generic "Accept" buttons
-            'button:has-text("Kabul Et")',
-            'button:has-text("Tümünü Kabul Et")',
-            'button:has-text("Hepsini Kabul Et")',
-            'button:has-text("Allow All")',
-            'button:has-text("Accept All")',
-            '#onetrust-accept-btn-handler',
-            '.eu-cookie-compliance-default-button',
-            'button[id*="cookie"]',
-            'a:has-text("Kabul Et")'
-        ]
-        
-        for selector in selectors:
+        # Fast path: consent came from the persisted storage state (or was
+        # accepted earlier on this page) and the banner is not back.
+        try:
+            consent = page.evaluate(CONSENT_CHECK_JS)
+            if consent.get('consent') and not consent.get('banner'):
+                return
+            if consent.get('banner'):
+                logger.info("Cookie banner visible, accepting and re-capturing storage state.")
+        except Exception:
+            pass
+
+        for selector in COOKIE_SELECTORS:
             btn = page.query_selector(selector)
             if btn and btn.is_visible():
                 logger.info(f"Found cookie button with selector: {selector}")
                 btn.click()
-                time.sleep(0.5)
+                # Wait for the banner to go away instead of a fixed sleep
+                try:
+                    page.wait_for_selector(COOKIE_BANNER_SELECTOR, state='hidden', timeout=2000)
+                except Exception:
+                    pass
+                # Persist consent so new contexts skip the banner entirely
+                save_state(state_key, page.context)
                 return # Clicked one, assume handled
     except:
         pass
@@ -42,8 +46,11 @@ class NavigatorMixin:
 
     def navigate_to_base_url(self):
         logger.info(f"Navigating to {self.BASE_URL}")
-        self.page.goto(self.BASE_URL)
-        time.sleep(2) # Wait for banner
+        self.page.goto(self.BASE_URL, wait_until="domcontentloaded")
+        # Form is rendered once the upload type radios exist
+        self.wait_for_selector_step('form_ready', self.Maps["radio_package"], state="attached")
+        # Banner script loads async: wait until it shows or consent is already stored
+        self.wait_for_function_step('cookie_banner', CONSENT_OR_BANNER_JS)
         handle_cookies(self.page)
 
     def select_upload_type(self, upload_type: str = "Package"):
@@ -59,26 +66,48 @@ class NavigatorMixin:
              
              # Click logic... force=True usually works for hidden radios
              self.page.click(target_radio, force=True)
-             time.sleep(1)
              
-             # Fallback: check if the correct type is actually selected? 
-             # Visual check might be hard without screenshots, assuming click worked.
+             # Wait until the radio actually reports checked
+             if not self.wait_for_function_step('upload_type_checked', CHECKED_JS, arg=target_radio):
+                 logger.warning(f"Upload type radio {upload_type} not reported as checked, continuing.")
         except Exception as e:
              logger.error(f"Failed to select upload type {upload_type}: {e}")
-             # try fallback by text?
-             if upload_type == "TL":
+             # try fallback by text
+             for text_selector in UPLOAD_TYPE_FALLBACKS.get(upload_type, []):
                  try:
-                     self.page.click('text="TL Yükle"', timeout=2000)
-                 except:
+                     self.page.click(text_selector, timeout=2000)
+                     break
+                 except Exception:
                      pass
-             elif upload_type == "Package":
-                 try:
-                     self.page.click('text="Paket Yükle"', timeout=2000)
-                 except:
-                     try:
-                         self.page.click('text="Paketler"', timeout=2000)
-                     except:
-                         pass
+
+    def prepare_standby(self, upload_type: str = "Package") -> bool:
+        """
+        Leaves the page on tl-yukle with cookies accepted and the upload type
+        selected, ready for fill_phone. Used by the browser pool's standby pages.
+        """
+        logger.info(f"Preparing standby page ({upload_type})")
+        self.navigate_to_base_url()
+        self.select_upload_type(upload_type)
+        try:
+            self.page.wait_for_selector(self.Maps["phone_input"], state="visible", timeout=10000)
+            return True
+        except Exception as e:
+            logger.warning(f"Standby page not ready, phone input missing: {e}")
+            return False
+
+    def can_resume_at(self, step: str) -> bool:
+        """True if the page (a parked session) can go on from step without navigation and captcha."""
+        selector = resume_selector(self.Maps, step)
+        if not selector or self.page.is_closed():
+            return False
+        try:
+            if step == 'pay' and self.page.query_selector(self.Maps["iframe_wrapper"]):
+                # The payment already went on to 3DS, the form cannot be submitted again
+                return False
+            return self.page.locator(selector).first.is_visible()
+        except Exception as e:
+            logger.warning(f"Parked session not usable at '{step}': {e}")
+            return False
 
     def fill_phone(self, phone_number: str):
         logger.info(f"Filling phone number: {phone_number}")
@@ -89,31 +118,34 @@ class NavigatorMixin:
         # Click to focus and activate mask
         self.page.click(self.Maps["phone_input"])
         
-        # Wait for mask JS to initialize
-        time.sleep(0.5)
+        # Wait for mask JS to take focus
+        self.wait_for_function_step('phone_focus', FOCUSED_JS, arg=self.Maps["phone_input"])
         
         # Clean number first (remove leading 0 or +90 if present)
         # Also remove leading '5' because the mask is 0(5__) and '5' is pre-filled.
-        clean_number = phone_number.replace("+90", "").replace(" ", "").lstrip("0")
-        if clean_number.startswith("5"):
-            clean_number = clean_number[1:]
+        clean_number = phone_digits(phone_number)
         
         logger.info(f"Typing clean number (without prefix): {clean_number}")
-        self.page.keyboard.type(clean_number, delay=150) # Slower typing for mask
+        # Type digit by digit, waiting for the mask to accept each one instead of a fixed delay
+        base_digits = len(''.join(ch for ch in self.page.input_value(self.Maps["phone_input"]) if ch.isdigit()))
+        for typed, digit in enumerate(clean_number, start=1):
+            self.page.keyboard.type(digit)
+            self.wait_for_function_step('phone_digit', PHONE_DIGITS_JS, arg=[self.Maps["phone_input"], base_digits + typed])
         
-        time.sleep(1)
+        # Mask has settled once the full number is visible in the value
+        self.wait_for_function_step('phone_value', PHONE_VALUE_JS, arg=[self.Maps["phone_input"], clean_number])
         
         # Validation
         max_attempts = 2
         for attempt in range(max_attempts):
             # Check value
             input_val = self.page.input_value(self.Maps["phone_input"])
-            clean_val = input_val.replace(" ", "").replace("(", "").replace(")", "")
+            clean_val = phone_value(input_val)
             
             logger.info(f"Input Value: {input_val} (Clean: {clean_val}) - Expected: {clean_number}")
             
             # Check for immediate error
-            error_el = self.page.query_selector('.molecule-masked-input_maskedInput__errorText__3q3B7') # Generic error selector guess or specific if known
+            error_el = self.page.query_selector(PHONE_ERROR_SELECTOR)
             if error_el and error_el.is_visible():
                 logger.warning(f"Phone Error visible: {error_el.inner_text()}")
             
@@ -123,8 +155,8 @@ class NavigatorMixin:
             else:
                 logger.warning(f"Phone mismatch! Retrying... Attempt {attempt+1}")
                 self.page.fill(self.Maps["phone_input"], "") # Clear
-                time.sleep(0.5)
-        if self.page.input_value(self.Maps["phone_input"]).replace(" ", "").replace("(", "").replace(")", "").endswith(clean_number):
+                self.wait_for_function_step('phone_cleared', PHONE_CLEARED_JS, arg=[self.Maps["phone_input"], clean_number])
+        if phone_value(self.page.input_value(self.Maps["phone_input"])).endswith(clean_number):
              logger.info("Phone number entered correctly.")
         else:
              logger.error("Failed to verify phone number entry.")
@@ -0,0 +1,163 @@
+import json
+import logging
+
+from .rules import parse_price
+
+logger = logging.getLogger(__name__)
+
+# Keys the package listing payloads use for the fields we need. The walker
+# below accepts any list of dicts that has one name key and one price key.
+NAME_KEYS = ('name', 'title', 'packageName', 'offerName', 'displayName', 'productName')
+PRICE_KEYS = ('price', 'salePrice', 'discountedPrice', 'amount', 'fee', 'priceValue', 'totalPrice')
+PRICE_VALUE_KEYS = ('value', 'amount', 'price', 'text')
+CATEGORY_KEYS = ('categoryName', 'category', 'tabName', 'groupName', 'title', 'name')
+
+MAX_BODY_BYTES = 2 * 1024 * 1024
+
+
+def _price_of(value) -> float:
+    """Price from a number, a '149,90 TL' string or a {'value': ...} object."""
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return parse_price(value)
+    if isinstance(value, dict):
+        for key in PRICE_VALUE_KEYS:
+            if key in value:
+                price = _price_of(value[key])
+                if price:
+                    return price
+    return 0.0
+
+
+def _first(item: dict, keys):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def _package_record(item, category: str):
+    if not isinstance(item, dict):
+        return None
+    name = _first(item, NAME_KEYS)
+    if not isinstance(name, str) or not name.strip():
+        return None
+    price = _price_of(_first(item, PRICE_KEYS))
+    if price <= 0:
+        return None
+
+    item_category = item.get('categoryName') or item.get('category')
+    if isinstance(item_category, dict):
+        item_category = _first(item_category, CATEGORY_KEYS)
+    return {
+        'category': str(item_category or category or 'Paketler').strip(),
+        'name': name.strip(),
+        'package_id': name.strip(),
+        'price': price,
+    }
+
+
+def extract_packages(payload, category: str = None, depth: int = 0) -> list:
+    """
+    Walks a JSON payload and returns the package records it contains.
+    A list counts as a package list when most of its dicts carry a name and a
+    price; the category comes from the item itself or from the closest parent
+    object that has a title/name. Returns [] for unknown shapes.
+    """
+    if depth > 8:
+        return []
+
+    records = []
+    if isinstance(payload, list):
+        dicts = [item for item in payload if isinstance(item, dict)]
+        parsed = [_package_record(item, category) for item in dicts]
+        hits = [r for r in parsed if r]
+        if dicts and len(hits) * 2 >= len(dicts):
+            return hits
+        for item in dicts:
+            records.extend(extract_packages(item, category, depth + 1))
+    elif isinstance(payload, dict):
+        label = _first(payload, CATEGORY_KEYS)
+        own_category = label.strip() if isinstance(label, str) and label.strip() else category
+        for key, value in payload.items():
+            if isinstance(value, (list, dict)):
+                records.extend(extract_packages(value, own_category, depth + 1))
+    return records
+
+
+class NetworkCatalog:
+    """
+    Listens to page responses and builds the package catalog from the JSON
+    payloads the Turkcell frontend fetches after the captcha, so scraping does
+    not have to click through the tabs.
+
+    The response handler only queues candidate responses (xhr/fetch with a
+    JSON content type); bodies are read and parsed when packages() is called.
+    The frontend may fetch the listing one tab at a time, so callers compare
+    categories() with the page's tabs before trusting the capture.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._pending = []
+        self._records = {}
+        self.payloads_seen = 0
+        self.payloads_matched = 0
+        page.on("response", self._on_response)
+
+    def is_candidate(self, response) -> bool:
+        try:
+            if response.request.resource_type not in ('xhr', 'fetch'):
+                return False
+            if response.status != 200:
+                return False
+            return 'json' in (response.headers.get('content-type') or '')
+        except Exception:
+            return False
+
+    def _on_response(self, response):
+        if self.is_candidate(response):
+            self._pending.append(response)
+
+    def _parse_pending(self):
+        pending, self._pending = self._pending, []
+        for response in pending:
+            try:
+                body = response.body()
+                if len(body) > MAX_BODY_BYTES:
+                    continue
+                payload = json.loads(body)
+            except Exception as e:
+                logger.debug(f"Network catalog: could not read {response.url}: {e}")
+                continue
+
+            self.payloads_seen += 1
+            records = extract_packages(payload)
+            if not records:
+                keys = list(payload.keys())[:8] if isinstance(payload, dict) else type(payload).__name__
+                logger.debug(f"Network catalog: no packages in {response.url} (keys: {keys})")
+                continue
+
+            self.payloads_matched += 1
+            logger.info(f"Network catalog: {len(records)} packages from {response.url}")
+            for record in records:
+                self._records[(record['category'], record['name'])] = record
+
+    def packages(self):
+        """Packages captured so far, or None if no listing payload was recognised."""
+        self._parse_pending()
+        if not self._records:
+            return None
+        return list(self._records.values())
+
+    def categories(self) -> set:
+        """Categories (tabs) the captured packages cover."""
+        self._parse_pending()
+        return {category for category, _ in self._records}
+
+    def has_pending(self) -> bool:
+        return bool(self._pending)
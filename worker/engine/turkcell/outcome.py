@@ -0,0 +1,176 @@
+import time
+import logging
+import itertools
+
+from .rules import (
+    SUCCESS_KEYWORDS, ERROR_KEYWORDS, PAGE_FAILED_KEYWORDS, FRAME_SUCCESS_KEYWORDS, FRAME_FAILURE_KEYWORDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Installed once per document. A MutationObserver re-checks the matchers
+# (debounced) whenever the DOM changes and reports through the exposed binding;
+# nothing is polled or serialized from Python.
+OBSERVER_JS = """
+(cfg) => {
+    const flag = '__watch_' + cfg.binding;
+    if (window[flag]) return false;
+    window[flag] = true;
+
+    let done = false, closedSent = false, scheduled = false;
+    const signal = (outcome, reason, text, final = true) => {
+        if (done) return;
+        if (final) done = true;
+        window[cfg.binding]({outcome, reason, scope: cfg.scope, final, text: (text || '').trim().slice(0, 300)});
+    };
+    const has = (text, list) => list.some(k => text.includes(k));
+    const visible = el => !!el && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+
+    const check = () => {
+        scheduled = false;
+        if (done || !document.body) return;
+        const text = document.body.innerText || '';
+
+        if (cfg.scope === 'frame') {
+            const lower = text.toLowerCase();
+            if (has(text, cfg.frameSuccess)) return signal('success', 'frame_success', text);
+            if (lower.includes('limit') && (lower.includes('yetersiz') || lower.includes('yeterli değil')))
+                return signal('limit', 'frame_limit', text);
+            if (has(text, cfg.frameFailure)) return signal('failure', 'frame_failure', text);
+            return;
+        }
+
+        const modal = document.querySelector(cfg.modalSelector);
+        if (visible(modal)) return signal('modal', 'error_modal', modal.innerText);
+
+        const open = document.querySelector(cfg.iframeSelector) || document.querySelector(cfg.wrapperSelector);
+        if (!open) {
+            if (has(text, cfg.success)) return signal('success', 'page_success', text);
+            if (has(text, cfg.error)) return signal('failure', 'page_error', text);
+            if (!closedSent) {
+                closedSent = true;
+                signal('closed', 'iframe_closed', '', false);
+            }
+        }
+        if (has(text, cfg.pageFailed)) return signal('failure', 'page_failed', text);
+    };
+
+    new MutationObserver(() => {
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(check, cfg.debounceMs);
+        }
+    }).observe(document.documentElement, {childList: true, subtree: true, characterData: true, attributes: true});
+    check();
+    return true;
+}
+"""
+
+MATCHES_JS = "(el, selector) => el.matches(selector)"
+
+_binding_ids = itertools.count(1)
+
+
+class ThreeDSOutcomeDetector:
+    """
+    Waits for the result of a submitted 3DS code without polling.
+
+    Keyword matchers are installed once in the main page and in the bank
+    frames (re-installed when a frame navigates) and report the first
+    decisive signal through an exposed binding. Only frames that sit inside
+    the 3DS iframe (iframe_selector) get the frame matchers; other frames
+    (chat widgets, ads) could show "Başarılı"/"Hata" and are not watched.
+    wait() only pumps Playwright events in short ticks until a signal arrived.
+    """
+
+    def __init__(self, page, iframe_selector: str, wrapper_selector: str,
+                 modal_selector: str = '.ant-modal-body', debounce_ms: int = 100):
+        self.page = page
+        self.binding = f"__tdsOutcome{next(_binding_ids)}"
+        self.config = {
+            'binding': self.binding,
+            'iframeSelector': iframe_selector,
+            'wrapperSelector': wrapper_selector,
+            'modalSelector': modal_selector,
+            'success': SUCCESS_KEYWORDS,
+            'error': ERROR_KEYWORDS,
+            'pageFailed': PAGE_FAILED_KEYWORDS,
+            'frameSuccess': FRAME_SUCCESS_KEYWORDS,
+            'frameFailure': FRAME_FAILURE_KEYWORDS,
+            'debounceMs': debounce_ms,
+        }
+        self.outcome = None
+        self.closed_at = None
+        self.signals = []
+        self._pending_frames = []
+        self.installs = 0
+        self._attach()
+
+    def _attach(self):
+        self.page.expose_binding(self.binding, self._on_signal)
+        self.page.on("framenavigated", self._on_navigated)
+        self._pending_frames.extend(self.page.frames)
+
+    def _on_signal(self, source, payload):
+        self.signals.append(payload)
+        logger.info(f"3DS outcome signal: {payload['outcome']} ({payload['reason']}, {payload['scope']})")
+        if not payload.get('final'):
+            if payload['outcome'] == 'closed' and self.closed_at is None:
+                self.closed_at = time.perf_counter()
+            return
+        if self.outcome is None:
+            self.outcome = payload
+
+    def _on_navigated(self, frame):
+        # Evaluating from inside an event handler is not safe, install on the next tick
+        self._pending_frames.append(frame)
+
+    def _in_3ds_iframe(self, frame) -> bool:
+        """True if the frame's element, or one of its ancestor frames' elements, is the 3DS iframe."""
+        while frame.parent_frame:
+            element = frame.frame_element()
+            try:
+                if element.evaluate(MATCHES_JS, self.config['iframeSelector']):
+                    return True
+            finally:
+                element.dispose()
+            frame = frame.parent_frame
+        return False
+
+    def _install_pending(self):
+        pending, self._pending_frames = self._pending_frames, []
+        for frame in pending:
+            scope = 'page' if frame == self.page.main_frame else 'frame'
+            try:
+                if frame.is_detached():
+                    continue
+                if scope == 'frame' and not self._in_3ds_iframe(frame):
+                    logger.debug(f"3DS outcome: not watching {frame.url[:60]}, outside the 3DS iframe")
+                    continue
+                if frame.evaluate(OBSERVER_JS, dict(self.config, scope=scope)):
+                    self.installs += 1
+            except Exception as e:
+                logger.debug(f"3DS outcome: could not watch frame {frame.url[:60]}: {e}")
+
+    def wait(self, timeout_s: float, closed_grace_ms: int = 3000, tick_ms: int = 200):
+        """
+        The first decisive signal as {'outcome', 'reason', 'scope', 'text'};
+        {'outcome': 'closed'} if the iframe closed and no result text showed up
+        within closed_grace_ms; None on timeout.
+        """
+        deadline = time.perf_counter() + timeout_s
+        while time.perf_counter() < deadline:
+            self._install_pending()
+            if self.outcome:
+                return self.outcome
+            if self.closed_at and (time.perf_counter() - self.closed_at) * 1000 >= closed_grace_ms:
+                return {'outcome': 'closed', 'reason': 'no_result_text', 'scope': 'page', 'text': ''}
+            # Pumps the binding / navigation events while waiting
+            self.page.wait_for_timeout(tick_ms)
+        return None
+
+    def close(self):
+        try:
+            self.page.remove_listener("framenavigated", self._on_navigated)
+        except Exception:
+            pass
@@ -1,6 +1,10 @@
 
 import time
 import logging
+from .rules import (
+    SET_SELECT_JS, CCV_SELECTOR, AGREEMENT_WRAPPER_SELECTOR, AGREEMENT_CHECKED_CLASS, CHECKBOX_SELECTOR,
+    FORM_ERROR_SELECTOR, CLICK_JS, card_expiry, payment_submitted_selector
+)
 
 logger = logging.getLogger(__name__)
 
@@ -27,16 +31,7 @@ class PaymentMixin:
             # Expiry
             # Ensure correct format (MM and YYYY)
             try:
-                # Month: Ensure 2 digits (e.g. "1" -> "01")
-                month_val = str(self.card.exp_month).strip()
-                if len(month_val) == 1:
-                    month_val = f"0{month_val}"
-                
-                # Year: Ensure 4 digits (e.g. "26" -> "2026")
-                year_val = str(self.card.exp_year).strip()
-                if len(year_val) == 2:
-                    year_val = f"20{year_val}"
-                
+                month_val, year_val = card_expiry(self.card)
                 logger.info(f"Selecting expiry: {month_val}/{year_val}")
                 
                  # Try 1: Standard Select
@@ -49,21 +44,8 @@ class PaymentMixin:
                 # Try 2: Force JS Update (Best for hidden native selects)
                 # Dispatch events to notify React/Angular
                 # Note: evaluate passes the second argument as a single object/list to the function.
-                js_script = """
-                ([selector, value]) => {
-                    const el = document.querySelector(selector);
-                    if (el) {
-                        el.value = value;
-                        el.dispatchEvent(new Event('change', { bubbles: true }));
-                        el.dispatchEvent(new Event('input', { bubbles: true }));
-                        el.dispatchEvent(new Event('blur', { bubbles: true }));
-                        return true;
-                    }
-                    return false;
-                }
-                """
-                self.page.evaluate(js_script, [self.Maps["exp_month"], month_val])
-                self.page.evaluate(js_script, [self.Maps["exp_year"], year_val])
+                self.page.evaluate(SET_SELECT_JS, [self.Maps["exp_month"], month_val])
+                self.page.evaluate(SET_SELECT_JS, [self.Maps["exp_year"], year_val])
                 
                 logger.info("Expiry selection executed via JS")
                 
@@ -71,8 +53,7 @@ class PaymentMixin:
                 logger.warning(f"Expiry selection failed: {e}")
 
             # CVV
-            # Map says input[name="ccv"]
-            self.page.fill('input[name="ccv"]', self.card.cvv)
+            self.page.fill(CCV_SELECTOR, self.card.cvv)
             
             # Screenshot: Card details filled
             self.take_screenshot("card_details_filled")
@@ -80,26 +61,24 @@ class PaymentMixin:
             # Agreement
             try:
                 # User warned that clicking text opens a modal. verification: check the checkbox wrapper directly.
-                # Selector from user snippet: .ant-checkbox-wrapper
                 # We can also try to force check the input
-                
-                checkbox_wrapper = self.page.query_selector('.ant-checkbox-wrapper')
+                checkbox_wrapper = self.page.query_selector(AGREEMENT_WRAPPER_SELECTOR)
                 if checkbox_wrapper:
                     # Check if already checked
-                    if "ant-checkbox-wrapper-checked" not in checkbox_wrapper.get_attribute("class"):
+                    if AGREEMENT_CHECKED_CLASS not in (checkbox_wrapper.get_attribute("class") or ""):
                         checkbox_wrapper.click()
                         logger.info("Clicked agreement checkbox wrapper")
                     else:
                         logger.info("Agreement checkbox already checked")
                 else:
                     # Fallback
-                    self.page.check('input[type="checkbox"]')
+                    self.page.check(CHECKBOX_SELECTOR)
                     logger.info("Checked agreement checkbox input")
                     
             except Exception as e:
                 logger.warning(f"Agreement checkbox click failed: {e}. Trying generic checkbox.")
                 # Fallback
-                self.page.click('input[type="checkbox"]')
+                self.page.click(CHECKBOX_SELECTOR)
 
             # Screenshot: After agreement checkbox
             self.take_screenshot("agreement_checkbox_done")
@@ -108,17 +87,15 @@ class PaymentMixin:
             # Wait for button to be enabled (it might be disabled until checkbox is checked)
             self.page.wait_for_selector(self.Maps["submit_payment"], state="visible")
             # Smart wait for button to become enabled
-            try:
-                self.page.wait_for_function(f"document.querySelector('{self.Maps['submit_payment']}').disabled == false", timeout=2000)
-            except:
-                self.page.wait_for_timeout(1000) # Fallback
-            
             submit_btn = self.page.locator(self.Maps["submit_payment"])
+            wait_enabled = lambda t: submit_btn.element_handle(timeout=t).wait_for_element_state("enabled", timeout=t)
+            self.wait_step('payment_submit_enabled', wait_enabled)
+            
             if submit_btn.is_disabled():
                  logger.warning("Submit button is disabled! Checkbox might not be checked.")
                  # Try forcing checkbox again
-                 self.page.click('.ant-checkbox-wrapper') 
-                 self.page.wait_for_timeout(500)
+                 self.page.click(AGREEMENT_WRAPPER_SELECTOR)
+                 self.wait_step('payment_submit_enabled', wait_enabled)
             
             # Double check enabling
             if submit_btn.is_disabled():
@@ -132,17 +109,17 @@ class PaymentMixin:
                 submit_btn.click(timeout=3000)
             except Exception as e:
                 logger.warning(f"Standard click failed: {e}. Trying JS click.")
-                self.page.evaluate("arguments[0].click();", submit_btn.element_handle())
+                self.page.evaluate(CLICK_JS, submit_btn.element_handle())
             
             # 2. Validation: Did we move to 3D secure or is there a loading indicator?
-            # Wait for potential loader or iframe or disappearance of button
-            self.page.wait_for_timeout(2000)
+            # Wait for the 3DS iframe/wrapper or a form error, whichever comes first
+            self.wait_for_selector_step('payment_submitted', payment_submitted_selector(self.Maps), state="attached")
             
             # Screenshot: After submit clicked, before 3D secure
             self.take_screenshot("after_payment_submit")
             
             # Check for error on payment page
-            error_el = self.page.query_selector('.ant-form-item-explain-error')
+            error_el = self.page.query_selector(FORM_ERROR_SELECTOR)
             if error_el and error_el.is_visible():
                 logger.error(f"Payment Form Error: {error_el.inner_text()}")
                 self.take_screenshot("payment_form_error")
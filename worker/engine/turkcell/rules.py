@@ -0,0 +1,542 @@
+import re
+import logging
+
+from .matching import PackageMatchIndex
+
+logger = logging.getLogger(__name__)
+
+# Selectors, keyword lists and the decisions made on what the page returned,
+# shared by the sync mixins and their playwright.async_api ports (aio/).
+# Only the Playwright calls differ between the two engines.
+
+# --- Navigation -------------------------------------------------------------
+
+# Resolves once the consent cookie exists or the OneTrust banner is on screen
+CONSENT_OR_BANNER_JS = """
+() => {
+    if (document.cookie.indexOf('OptanonAlertBoxClosed') !== -1) return true;
+    const banner = document.querySelector('#onetrust-banner-sdk');
+    return !!banner && banner.offsetParent !== null;
+}
+"""
+
+# Resolves once the phone input shows every digit typed so far
+PHONE_DIGITS_JS = """
+([selector, expected]) => {
+    const el = document.querySelector(selector);
+    if (!el) return false;
+    return el.value.replace(/\\D/g, '').length >= expected;
+}
+"""
+
+# One roundtrip: is the consent cookie there, and is the OneTrust banner showing anyway?
+CONSENT_CHECK_JS = """
+() => {
+    const banner = document.querySelector('#onetrust-banner-sdk');
+    const bannerVisible = !!banner && banner.offsetParent !== null
+        && getComputedStyle(banner).visibility !== 'hidden';
+    return {
+        consent: document.cookie.indexOf('OptanonAlertBoxClosed') !== -1,
+        banner: bannerVisible
+    };
+}
+"""
+
+COOKIE_SELECTORS = [
+    'button#onetrust-accept-btn-handler',
+    '.onetrust-close-btn-handler',
+    'button[class*="cookie-policy-popup__button"]',
+    # Any other generic "Accept" buttons
+    'button:has-text("Kabul Et")',
+    'button:has-text("Tümünü Kabul Et")',
+    'button:has-text("Hepsini Kabul Et")',
+    'button:has-text("Allow All")',
+    'button:has-text("Accept All")',
+    '#onetrust-accept-btn-handler',
+    '.eu-cookie-compliance-default-button',
+    'button[id*="cookie"]',
+    'a:has-text("Kabul Et")'
+]
+COOKIE_BANNER_SELECTOR = '#onetrust-banner-sdk'
+
+# Text links tried when the upload type radio cannot be clicked
+UPLOAD_TYPE_FALLBACKS = {
+    'TL': ['text="TL Yükle"'],
+    'Package': ['text="Paket Yükle"', 'text="Paketler"'],
+}
+
+FOCUSED_JS = "sel => document.activeElement === document.querySelector(sel)"
+CHECKED_JS = "sel => { const el = document.querySelector(sel); return !!el && el.checked; }"
+ENABLED_JS = "sel => { const el = document.querySelector(sel); return !!el && !el.disabled; }"
+PHONE_VALUE_JS = "([sel, num]) => { const el = document.querySelector(sel); return !!el && el.value.replace(/\\D/g, '').endsWith(num); }"
+PHONE_CLEARED_JS = "([sel, num]) => { const el = document.querySelector(sel); return !!el && !el.value.replace(/\\D/g, '').endsWith(num); }"
+PHONE_ERROR_SELECTOR = '.molecule-masked-input_maskedInput__errorText__3q3B7'
+
+
+def phone_digits(phone_number: str) -> str:
+    """Digits to type into the 0(5__) mask: no +90, no leading 0, no pre-filled '5'."""
+    clean_number = phone_number.replace("+90", "").replace(" ", "").lstrip("0")
+    if clean_number.startswith("5"):
+        clean_number = clean_number[1:]
+    return clean_number
+
+
+def phone_value(input_value: str) -> str:
+    """Masked input value without spaces and parentheses."""
+    return input_value.replace(" ", "").replace("(", "").replace(")", "")
+
+
+def resume_selector(maps: dict, step: str):
+    """Element a parked page shows while it is still at the checkpoint of step."""
+    return {
+        'select': f'{maps["package_card"]}, {maps["tl_card"]}',
+        'pay': maps["card_holder"],
+    }.get(step)
+
+
+# --- Packages ---------------------------------------------------------------
+
+# A TL price box reports selection through its class name
+TL_SELECTED_JS = "el => /isSelected|active/.test(el.className || '')"
+
+TAB_SELECTORS = ['div[class*="tabItem"]', 'div[role="tab"]']
+PRICE_SELECTOR = '[class*="priceInfoText"]'
+
+# Walks the category tabs inside the page and returns every tab's cards in a
+# single roundtrip. After each tab click it waits until the card list changed
+# (or, for the tab that was already active, is present) and stayed stable for
+# settleMs, instead of a fixed sleep. Cards keep their DOM index so the caller
+# can click them afterwards without re-reading the DOM.
+EXTRACT_TABS_JS = """
+async ({tabSelectors, cardSelector, nameSelector, priceSelector, onlyTabs, settleMs, timeoutMs}) => {
+    const pause = (ms) => new Promise(r => setTimeout(r, ms));
+    const text = (el) => (el && el.innerText ? el.innerText.trim() : '');
+    const findTabs = () => {
+        for (const sel of tabSelectors) {
+            const found = Array.from(document.querySelectorAll(sel));
+            if (found.length) return found;
+        }
+        return [];
+    };
+    const cards = () => Array.from(document.querySelectorAll(cardSelector));
+    const snapshot = () => cards().map(c => text(c.querySelector(nameSelector))).join('|');
+    const isActive = (tab) => tab.getAttribute('aria-selected') === 'true'
+        || /active|selected/i.test(tab.className || '');
+
+    const settle = async (before, alreadyActive) => {
+        const started = performance.now();
+        let last = snapshot(), stableSince = started;
+        while (performance.now() - started < timeoutMs) {
+            await pause(50);
+            const current = snapshot();
+            if (current !== last) { last = current; stableSince = performance.now(); }
+            const ready = cards().length > 0 && (current !== before || alreadyActive);
+            if (ready && performance.now() - stableSince >= settleMs) return true;
+        }
+        return false;
+    };
+
+    const expandSeeAll = async () => {
+        const btn = Array.from(document.querySelectorAll('button'))
+            .find(b => text(b).includes('Tümünü Gör') && b.offsetParent !== null);
+        if (!btn) return false;
+        const before = snapshot();
+        btn.click();
+        await settle(before, false);
+        return true;
+    };
+
+    const tabs = findTabs();
+    const result = [];
+    for (let i = 0; i < tabs.length; i++) {
+        if (onlyTabs && !onlyTabs.includes(i)) continue;
+        // The tab strip may re-render after a click, always use the live node
+        const tab = findTabs()[i] || tabs[i];
+        const entry = {
+            index: i,
+            category: (tab.getAttribute('title') || text(tab) || tab.getAttribute('aria-label')
+                       || tab.getAttribute('data-label') || '').trim(),
+            settled: false,
+            expanded: false,
+            cards: [],
+            error: null,
+        };
+        try {
+            const alreadyActive = isActive(tab);
+            const before = snapshot();
+            tab.click();
+            entry.settled = await settle(before, alreadyActive);
+            entry.expanded = await expandSeeAll();
+            entry.cards = cards().map((card, idx) => ({
+                index: idx,
+                name: text(card.querySelector(nameSelector)),
+                price_text: text(card.querySelector(priceSelector)),
+            }));
+        } catch (e) {
+            entry.error = String(e);
+        }
+        result.push(entry);
+    }
+    return {tab_count: tabs.length, tabs: result};
+}
+"""
+
+TAB_TITLES_JS = """
+(tabSelectors) => {
+    for (const sel of tabSelectors) {
+        const found = Array.from(document.querySelectorAll(sel));
+        if (found.length) {
+            return found.map(tab => (tab.getAttribute('title') || (tab.innerText || '').trim()
+                || tab.getAttribute('aria-label') || tab.getAttribute('data-label') || '').trim());
+        }
+    }
+    return [];
+}
+"""
+
+INNER_TEXTS_JS = "els => els.map(el => el.innerText || '')"
+
+
+TABS_SELECTOR = 'div[class*="molecule-tab"]'
+TL_CARD_SELECTOR = '.atom-price-box_a-trkclApp-price-box__vdHgd'
+# Package names scoring at least this against a query are taken as the package
+MATCH_THRESHOLD = 0.75
+
+TL_CONTINUE_SELECTORS = [
+    '.molecule-basket-amount-bar_basket-amount-bar__button__Zg8N5',
+    'button.atom-button_a-trkclAppBtn__medium__MUPRY',
+    'button:has-text("Devam Et")',
+    '//button[contains(., "Devam Et")]'
+]
+CONTINUE_ENABLED_JS = "el => !el.disabled && !(el.className || '').includes('disabled')"
+
+
+def package_continue_selectors(maps: dict) -> list:
+    return [
+        maps["continue_btn"],
+        'button.atom-button_a-trkclAppBtn__medium__MUPRY',
+        'button:has-text("Devam Et")',
+        'button:has-text("Satın Al")',
+        'a:has-text("Devam Et")'
+    ]
+
+
+def package_confirm_selector(maps: dict) -> str:
+    """Any of the buttons the package panel shows once a card is clicked."""
+    return f'{maps["continue_btn"]}, button:has-text("Satın Al"), a:has-text("Devam Et")'
+
+
+def parse_price(price_text: str) -> float:
+    """'149,90 TL' -> 149.9, 0.0 if no number is found."""
+    if not price_text:
+        return 0.0
+    price_match = re.search(r'(\d+[.,]?\d*)', price_text)
+    if not price_match:
+        return 0.0
+    try:
+        return float(price_match.group(1).replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+
+def unsettled_tabs(data: dict) -> list:
+    """Indexes of the swept tabs whose cards did not settle within the budget."""
+    return [tab['index'] for tab in data['tabs'] if not tab['error'] and not tab['settled']]
+
+
+def merge_resweep(data: dict, resweep: dict) -> list:
+    """
+    Replaces the unsettled tabs of data with their resweep. A tab that is
+    still unsettled is kept without cards (they may belong to the previous
+    tab) and marked with an error, so callers skip it. Returns the indexes
+    of the dropped tabs.
+    """
+    swept = {tab['index']: tab for tab in resweep['tabs']}
+    dropped = []
+    for position, tab in enumerate(data['tabs']):
+        if tab['error'] or tab['settled']:
+            continue
+        tab = swept.get(tab['index'], tab)
+        if not tab['error'] and not tab['settled']:
+            tab = {**tab, 'cards': [], 'error': "cards did not settle"}
+            dropped.append(tab['index'])
+        data['tabs'][position] = tab
+    return dropped
+
+
+def tl_packages(texts: list) -> list:
+    """Packages of the TL amount cards ('200TL' -> 200 TL)."""
+    packages = []
+    for raw in texts:
+        text = raw.strip().replace("\n", "").replace(" ", "")
+        match = re.search(r'(\d+)', text)
+        if match:
+            amount = float(match.group(1))
+            packages.append({
+                'category': 'TL Yükle',
+                'name': f"{int(amount)} TL",
+                'package_id': str(int(amount)),  # Use amount as ID
+                'price': amount
+            })
+    return packages
+
+
+def tab_packages(data: dict) -> list:
+    """Packages of a tab sweep (_extract_tabs), skipping tabs that failed or have no cards."""
+    packages = []
+    for tab in data['tabs']:
+        category_name = tab['category'] or f"Kategori {tab['index'] + 1}"
+        if tab['error']:
+            logger.warning(f"Could not process tab {category_name}: {tab['error']}")
+            continue
+        if not tab['cards']:
+            logger.warning(f"No package cards found in {category_name}. Skipping.")
+            continue
+
+        logger.info(f"Found {len(tab['cards'])} package cards in {category_name}")
+        for card in tab['cards']:
+            price = parse_price(card['price_text'])
+            if card['name'] and price > 0:
+                logger.info(f"Scraped: {card['name']} - {price} TL")
+                packages.append({
+                    'category': category_name,
+                    'name': card['name'],
+                    'package_id': card['name'],
+                    'price': price
+                })
+    return packages
+
+
+def tl_card_index(card_texts: list, amount: float):
+    """Index of the TL card showing exactly amount (20 must not match 200), None if missing."""
+    amount_str = str(int(amount))
+    for i, raw in enumerate(card_texts):
+        text = raw.strip().replace("\n", "").replace(" ", "")
+        logger.info(f"TL Card {i} text: '{text}'")
+        if text.lower().replace("tl", "").replace("₺", "").strip() == amount_str:
+            return i
+    return None
+
+
+def package_queries(package_id: str = None, fallback_name: str = None) -> list:
+    """Texts a package is searched by: its id, then the fallback name."""
+    texts = []
+    if package_id and package_id != 'UNDEFINED':
+        texts.append(package_id)
+    if fallback_name and fallback_name not in texts:
+        texts.append(fallback_name)
+    return texts
+
+
+def predict_tab(tab_titles: list, preferred_category: str = None):
+    """Index of the tab titled preferred_category, None if unknown."""
+    if not preferred_category:
+        return None
+    wanted = preferred_category.lower().strip()
+    for i, title in enumerate(tab_titles):
+        if title and title.lower().strip() == wanted:
+            return i
+    return None
+
+
+def tab_search_order(tab_titles: list, preferred_category: str = None):
+    """(order the tabs are searched in, predicted tab index or None): the predicted tab first."""
+    order = list(range(len(tab_titles)))
+    predicted_tab = predict_tab(tab_titles, preferred_category)
+    if predicted_tab is not None:
+        order.remove(predicted_tab)
+        order.insert(0, predicted_tab)
+        logger.info(f"Predicted tab '{tab_titles[predicted_tab]}' from catalog category '{preferred_category}'.")
+    return order, predicted_tab
+
+
+def best_card(tab: dict, texts: list):
+    """(score, card) of the tab's best match for texts, (score, None) below MATCH_THRESHOLD."""
+    # Same result as scoring every card against every search text, fewer difflib calls
+    tab_index = PackageMatchIndex([card['name'] for card in tab['cards']])
+    score, idx = tab_index.best(texts)
+    if idx is None or score < MATCH_THRESHOLD:
+        return score, None
+    return score, tab['cards'][idx]
+
+
+# --- Payment ----------------------------------------------------------------
+
+# Sets a (possibly hidden) native select and notifies React
+SET_SELECT_JS = """
+([selector, value]) => {
+    const el = document.querySelector(selector);
+    if (!el) return false;
+    el.value = value;
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+    el.dispatchEvent(new Event('input', { bubbles: true }));
+    el.dispatchEvent(new Event('blur', { bubbles: true }));
+    return true;
+}
+"""
+CCV_SELECTOR = 'input[name="ccv"]'
+# Clicking the agreement text opens a modal, the checkbox wrapper is clicked instead
+AGREEMENT_WRAPPER_SELECTOR = '.ant-checkbox-wrapper'
+AGREEMENT_CHECKED_CLASS = 'ant-checkbox-wrapper-checked'
+CHECKBOX_SELECTOR = 'input[type="checkbox"]'
+FORM_ERROR_SELECTOR = '.ant-form-item-explain-error'
+CLICK_JS = "(el) => el.click()"
+
+
+def card_expiry(card) -> tuple:
+    """(MM, YYYY) of the card: '1' -> '01', '26' -> '2026'."""
+    month_val = str(card.exp_month).strip().zfill(2)
+    year_val = str(card.exp_year).strip()
+    if len(year_val) == 2:
+        year_val = f"20{year_val}"
+    return month_val, year_val
+
+
+def payment_submitted_selector(maps: dict) -> str:
+    """3DS iframe/wrapper or a form error, whichever the submit leads to."""
+    return f'{maps["iframe_wrapper"]}, iframe[name="{maps["iframe_name"]}"], {FORM_ERROR_SELECTOR}'
+
+
+# --- Captcha ----------------------------------------------------------------
+
+CAPTCHA_MAX_RETRIES = 6
+# Answers shorter than this cannot be right (the site's captchas are 6 characters)
+CAPTCHA_MIN_LENGTH = 5
+CAPTCHA_ERROR_SELECTOR = '.atom-input-message_inputMessage__text__error__jF1_D'
+MODAL_SELECTOR = '.ant-modal-body'
+CAPTCHA_REFRESHED_JS = "([sel, old]) => { const el = document.querySelector(sel); return !!el && !!el.src && el.src !== old; }"
+# Modal texts saying the number is not a Turkcell line
+INVALID_NUMBER_KEYWORDS = ["hizmet almamaktadır", "Türk Telekom", "Vodafone"]
+
+
+def captcha_outcome_selector(maps: dict) -> str:
+    """Next step, captcha error or a modal, whichever the submit leads to."""
+    return f'{maps["tab_ek_paketler"]}, {CAPTCHA_ERROR_SELECTOR}, {MODAL_SELECTOR}'
+
+
+def is_invalid_number(modal_text: str) -> bool:
+    return any(k in modal_text for k in INVALID_NUMBER_KEYWORDS)
+
+
+# --- 3D Secure --------------------------------------------------------------
+
+IFRAME_WRAPPER_SELECTOR = '.Iframe_iframe-wrapper--open__tLv_K'
+THREEDS_FORM_SELECTOR = '.Iframe_iframe-wrapper__form__dTpu6'
+CARD_FORM_SELECTOR = 'input[name="cardNumber"]'
+
+# Text of the bank page that asks for the SMS code
+SMS_SCREEN_KEYWORDS = ["sms", "şifre", "dogrulama", "doğrulama", "code", "password", "tek kullanımlık", "onay", "secure", "3d"]
+# Quick check for a visible code input on the bank page
+SMS_SCREEN_INPUTS = ['input[type="password"]', 'input[name="otpCode"]', 'input[id="code"]', 'input[type="text"]']
+SMS_INPUT_SELECTORS = [
+    'input[name="hasMasked"]',        # IstanbulKart/PayCell specific
+    'input[name="otpCode"]',
+    'input[name="code"]',
+    'input[id="code"]',
+    'input.password-input',
+    'input[type="tel"]',
+    'input[type="number"]',
+    'input[type="password"]',
+    'input[type="text"][maxlength="6"]',
+    'input[name="password"]',
+    'input[id*="sms"]',
+    'input[id*="code"]'
+]
+SMS_SUBMIT_SELECTORS = [
+    '#btn-commit',                    # IstanbulKart/PayCell specific
+    '#DevamEt',
+    'input[name="DevamEt"]',
+    'button:has-text("Devam")',
+    'input[type="submit"]',
+    'button[type="submit"]',
+    'button:has-text("Gönder")',
+    'button:has-text("Onayla")',
+    'button:has-text("Submit")'
+]
+# Inputs that are NOT hidden/submit/checkbox/radio/button/image, for the single visible input fallback
+FREE_INPUTS = 'input:not([type="hidden"]):not([type="submit"]):not([type="button"]):not([type="image"]):not([type="checkbox"]):not([type="radio"])'
+SMS_CODE_RE = re.compile(r'\b\d{6}\b')
+
+# Result texts, matched by ThreeDSOutcomeDetector and the polling loop
+SUCCESS_KEYWORDS = ["Siparişiniz Alındı", "Teşekkürler", "başarıyla", "Paket yükleme talebiniz alınmıştır", "bilgilendirme yapılacaktır"]
+ERROR_KEYWORDS = ["Hata", "Başarısız", "Reddedildi"]
+PAGE_FAILED_KEYWORDS = ["İşlem Başarısız", "Transaction Failed"]
+FRAME_SUCCESS_KEYWORDS = ["Başarılı", "Successful", "Onaylandı", "Approved"]
+FRAME_FAILURE_KEYWORDS = ["Başarısız", "Failed", "Reddedildi", "Declined", "Hata"]
+# Resolves once any of the given texts is on the page
+PAGE_TEXT_JS = "kws => { const t = document.body ? document.body.innerText : ''; return kws.some(k => t.includes(k)); }"
+
+LIMIT_MESSAGE = "Yetersiz Bakiye/Limit Hatası"
+
+
+def iframe_wrapper_selector(maps: dict) -> str:
+    return maps.get("iframe_wrapper", IFRAME_WRAPPER_SELECTOR)
+
+
+def iframe_selector(maps: dict) -> str:
+    return f'iframe[name="{maps.get("iframe_name", "three-d-iframe")}"]'
+
+
+def is_sms_screen(content: str) -> bool:
+    content_lower = content.lower()
+    return any(k in content_lower for k in SMS_SCREEN_KEYWORDS)
+
+
+def sms_code(sms_text: str):
+    """The 6-digit code of an SMS, None if it has none."""
+    match = SMS_CODE_RE.search(sms_text or '')
+    return match.group(0) if match else None
+
+
+def is_limit_error(text: str) -> bool:
+    """Bank/Turkcell text about an insufficient limit or balance."""
+    lower = (text or '').lower()
+    return "limit" in lower and ("yetersiz" in lower or "yeterli değil" in lower)
+
+
+def threeds_verdict(signal: dict):
+    """
+    (ok, message, screenshot, notify) for a decisive ThreeDSOutcomeDetector
+    signal; notify is the log_callback message or None. None for 'closed',
+    which needs a look at the page (closed_verdict).
+    """
+    outcome, reason, text = signal['outcome'], signal['reason'], signal['text']
+    if outcome == 'success':
+        logger.info(f"3D Secure SUCCESS detected ({reason}): {text[:100]}")
+        if reason == 'page_success':
+            return True, "3D Secure completed and verified success (Success message found).", "post_3d_secure_check", None
+        return True, text[:200], "post_3d_secure_check", None
+
+    if outcome == 'limit' or (outcome == 'modal' and is_limit_error(text)):
+        logger.error(f"3D Secure FAILURE: Insufficient Limit detected ({reason}).")
+        screenshot = "error_modal_detected" if outcome == 'modal' else "post_3d_secure_failed"
+        return False, LIMIT_MESSAGE, screenshot, "3DS_ERROR_LIMIT"
+
+    if outcome == 'modal':
+        logger.error(f"3D Secure FAILURE: Error Modal detected: {text}")
+        return False, f"İşlem Hatası: {text}", "error_modal_detected", f"3DS_ERROR_MODAL: {text[:50]}"
+
+    if outcome == 'failure':
+        logger.error(f"3D Secure FAILURE detected ({reason}): {text[:100]}")
+        if reason == 'page_failed':
+            return False, "İşlem Başarısız (Main Page)", "post_3d_secure_failed", "3DS_ERROR_GENERIC"
+        if reason == 'page_error':
+            return False, "3D Secure closed but error detected on page.", "post_3d_secure_failed", None
+        return False, text[:200], "post_3d_secure_failed", None
+    return None
+
+
+def closed_verdict(back_on_card_form: bool) -> tuple:
+    """(ok, message) when the iframe closed without any result text."""
+    if back_on_card_form:
+        logger.warning("Transaction Verified: FAILED (Returned to payment form)")
+        return False, "Returned to payment form without success message."
+    logger.warning("Transaction Verified: AMBIGUOUS (No success/error message found). Assuming Failure.")
+    return False, "Ambiguous result after 3D Secure."
+
+
+def timeout_verdict(iframe_present: bool) -> tuple:
+    """(ok, message) when no decisive signal came within the result window."""
+    if not iframe_present:
+        return True, "3D Secure completed (iframe gone after poll timeout)"
+    return False, "Timeout: 3D Secure did not complete within poll window"
@@ -1,14 +1,121 @@
 
 import time
-import re
 import logging
+from worker.services.catalog import PackageCatalogService
 from .navigator import handle_cookies
+from .matching import match_score, index_for_snapshot
+from .rules import (
+    EXTRACT_TABS_JS, TAB_TITLES_JS, INNER_TEXTS_JS, TL_SELECTED_JS, TAB_SELECTORS, PRICE_SELECTOR, TABS_SELECTOR,
+    TL_CARD_SELECTOR, TL_CONTINUE_SELECTORS, CONTINUE_ENABLED_JS, CLICK_JS, MATCH_THRESHOLD,
+    parse_price, unsettled_tabs, merge_resweep, tl_packages, tab_packages, tl_card_index, package_queries,
+    tab_search_order, best_card, package_continue_selectors, package_confirm_selector
+)
 
 logger = logging.getLogger(__name__)
 
 class ScraperMixin:
     """Mixin for package scraping and selection logic."""
 
+    def _extract_tabs(self, only_tabs=None) -> dict:
+        """
+        Clicks through the category tabs and collects their cards with one
+        page.evaluate call: {'tab_count': n, 'tabs': [{'index', 'category',
+        'settled', 'cards': [{'index', 'name', 'price_text'}], ...}]}.
+        only_tabs limits the sweep to the given tab indexes. Tabs whose cards
+        did not settle are swept once more, and dropped (error set, no cards)
+        if they still do not. The page is left on the last swept tab, so card
+        indexes of that tab are clickable.
+        """
+        data = self._sweep_tabs(only_tabs)
+        unsettled = unsettled_tabs(data)
+        if unsettled:
+            logger.warning(f"Cards of tabs {unsettled} did not settle, sweeping them again.")
+            dropped = merge_resweep(data, self._sweep_tabs(unsettled))
+            if dropped:
+                logger.warning(f"Dropping the cards of tabs {dropped}: still not settled.")
+        return data
+
+    def _sweep_tabs(self, only_tabs=None) -> dict:
+        started = time.perf_counter()
+        data = self.page.evaluate(EXTRACT_TABS_JS, {
+            'tabSelectors': TAB_SELECTORS,
+            'cardSelector': self.Maps["package_card"],
+            'nameSelector': self.Maps["package_name"],
+            'priceSelector': PRICE_SELECTOR,
+            'onlyTabs': list(only_tabs) if only_tabs is not None else None,
+            'settleMs': 150,
+            'timeoutMs': self.WAIT_BUDGETS_MS.get('tab_cards', 3000),
+        })
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        card_count = sum(len(t['cards']) for t in data['tabs'])
+        logger.info(
+            f"Extracted {card_count} cards from {len(data['tabs'])}/{data['tab_count']} tabs "
+            f"in {elapsed_ms:.0f} ms (1 roundtrip)."
+        )
+        return data
+
+    def _catalog_match(self, search_texts: list, upload_type: str = "Package"):
+        """
+        Best (score, record) for search_texts in the shared cached catalog,
+        (0.0, None) if nothing is cached. The match index is built once per
+        catalog version.
+        """
+        catalog = PackageCatalogService.get(self.CATALOG_NAME, upload_type)
+        if not catalog or not catalog['packages']:
+            return 0.0, None
+        records = catalog['packages']
+        index = index_for_snapshot(
+            (PackageCatalogService.key(self.CATALOG_NAME, upload_type), catalog['version']),
+            [record['name'] for record in records]
+        )
+        score, idx = index.best(search_texts)
+        return (score, records[idx]) if idx is not None else (0.0, None)
+
+    def _card_handle(self, index: int):
+        """Element handle of the package card at DOM index on the current tab."""
+        return self.page.locator(self.Maps["package_card"]).nth(index).element_handle(timeout=2000)
+
+    def _network_packages(self):
+        """
+        Packages parsed from the captured listing responses. Until they cover
+        as many categories as the page has tabs, waits (catalog_response
+        budget) for further JSON responses, since the listing may be fetched
+        per tab. Returns None if the capture still covers fewer tabs, so the
+        caller sweeps the tabs instead.
+        """
+        catalog = self.network_catalog
+        budget_ms = self.WAIT_BUDGETS_MS.get('catalog_response', 5000)
+        deadline = time.perf_counter() + budget_ms / 1000
+
+        def complete():
+            tab_count = len(self.page.evaluate(TAB_TITLES_JS, TAB_SELECTORS))
+            covered = len(catalog.categories())
+            return covered > 0 and covered >= tab_count, covered, tab_count
+
+        done, covered, tab_count = complete()
+        while not done:
+            remaining_ms = int((deadline - time.perf_counter()) * 1000)
+            if remaining_ms <= 0:
+                break
+            met = self.wait_step(
+                'catalog_response',
+                lambda t: self.page.wait_for_event("response", predicate=catalog.is_candidate, timeout=t),
+                budget_ms=remaining_ms
+            )
+            if not met:
+                break
+            done, covered, tab_count = complete()
+
+        logger.info(
+            f"Network catalog: {catalog.payloads_matched}/{catalog.payloads_seen} JSON payloads "
+            f"contained packages of {covered}/{tab_count} tabs."
+        )
+        if not done:
+            if covered:
+                logger.warning(f"Network catalog covers {covered} of {tab_count} tabs, not using it.")
+            return None
+        return catalog.packages()
+
     def scrape_packages(self, is_tl=False) -> list:
         logger.info(f"Scraping packages... (Mode: {'TL' if is_tl else 'Package'})")
         self.take_screenshot("scraping_start")
@@ -19,22 +126,9 @@ class ScraperMixin:
                 # Scrape TL Amounts
                 try:
                     self.page.wait_for_selector(self.Maps["tl_card"], timeout=10000)
-                    cards = self.page.query_selector_all(self.Maps["tl_card"])
-                    logger.info(f"Found {len(cards)} TL amount cards.")
-                    
-                    for card in cards:
-                        text = card.inner_text().strip().replace("\n", "").replace(" ", "")
-                        # Extract amount (e.g. 200TL -> 200)
-                        match = re.search(r'(\d+)', text)
-                        if match:
-                            amount = float(match.group(1))
-                            packages.append({
-                                'category': 'TL Yükle',
-                                'name': f"{int(amount)} TL",
-                                'package_id': str(int(amount)), # Use amount as ID
-                                'price': amount
-                            })
-                    return packages
+                    texts = self.page.eval_on_selector_all(self.Maps["tl_card"], INNER_TEXTS_JS)
+                    logger.info(f"Found {len(texts)} TL amount cards.")
+                    return tl_packages(texts)
                 except Exception as e:
                     logger.error(f"Error scraping TL amounts: {e}")
                     return []
@@ -47,130 +141,40 @@ class ScraperMixin:
                  except: 
                      return False
 
+            # Network catalog: the listing XHR already has every package, no tab clicking needed
+            if getattr(self, 'network_catalog', None):
+                packages = self._network_packages()
+                if packages:
+                    logger.info(f"Scraping finished from network payloads. Returning {len(packages)} packages.")
+                    return packages
+                logger.info("Network catalog: no complete listing payload, falling back to DOM scraping.")
+                packages = []
+
             # Package Scraping Logic (default)
             # Wait for content to load - Reduced timeout
             wait_optional(self.Maps["tab_ek_paketler"], timeout=5000)
                 
-            # Find all tabs using Locators
-            if not wait_optional('div[class*="molecule-tab"]', timeout=5000):
+            if not wait_optional(TABS_SELECTOR, timeout=5000):
                  logger.warning("Timeout waiting for tabs (5s).")
-                 # Don't return yet, try finding cards directly? No, usually tabs wrap them.
-                 # return [] 
-                 
-            # Use Locator to find tabs
-            # Try specific class first
-            tabs_locator = self.page.locator('div[class*="tabItem"]')
-            tab_count = tabs_locator.count()
-            
-            if tab_count == 0:
-                 # Backup strategy: simple role=tab
-                 tabs_locator = self.page.locator('div[role="tab"]')
-                 tab_count = tabs_locator.count()
-            
-            logger.info(f"Found {tab_count} category tabs.")
+                 # Don't return yet, the sweep below reports tab_count 0 if there really are none
+
+            # All tabs and cards in one roundtrip
+            data = self._extract_tabs()
+            logger.info(f"Found {data['tab_count']} category tabs.")
             
-            if tab_count == 0:
+            if data['tab_count'] == 0:
                 logger.error("No tabs found! Checking for loose cards...")
                 # Fallback: maybe we are already on a listing page without tabs?
-                cards = self.page.query_selector_all(self.Maps["package_card"])
-                if cards:
-                     logger.info(f"Found {len(cards)} loose cards without tabs.")
-                     # Process these cards (logic below expects loop, but we can hack it)
+                loose = self.page.locator(self.Maps["package_card"]).count()
+                if loose:
+                     logger.info(f"Found {loose} loose cards without tabs.")
                      # For now just return empty, user said "stuck", this speeds it up.
                      return []
                 
                 self.take_screenshot("no_tabs_found")
                 return []
             
-            for i in range(tab_count):
-                try:
-                    tab = tabs_locator.nth(i)
-                    
-                    # Robust Name Extraction
-                    category_name = "Unknown Category"
-                    try:
-                        category_name = (
-                            tab.get_attribute('title', timeout=500) 
-                            or tab.inner_text(timeout=500).strip() 
-                            or tab.get_attribute('aria-label', timeout=500)
-                            or tab.get_attribute('data-label', timeout=500)
-                            or ""
-                        ).strip()
-                    except Exception: 
-                        pass
-                        
-                    if not category_name:
-                        category_name = f"Kategori {i+1}"
-                        
-                    logger.info(f"Processing Category {i+1}/{tab_count}: {category_name}")
-                    
-                    # Click tab - Fast click
-                    try:
-                        tab.click(timeout=1000)
-                        self.page.wait_for_timeout(500) 
-                    except Exception as e:
-                        logger.warning(f"Could not click tab {category_name}: {e}")
-                        continue
-                        
-                    # Check for "Tümünü Gör" (See All) button - Fast check
-                    try:
-                        see_all_btn = self.page.locator('button:has-text("Tümünü Gör")')
-                        if see_all_btn.is_visible(timeout=500):
-                            see_all_btn.click(timeout=1000)
-                            self.page.wait_for_timeout(500)
-                    except Exception:
-                        pass 
-
-                    # Scrape cards
-                    card_selector = self.Maps["package_card"]
-                    
-                    # Wait briefly for cards to load after click
-                    if not wait_optional(card_selector, timeout=2000):
-                        logger.warning(f"No package cards found in {category_name} (2s). Skipping.")
-                        continue
-
-                    # Use element handles for cards in the current view (simpler than locators as they are static for this view)
-                    cards = self.page.query_selector_all(card_selector)
-                    logger.info(f"Found {len(cards)} package cards in {category_name}")
-                    
-                    for idx, card in enumerate(cards):
-                        try:
-                            # Name Extraction
-                            name = "Unknown"
-                            name_el = card.query_selector(self.Maps["package_name"])
-                            if name_el:
-                                text = name_el.inner_text().strip()
-                                if text: name = text
-                            
-                            # Price Extraction
-                            price = 0.0
-                            price_text = ""
-                            price_el = card.query_selector('[class*="priceInfoText"]')
-                            if price_el:
-                                price_text = price_el.inner_text().strip()
-                            
-                            if price_text:
-                                price_match = re.search(r'(\d+[.,]?\d*)', price_text)
-                                if price_match:
-                                    try:
-                                        price = float(price_match.group(1).replace(',', '.'))
-                                    except: pass
-                            
-                            if name != "Unknown" and price > 0:
-                                logger.info(f"Scraped: {name} - {price} TL")
-                                packages.append({
-                                    'category': category_name,
-                                    'name': name,
-                                    'package_id': name,
-                                    'price': price
-                                })
-                            
-                        except Exception as e:
-                            logger.warning(f"Error scraping a card: {e}")
-                            
-                except Exception as e:
-                    logger.error(f"Error processing tab {i}: {e}")
-                    
+            packages = tab_packages(data)
             logger.info(f"Scraping finished. Returning {len(packages)} packages.")
             return packages
 
@@ -180,47 +184,7 @@ class ScraperMixin:
 
     def _match_package_score(self, package_id: str, title_text: str) -> float:
         """Check if package_id matches title_text using strategies, returns a score 0.0 to 1.0."""
-        if not package_id or not title_text:
-            return 0.0
-            
-        pid_clean = package_id.lower().strip()
-        title_clean = title_text.lower().strip()
-        
-        # 1. Exact match
-        if pid_clean == title_clean:
-            return 1.0
-        
-        # 2. Clean match (remove completely excessive spaces)
-        pid_nospace = pid_clean.replace(" ", "")
-        title_nospace = title_clean.replace(" ", "")
-        
-        if pid_nospace == title_nospace:
-            return 1.0
-            
-        # Number Guard: Ensure numeral quantities actually match to prevent "1GB" matching "11GB" if "1GB" was just a word.
-        import re
-        pid_nums = set(re.findall(r'\d+', pid_clean))
-        title_nums = set(re.findall(r'\d+', title_clean))
-        
-        # If the requested package has numbers, at least one must intersect
-        if pid_nums and not pid_nums.intersection(title_nums):
-            return 0.0
-            
-        # 3. Substring match (If the letters are exactly inside the other)
-        # Give higher penalty if title is inside pid, because title is too generic for the query
-        if pid_nospace in title_nospace:
-            return 0.95
-        if title_nospace in pid_nospace:
-            return 0.90
-            
-        # 4. Fuzzy match (Tolerates abbreviations like "Dk" vs "Dakika")
-        import difflib
-        pid_no_brand = pid_clean.replace("turkcell", "").replace("gnç", "").strip()
-        
-        ratio = difflib.SequenceMatcher(None, pid_no_brand, title_clean).ratio()
-        ratio_orig = difflib.SequenceMatcher(None, pid_clean, title_clean).ratio()
-        
-        return max(ratio, ratio_orig)
+        return match_score(package_id, title_text)
 
     def _confirm_tl_selection(self, target_card, package_id: str) -> bool:
         """Confirm selection specifically for TL amounts."""
@@ -234,16 +198,15 @@ class ScraperMixin:
         click_target.click(force=True)
         logger.info("Clicked TL card (force=True)")
         
-        # Verify Selection
-        time.sleep(2)
+        # Verify Selection: wait for the selected class instead of a fixed sleep
         try:
-            box_classes = click_target.get_attribute("class")
-            if box_classes and ("isSelected" in box_classes or "active" in box_classes):
+            if self.wait_for_function_step('tl_card_selected', TL_SELECTED_JS, arg=click_target):
                  logger.info("TL Selection verified (class check).")
             else:
+                 box_classes = click_target.get_attribute("class")
                  logger.warning(f"TL Selection might have failed. Classes: {box_classes}. Retrying click with JS...")
-                 self.page.evaluate("(el) => el.click()", click_target)
-                 time.sleep(2)
+                 self.page.evaluate(CLICK_JS, click_target)
+                 self.wait_for_function_step('tl_card_selected', TL_SELECTED_JS, arg=click_target)
         except Exception as e:
              logger.warning(f"Verification error: {e}")
 
@@ -251,20 +214,12 @@ class ScraperMixin:
         
         # Click continue (TL specific logic)
         self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        time.sleep(1)
         try:
             handle_cookies(self.page)
             
             # Precise selector for TL flow
-            confirm_selectors = [
-                '.molecule-basket-amount-bar_basket-amount-bar__button__Zg8N5',
-                'button.atom-button_a-trkclAppBtn__medium__MUPRY',
-                'button:has-text("Devam Et")',
-                '//button[contains(., "Devam Et")]'
-            ]
-            
             btn = None
-            for selector in confirm_selectors:
+            for selector in TL_CONTINUE_SELECTORS:
                 try:
                     btn = self.page.query_selector(selector)
                     if btn and btn.is_visible():
@@ -277,10 +232,10 @@ class ScraperMixin:
                 btn.scroll_into_view_if_needed()
                 # Check for disabled
                 if btn.is_disabled() or "disabled" in (btn.get_attribute("class") or ""):
-                    time.sleep(2)
+                    self.wait_for_function_step('continue_enabled', CONTINUE_ENABLED_JS, arg=btn)
                     
                 try:
-                    self.page.evaluate("(el) => el.click()", btn)
+                    self.page.evaluate(CLICK_JS, btn)
                     logger.info("Clicked Continue button (JS)")
                 except Exception as e:
                     logger.error(f"Click failed: {e}")
@@ -314,20 +269,12 @@ class ScraperMixin:
             self.take_screenshot("after_package_click")
             
             # 2. Wait for confirmation or next step
-            # Usually 'Devam Et' or 'Satın Al' button appears
-            time.sleep(2)
+            # Usually 'Devam Et' or 'Satın Al' button appears, stop waiting as soon as one does
+            self.wait_for_selector_step('package_confirm_button', package_confirm_selector(self.Maps))
             
             # Use generic selectors for Panel flow
-            confirm_selectors = [
-                self.Maps["continue_btn"],
-                'button.atom-button_a-trkclAppBtn__medium__MUPRY',
-                'button:has-text("Devam Et")',
-                'button:has-text("Satın Al")',
-                'a:has-text("Devam Et")'
-            ]
-            
             btn = None
-            for selector in confirm_selectors:
+            for selector in package_continue_selectors(self.Maps):
                  try:
                      btn = self.page.query_selector(selector)
                      if btn and btn.is_visible():
@@ -351,7 +298,12 @@ class ScraperMixin:
             logger.error(f"Error in package confirmation: {e}")
             return False
 
-    def select_package(self, package_id: str = None, amount: float = None, fallback_name: str = None) -> bool:
+    def select_package(self, package_id: str = None, amount: float = None, fallback_name: str = None,
+                       preferred_category: str = None) -> bool:
+        """
+        preferred_category is the catalog category (tab title) the package was
+        last seen in; that tab is searched first.
+        """
         logger.info(f"Selecting Package: {package_id} or Amount: {amount} or Fallback: {fallback_name}")
         self.take_screenshot("package_selection_start")
         self.last_selected_price = 0.0
@@ -365,43 +317,19 @@ class ScraperMixin:
             if amount:
                 logger.info(f"TL Load mode for amount: {amount}")
                 try:
-                    # Amounts are usually displayed as cards or radio buttons with text like "100 TL"
-                    amount_str = str(int(amount)) # e.g. "100"
-                    
-                    # Precise TL Card Selector from HTML:
-                    # .atom-price-box_a-trkclApp-price-box__vdHgd
-                    tl_card_selector = '.atom-price-box_a-trkclApp-price-box__vdHgd'
-                    
+                    # Amounts are displayed as price boxes with text like "100 TL"
                     # Wait for amount cards - Increased timeout to 30s
-                    self.page.wait_for_selector(tl_card_selector, timeout=30000)
-                    cards = self.page.query_selector_all(tl_card_selector)
-                    
-                    target_card = None
-                    for i, card in enumerate(cards):
-                        text = card.inner_text().strip().replace("\n", "").replace(" ", "")
-                        logger.info(f"TL Card {i} text: '{text}'")
-                        
-                        # Normalize text for comparison
-                        # "200TL" -> "200"
-                        clean_text = text.lower().replace("tl", "").replace("₺", "").strip()
-                        
-                        # exact number match?
-                        if clean_text == amount_str:
-                             target_card = card
-                             logger.info(f"Found match for amount {amount} in card {i}")
-                             break
-                        # fallback: contains
-                        if f"{amount_str}" in clean_text:
-                             # verify it's the exact number (e.g. avoid matching 20 in 200)
-                             if clean_text == amount_str:
-                                 target_card = card
-                                 logger.info(f"Found match (clean) for amount {amount} in card {i}")
-                                 break
-                    
-                    if target_card:
+                    self.page.wait_for_selector(TL_CARD_SELECTOR, timeout=30000)
+                    # All card texts in one roundtrip, the matched card is resolved by index
+                    card_texts = self.page.eval_on_selector_all(TL_CARD_SELECTOR, INNER_TEXTS_JS)
+
+                    card_index = tl_card_index(card_texts, amount)
+                    if card_index is not None:
+                         logger.info(f"Found match for amount {amount} in card {card_index}")
+                         target_card = self.page.locator(TL_CARD_SELECTOR).nth(card_index).element_handle(timeout=2000)
                          return self._confirm_tl_selection(target_card, f"{amount} TL")
                     else:
-                         logger.error(f"Card for amount {amount} not found! Cards saw: {[c.inner_text() for c in cards]}")
+                         logger.error(f"Card for amount {amount} not found! Cards saw: {card_texts}")
                          self.take_screenshot("tl_amount_not_found")
                          return False
 
@@ -410,116 +338,99 @@ class ScraperMixin:
                     self.take_screenshot("tl_selection_error")
                     return False
                 
-            search_texts = []
-            if package_id and package_id != 'UNDEFINED':
-                search_texts.append(package_id)
-            if fallback_name and fallback_name not in search_texts:
-                search_texts.append(fallback_name)
+            search_texts = package_queries(package_id, fallback_name)
                 
             if search_texts:
+                # The cached catalog has the exact displayed name, search for it first
+                catalog_score, catalog_record = self._catalog_match(search_texts)
+                if catalog_score >= MATCH_THRESHOLD and catalog_record['name'] not in search_texts:
+                    logger.info(f"Catalog cache resolved '{search_texts[0]}' to '{catalog_record['name']}' (Score: {catalog_score:.2f})")
+                    search_texts.insert(0, catalog_record['name'])
+
                 # Wait for package selection screen (Panel flow)
                 try:
                     self.page.wait_for_selector(self.Maps["tab_ek_paketler"], timeout=30000)
                 except Exception:
                     logger.warning("EK PAKETLER tab not found, trying generic tab selector...")
                     
-                # Discover ALL category tabs (same logic as scrape_packages)
                 try:
-                    self.page.wait_for_selector('div[class*="molecule-tab"]', timeout=20000)
+                    self.page.wait_for_selector(TABS_SELECTOR, timeout=20000)
                 except:
                     logger.error("Timeout waiting for tabs.")
                     return False
 
-                tabs = self.page.query_selector_all('div[class*="tabItem"]')
-                if not tabs:
-                    tabs = self.page.query_selector_all('div[role="tab"]')
-                
-                logger.info(f"Found {len(tabs)} category tabs to search.")
+                tab_titles = self.page.evaluate(TAB_TITLES_JS, TAB_SELECTORS)
+                tab_count = len(tab_titles)
+                logger.info(f"Found {tab_count} category tabs to search.")
+
+                # Open the tab the package was last seen in first, sweep the rest only on a miss
+                tab_order, predicted_tab = tab_search_order(tab_titles, preferred_category)
+                if predicted_tab is None and preferred_category:
+                    PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'unknown')
 
-                # Iterate through ALL tabs to find the package
-                for tab_idx, tab in enumerate(tabs):
+                # One roundtrip per tab: sweep a tab, score its cards here, stop at the first hit
+                for position, tab_idx in enumerate(tab_order):
+                    if position == 1 and predicted_tab is not None:
+                        # Still searching after the predicted tab
+                        logger.info("Tab prediction missed, sweeping the remaining tabs.")
+                        PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'miss')
+                    tab_started = time.perf_counter()
                     try:
-                        category_name = (
-                            tab.get_attribute('title') 
-                            or tab.inner_text().strip() 
-                            or tab.get_attribute('aria-label')
-                            or f"Kategori {tab_idx+1}"
-                        ).strip()
-                        
-                        logger.info(f"Searching in tab: {category_name}")
-                        
-                        # Click tab
-                        try:
-                            tab.click()
-                            self.page.wait_for_timeout(1000)
-                        except Exception as e:
-                            logger.warning(f"Could not click tab {category_name}: {e}")
+                        data = self._extract_tabs(only_tabs=[tab_idx])
+                        if not data['tabs']:
                             continue
 
-                        # Check for "Tümünü Gör" button
-                        try:
-                            see_all_btn = self.page.query_selector('button:has-text("Tümünü Gör")')
-                            if see_all_btn and see_all_btn.is_visible():
-                                logger.info("Found 'Tümünü Gör' button. Clicking...")
-                                see_all_btn.click()
-                                self.page.wait_for_timeout(1000)
-                        except Exception:
-                            pass
-
-                        # Find package cards in this tab
-                        try:
-                            self.page.wait_for_selector(self.Maps["package_card"], timeout=5000)
-                        except Exception:
+                        tab = data['tabs'][0]
+                        category_name = tab['category'] or f"Kategori {tab_idx+1}"
+                        logger.info(f"Searching in tab: {category_name}")
+
+                        if tab['error']:
+                            logger.warning(f"Could not click tab {category_name}: {tab['error']}")
+                            continue
+                        if not tab['cards']:
                             logger.warning(f"No package cards in tab {category_name}")
                             continue
 
-                        cards = self.page.query_selector_all(self.Maps["package_card"])
-                        logger.info(f"Found {len(cards)} package cards in {category_name}.")
+                        logger.info(f"Found {len(tab['cards'])} package cards in {category_name}.")
                         
-                        best_tab_score = 0.0
-                        best_tab_card = None
-                        best_tab_title = ""
-                        
-                        for i, card in enumerate(cards):
-                            title_el = card.query_selector(self.Maps["package_name"])
-                            if title_el:
-                                title_text = title_el.inner_text().strip()
-                                logger.info(f"  Card {i} Title: {title_text}")
-                                
-                                for search_text in search_texts:
-                                    score = self._match_package_score(search_text, title_text)
-                                    if score > best_tab_score:
-                                        best_tab_score = score
-                                        best_tab_card = card
-                                        best_tab_title = title_text
+                        for card in tab['cards']:
+                            if card['name']:
+                                logger.info(f"  Card {card['index']} Title: {card['name']}")
                             else:
-                                logger.warning(f"  Card {i} has no title element.")
-                                
-                        if best_tab_score >= 0.75 and best_tab_card:
+                                logger.warning(f"  Card {card['index']} has no title element.")
+
+                        best_tab_score, best_tab_card = best_card(tab, search_texts)
+                        if best_tab_card:
+                            best_tab_title = best_tab_card['name']
                             logger.info(f"✅ Best match selected in tab '{category_name}': {best_tab_title} (Score: {best_tab_score:.2f})")
+
+                            if predicted_tab is not None and tab_idx == predicted_tab:
+                                # A sequential sweep would have opened every tab before this one
+                                tab_ms = (time.perf_counter() - tab_started) * 1000
+                                PackageCatalogService.record_tab_prediction(
+                                    self.CATALOG_NAME, 'hit', saved_ms=predicted_tab * tab_ms
+                                )
                             
-                            # Extract price before clicking!
-                            try:
-                                price_el = best_tab_card.query_selector('[class*="priceInfoText"]')
-                                if price_el:
-                                    price_text = price_el.inner_text().strip()
-                                    price_match = re.search(r'(\d+[.,]?\d*)', price_text)
-                                    if price_match:
-                                        self.last_selected_price = float(price_match.group(1).replace(',', '.'))
-                                        self.last_selected_name = best_tab_title
-                            except Exception as e:
-                                logger.warning(f"Could not extract price before clicking: {e}")
+                            # Price was extracted with the sweep, no need to touch the card again
+                            price = parse_price(best_tab_card['price_text'])
+                            if price:
+                                self.last_selected_price = price
+                                self.last_selected_name = best_tab_title
 
                             with open("debug_output/packages_page.html", "w") as f:
                                 f.write(self.page.content())
-                            return self._click_and_confirm_package(best_tab_card, best_tab_title)
+                            target_card = self._card_handle(best_tab_card['index'])
+                            return self._click_and_confirm_package(target_card, best_tab_title)
                                 
                     except Exception as e:
                         logger.error(f"Error searching tab {tab_idx}: {e}")
                         continue
 
+                if predicted_tab is not None and tab_count == 1:
+                    PackageCatalogService.record_tab_prediction(self.CATALOG_NAME, 'miss')
+
                 # If we get here, package was not found in any tab
-                logger.error(f"Package queries '{search_texts}' not found in any of {len(tabs)} tabs.")
+                logger.error(f"Package queries '{search_texts}' not found in any of {tab_count} tabs.")
                 with open("debug_output/packages_page.html", "w") as f:
                     f.write(self.page.content())
                 self.take_screenshot("package_not_found_all_tabs")
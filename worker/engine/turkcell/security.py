@@ -1,10 +1,21 @@
 
+import os
 import time
-import re
 import logging
 from django.utils import timezone
 from core.models import SMSLog
+from worker.services.sms_bus import SMSBus
+from worker.services.sms_correlation import SMSCorrelator
 from .navigator import handle_cookies
+from .outcome import ThreeDSOutcomeDetector
+from .rules import (
+    FOCUSED_JS, ENABLED_JS, CLICK_JS, CAPTCHA_MAX_RETRIES, CAPTCHA_MIN_LENGTH, CAPTCHA_ERROR_SELECTOR, MODAL_SELECTOR,
+    CAPTCHA_REFRESHED_JS, THREEDS_FORM_SELECTOR, CARD_FORM_SELECTOR, SMS_SCREEN_INPUTS, SMS_INPUT_SELECTORS,
+    SMS_SUBMIT_SELECTORS, FREE_INPUTS, SUCCESS_KEYWORDS, ERROR_KEYWORDS, PAGE_FAILED_KEYWORDS, FRAME_SUCCESS_KEYWORDS,
+    FRAME_FAILURE_KEYWORDS, PAGE_TEXT_JS, LIMIT_MESSAGE, captcha_outcome_selector, is_invalid_number,
+    iframe_wrapper_selector, iframe_selector, is_sms_screen, sms_code, is_limit_error, threeds_verdict,
+    closed_verdict, timeout_verdict
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +26,9 @@ class SecurityMixin:
         logger.info("Function: solve_captcha")
         self.take_screenshot("before_captcha_check")
         try:
-            max_retries = 6
+            max_retries = CAPTCHA_MAX_RETRIES
+            # Ticket for the next captcha image, submitted as soon as the refresh landed
+            prefetched = None
             for attempt in range(max_retries):
                 if attempt == 3:
                      logger.info("Phase 2 reached: 3 failed attempts, starting next 3...")
@@ -44,39 +57,44 @@ class SecurityMixin:
                 
                 logger.info(f"Captcha Src (first 30 chars): {src[:30]}")
 
-                # Solve
+                # Solve: the backends start now (or already did right after the refresh),
+                # the input is focused while they work
+                if prefetched and prefetched.src == src:
+                    ticket = prefetched
+                    logger.info("Using captcha answer prefetched after refresh.")
+                else:
+                    ticket = self.captcha_solver.submit(src)
+                prefetched = None
+                self.captcha_tickets.append(ticket)
+
+                # Fill
+                # Click to focus first
+                self.page.click(self.Maps["captcha_input"])
+                self.wait_for_function_step('captcha_focus', FOCUSED_JS, arg=self.Maps["captcha_input"])
+
                 try:
-                    code = self.captcha_solver.solve_base64(src)
+                    code = ticket.result()
                     logger.info(f"Solved Captcha: {code}")
                     
-                    # Validation: Captcha should be 6 chars usually for this site
-                    if len(code) < 5:
+                    if len(code) < CAPTCHA_MIN_LENGTH:
                         logger.warning(f"Solved code '{code}' is too short. Refreshing...")
-                        self.page.click(self.Maps["captcha_refresh"])
-                        self.page.wait_for_timeout(1500) # Wait for new image
+                        ticket.report(False)
+                        prefetched = self._refresh_and_submit(src)
                         continue
                         
                 except Exception as e:
-                    logger.error(f"DDDDOCR Failed: {e}")
+                    logger.error(f"Captcha solving failed: {e}")
                     return False
                 
-                # Fill
-                # Click to focus first
-                self.page.click(self.Maps["captcha_input"])
-                time.sleep(0.2)
-                
                 # Type character by character to trigger React/JS events
                 logger.info(f"Typing captcha code: {code}")
                 for char in code:
                     self.page.keyboard.type(char, delay=100) 
                 
-                # Press Enter or Tab to blur/commit
+                # Press Tab twice to blur/commit, then wait for the form to enable submit
                 self.page.keyboard.press("Tab")
-                time.sleep(0.5)
-                
-                # Press Enter or Tab to blur/commit
                 self.page.keyboard.press("Tab")
-                time.sleep(0.5)
+                self.wait_for_function_step('captcha_submit_enabled', ENABLED_JS, arg=self.Maps["captcha_submit"])
 
                 # Click Submit
                 submit_btn = self.page.query_selector(self.Maps["captcha_submit"])
@@ -106,29 +124,30 @@ class SecurityMixin:
                         self.page.wait_for_selector(self.Maps["captcha_input"], state="hidden", timeout=15000)
                     except Exception:
                         logger.warning("Captcha input not hidden within 15s, continuing checks.")
-                        self.page.wait_for_timeout(2000)
+                        # Give a late error message / modal a chance to render
+                        self.wait_for_selector_step('captcha_outcome', captcha_outcome_selector(self.Maps))
                     
                     # Success check: Next step visible
                     if self.page.is_visible(self.Maps["tab_ek_paketler"]):
                         logger.info("Captcha successful (Next step visible)")
+                        ticket.report(True)
                         return True
                         
                     # Error check: Input still visible + Error message?
-                    error_el = self.page.query_selector('.atom-input-message_inputMessage__text__error__jF1_D')
+                    error_el = self.page.query_selector(CAPTCHA_ERROR_SELECTOR)
                     if error_el and error_el.is_visible():
                          logger.warning(f"Captcha Error: {error_el.inner_text()}. Retrying...")
+                         ticket.report(False)
                          self.take_screenshot(f"captcha_error_attempt_{attempt}")
-                         self.page.click(self.Maps["captcha_refresh"])
-                         self.page.wait_for_timeout(1500)
+                         prefetched = self._refresh_and_submit(src)
                          continue
                     
                     # Check for "Invalid Number" Modal (e.g. "Girmiş olduğunuz numara Turkcell’den hizmet almamaktadır.")
-                    # Selector guess based on screenshot: .ant-modal-content or similar
                     try:
-                        modal_text_el = self.page.query_selector('.ant-modal-body')
+                        modal_text_el = self.page.query_selector(MODAL_SELECTOR)
                         if modal_text_el and modal_text_el.is_visible():
                             text = modal_text_el.inner_text()
-                            if "hizmet almamaktadır" in text or "Türk Telekom" in text or "Vodafone" in text:
+                            if is_invalid_number(text):
                                 logger.error(f"Invalid Phone Number Error: {text}")
                                 self.take_screenshot("invalid_number_modal")
                                 return False # Stop retrying, this is a fatal error for this number
@@ -138,14 +157,15 @@ class SecurityMixin:
                     # Fallback check
                     if self.page.is_hidden(self.Maps["captcha_input"]):
                          logger.info("Captcha successful (Input hidden)")
+                         ticket.report(True)
                          return True
                     
                     # If we are here, it means we are still on the page, input is visible, 
                     # but no specific error was found. Treat as failure and retry.
                     logger.warning("Captcha kabul edilmedi veya hata mesajı algılanamadı. Tekrar deneniyor...")
+                    ticket.report(False)
                     self.take_screenshot(f"captcha_unknown_state_attempt_{attempt}")
-                    self.page.click(self.Maps["captcha_refresh"])
-                    self.page.wait_for_timeout(2000)
+                    prefetched = self._refresh_and_submit(src)
                     continue
                          
                 except Exception as e:
@@ -153,8 +173,7 @@ class SecurityMixin:
                     self.take_screenshot(f"captcha_check_error_{attempt}")
                     # If check failed, try refreshing anyway to be safe
                     try:
-                        self.page.click(self.Maps["captcha_refresh"])
-                        self.page.wait_for_timeout(2000)
+                        prefetched = self._refresh_and_submit(src)
                     except:
                         pass
             
@@ -168,6 +187,39 @@ class SecurityMixin:
             self.take_screenshot("captcha_fatal_error")
             return False
 
+    def _refresh_captcha(self, old_src: str = None):
+        """
+        Gets a new captcha image and returns its src. Refresh is only clicked
+        if the site did not already swap the image after the rejected answer;
+        then waits until the image actually changes.
+        """
+        try:
+            current = self.page.get_attribute(self.Maps["captcha_img"], "src", timeout=1000)
+        except Exception:
+            current = None
+
+        if not old_src or not current or current == old_src:
+            self.page.click(self.Maps["captcha_refresh"])
+            self.wait_for_function_step('captcha_refreshed', CAPTCHA_REFRESHED_JS, arg=[self.Maps["captcha_img"], old_src or ""])
+            try:
+                current = self.page.get_attribute(self.Maps["captcha_img"], "src", timeout=1000)
+            except Exception:
+                current = None
+        return current
+
+    def _refresh_and_submit(self, old_src: str = None):
+        """Refresh and hand the new image to the solver right away; returns its ticket or None."""
+        new_src = self._refresh_captcha(old_src)
+        if not new_src or new_src == old_src or not new_src.startswith("data:"):
+            return None
+        return self.captcha_solver.submit(new_src)
+
+    def captcha_summary(self) -> str:
+        """Captcha attempts of this order and the per-backend counters of this worker."""
+        tickets = getattr(self, 'captcha_tickets', [])
+        winners = [t.winner or '-' for t in tickets]
+        return f"Captcha: {len(tickets)} attempts (winners: {', '.join(winners) or 'none'}), backends: {self.captcha_solver.stats()}"
+
     def _submit_sms_code(self, iframe_selector, code, log_callback=None) -> (bool, str):
         """
         Helper to enter SMS code into the 3D secure iframe and submit.
@@ -182,7 +234,7 @@ class SecurityMixin:
                     if frame:
                         break
                 logger.warning(f"Iframe not ready, retry {retry+1}/3...")
-                time.sleep(2)
+                self.wait_for_selector_step('iframe_ready', iframe_selector, state="attached")
             
             if not frame:
                 return False, "Iframe not accessible after retries"
@@ -190,23 +242,8 @@ class SecurityMixin:
             logger.info(f"Submitting code: {code}")
             
             # Find Input
-            input_selectors = [
-                'input[name="hasMasked"]',        # IstanbulKart/PayCell specific
-                'input[name="otpCode"]', 
-                'input[name="code"]',
-                'input[id="code"]',
-                'input.password-input',
-                'input[type="tel"]',
-                'input[type="number"]',
-                'input[type="password"]', 
-                'input[type="text"][maxlength="6"]',
-                'input[name="password"]',
-                'input[id*="sms"]',
-                'input[id*="code"]'
-            ]
-            
             input_el = None
-            for sel in input_selectors:
+            for sel in SMS_INPUT_SELECTORS:
                 input_el = frame.query_selector(sel)
                 if input_el:
                     logger.info(f"Found input with selector: {sel}")
@@ -216,8 +253,7 @@ class SecurityMixin:
             if not input_el:
                 logger.info("Specific input selectors failed. Trying smart fallback...")
                 try:
-                    # Find all inputs that are NOT hidden/submit/checkbox/radio/button/image
-                    all_inputs = frame.query_selector_all('input:not([type="hidden"]):not([type="submit"]):not([type="button"]):not([type="image"]):not([type="checkbox"]):not([type="radio"])')
+                    all_inputs = frame.query_selector_all(FREE_INPUTS)
                     
                     visible_inputs = []
                     for inp in all_inputs:
@@ -248,20 +284,8 @@ class SecurityMixin:
                 logger.info("Typed SMS code.")
                 self.take_screenshot("3d_secure_code_filled")
                 
-                submit_selectors = [
-                    '#btn-commit',                    # IstanbulKart/PayCell specific
-                    '#DevamEt',                       # Specific ID provided by user
-                    'input[name="DevamEt"]',          # Specific Name provided by user
-                    'button:has-text("Devam")',
-                    'input[type="submit"]',
-                    'button[type="submit"]',
-                    'button:has-text("Gönder")',
-                    'button:has-text("Onayla")',
-                    'button:has-text("Submit")'
-                ]
-                
                 submit_btn = None
-                for sel in submit_selectors:
+                for sel in SMS_SUBMIT_SELECTORS:
                     submit_btn = frame.query_selector(sel)
                     if submit_btn:
                         # Check visibility
@@ -277,7 +301,7 @@ class SecurityMixin:
                         submit_btn.click(timeout=3000)
                     except Exception as e:
                         logger.warning(f"Standard click failed ({e}). Trying JS click.")
-                        frame.evaluate("arguments[0].click();", submit_btn)
+                        frame.evaluate(CLICK_JS, submit_btn)
                     
                     logger.info("Clicked Submit/Continue.")
                 else:
@@ -290,139 +314,172 @@ class SecurityMixin:
                         self.take_screenshot("3d_secure_no_submit_btn")
                         return False, "Submit button not found and Enter key failed"
                     
-                logger.info("Waiting for transaction processing (polling)...")
+                logger.info("Waiting for transaction processing...")
+                if os.getenv('THREEDS_OUTCOME_DETECTOR', 'True') == 'True':
+                    with self.measure_phase('3ds_result', mode='detector'):
+                        return self._await_3ds_result(iframe_selector, log_callback)
+                with self.measure_phase('3ds_result', mode='polling'):
+                    return self._poll_3ds_result(iframe_selector, log_callback)
+                # Removed defunct else block since Enter fallback handles missing buttons
+            else:
+                return False, "Input field for code not found"
+        except Exception as e:
+            logger.error(f"Error in _submit_sms_code: {e}")
+            return False, str(e)
+
+    def _await_3ds_result(self, iframe_selector, log_callback=None, timeout: int = 60) -> (bool, str):
+        """
+        Result of the submitted code from the first decisive page/frame signal
+        (ThreeDSOutcomeDetector); one screenshot of the final state.
+        """
+        detector = ThreeDSOutcomeDetector(self.page, iframe_selector, iframe_wrapper_selector(self.Maps))
+        try:
+            signal = detector.wait(timeout, closed_grace_ms=self.WAIT_BUDGETS_MS['post_3ds_result'])
+        finally:
+            detector.close()
+
+        if signal is None:
+            # Final fallback after timeout
+            self.take_screenshot("3d_secure_poll_timeout")
+            return timeout_verdict(bool(self.page.query_selector(iframe_selector)))
+
+        verdict = threeds_verdict(signal)
+        if verdict:
+            ok, message, screenshot, notify = verdict
+            self.take_screenshot(screenshot)
+            if notify and log_callback:
+                log_callback(notify)
+            return ok, message
+
+        # Iframe closed without any result text
+        self.take_screenshot("post_3d_secure_check")
+        return closed_verdict(self.page.is_visible(CARD_FORM_SELECTOR))
+
+    def _poll_3ds_result(self, iframe_selector, log_callback=None) -> (bool, str):
+        """
+        Previous polling loop (THREEDS_OUTCOME_DETECTOR=False): screenshot, page
+        HTML and iframe text every tick. Kept to compare the phase metrics.
+        """
+        # Poll for result instead of blind sleep
+        poll_start = time.time()
+        poll_timeout = 60  # max 60 seconds
+        
+        while time.time() - poll_start < poll_timeout:
+            self.take_screenshot(f"3d_secure_poll_{int(time.time()-poll_start)}")
+            
+            # Check 1 & 2: iframe/wrapper gone = bank processed, back to main page
+            iframe_still = self.page.query_selector(iframe_selector)
+            wrapper = self.page.query_selector(iframe_wrapper_selector(self.Maps))
+            
+            if not iframe_still and not wrapper:
+                logger.info("3D Secure iframe/wrapper closed. Verifying transaction result on main page...")
                 
-                # Poll for result instead of blind sleep
-                poll_start = time.time()
-                poll_timeout = 60  # max 60 seconds
+                # Wait for the result text to render instead of a fixed sleep
+                self.wait_for_function_step('post_3ds_result', PAGE_TEXT_JS, arg=SUCCESS_KEYWORDS + ERROR_KEYWORDS)
+                self.take_screenshot("post_3d_secure_check")
                 
-                while time.time() - poll_start < poll_timeout:
-                    self.take_screenshot(f"3d_secure_poll_{int(time.time()-poll_start)}")
+                # Check for Success Indicators
+                page_content = self.page.content()
+                if any(kw in page_content for kw in SUCCESS_KEYWORDS):
+                    logger.info("Transaction Verified: SUCCESS")
+                    return True, "3D Secure completed and verified success (Success message found)."
                     
-                    # Check 1 & 2: iframe/wrapper gone = bank processed, back to main page
-                    iframe_still = self.page.query_selector(iframe_selector)
-                    wrapper = self.page.query_selector(
-                        self.Maps.get("iframe_wrapper", '.Iframe_iframe-wrapper--open__tLv_K')
-                    )
+                # Check for Error Indicators
+                if any(kw in page_content for kw in ERROR_KEYWORDS):
+                    logger.error("Transaction Verified: FAILED (Error detected on page)")
+                    self.take_screenshot("post_3d_secure_failed")
+                    return False, "3D Secure closed but error detected on page."
                     
-                    if not iframe_still and not wrapper:
-                        logger.info("3D Secure iframe/wrapper closed. Verifying transaction result on main page...")
-                        
-                        # Wait for page update/redirect
-                        time.sleep(3) 
-                        self.take_screenshot("post_3d_secure_check")
-                        
-                        # Check for Success Indicators
-                        # "Siparişiniz Alındı", "Teşekkürler", "İşleminiz başarıyla", "Paket yükleme talebiniz alınmıştır"
-                        page_content = self.page.content()
-                        
-                        success_keywords = [
-                            "Siparişiniz Alındı",
-                            "Teşekkürler",
-                            "başarıyla",
-                            "Paket yükleme talebiniz alınmıştır",  # From user screenshot
-                            "bilgilendirme yapılacaktır"
-                        ]
-                        
-                        if any(kw in page_content for kw in success_keywords):
-                            logger.info("Transaction Verified: SUCCESS")
-                            return True, "3D Secure completed and verified success (Success message found)."
-                            
-                        # Check for Error Indicators
-                        # "Hata", "Başarısız", "Reddedildi"
-                        # Also check for specific error elements if known
-                        if "Hata" in page_content or "Başarısız" in page_content or "Reddedildi" in page_content:
-                            logger.error("Transaction Verified: FAILED (Error detected on page)")
-                            self.take_screenshot("post_3d_secure_failed")
-                            return False, "3D Secure closed but error detected on page."
-                            
-                        # Ambiguous Case
-                        # If we are back on the payment form (e.g. "Kart Numarası" input is visible), it failed silent/softly
-                        if self.page.is_visible('input[name="cardNumber"]'):
-                            logger.warning("Transaction Verified: FAILED (Returned to payment form)")
-                            return False, "Returned to payment form without success message."
-                            
-                        # Final Default: Assume failure if no positive confirmation
-                        logger.warning("Transaction Verified: AMBIGUOUS (No success/error message found). Assuming Failure.")
-                        return False, "Ambiguous result after 3D Secure."
+                # Back on the payment form or no positive confirmation: failed
+                return closed_verdict(self.page.is_visible(CARD_FORM_SELECTOR))
+            
+            # Check 3: Try reading iframe content for result keywords
+            try:
+                current_frame = iframe_still.content_frame()
+                if current_frame:
+                    body_text = current_frame.inner_text('body', timeout=3000)
+                    if any(kw in body_text for kw in FRAME_SUCCESS_KEYWORDS):
+                        logger.info(f"3D Secure SUCCESS detected: {body_text[:100]}")
+                        return True, body_text[:200]
                     
-                    # Check 3: Try reading iframe content for result keywords
-                    try:
-                        current_frame = iframe_still.content_frame()
-                        if current_frame:
-                            body_text = current_frame.inner_text('body', timeout=3000)
-                            if any(kw in body_text for kw in ["Başarılı", "Successful", "Onaylandı", "Approved"]):
-                                logger.info(f"3D Secure SUCCESS detected: {body_text[:100]}")
-                                return True, body_text[:200]
-                            
-                            # Check for Insufficient Limit specifically to fail fast
-                            if "limit" in body_text.lower() and ("yetersiz" in body_text.lower() or "yeterli değil" in body_text.lower()):
-                                 logger.error(f"3D Secure FAILURE: Insufficient Limit detected inside iframe.")
-                                 if log_callback:
-                                     log_callback("3DS_ERROR_LIMIT")
-                                 return False, "Yetersiz Bakiye/Limit Hatası"
+                    # Check for Insufficient Limit specifically to fail fast
+                    if is_limit_error(body_text):
+                         logger.error(f"3D Secure FAILURE: Insufficient Limit detected inside iframe.")
+                         if log_callback:
+                             log_callback("3DS_ERROR_LIMIT")
+                         return False, LIMIT_MESSAGE
 
-                            if any(kw in body_text for kw in ["Başarısız", "Failed", "Reddedildi", "Declined", "Hata"]):
-                                logger.error(f"3D Secure FAILURE detected: {body_text[:100]}")
-                                return False, body_text[:200]
-                    except Exception:
-                        logger.info("Frame content not accessible, continuing poll...")
+                    if any(kw in body_text for kw in FRAME_FAILURE_KEYWORDS):
+                        logger.error(f"3D Secure FAILURE detected: {body_text[:100]}")
+                        return False, body_text[:200]
+            except Exception:
+                logger.info("Frame content not accessible, continuing poll...")
+            
+            # Check for Error Modal on Main Page (outside iframe)
+            # User provided HTML: .ant-modal .ErrorModal_error-modal__description__7pBeI
+            try:
+                error_modal = self.page.query_selector(MODAL_SELECTOR)
+                if error_modal and error_modal.is_visible():
+                    modal_text = error_modal.inner_text().strip()
+                    logger.error(f"3D Secure FAILURE: Error Modal detected: {modal_text}")
+                    self.take_screenshot("error_modal_detected")
                     
-                    # Check for Error Modal on Main Page (outside iframe)
-                    # User provided HTML: .ant-modal .ErrorModal_error-modal__description__7pBeI
-                    try:
-                        error_modal = self.page.query_selector('.ant-modal-body')
-                        if error_modal and error_modal.is_visible():
-                            modal_text = error_modal.inner_text().strip()
-                            logger.error(f"3D Secure FAILURE: Error Modal detected: {modal_text}")
-                            self.take_screenshot("error_modal_detected")
-                            
-                            # Specific Check for Limit
-                            if "limit" in modal_text.lower() and ("yetersiz" in modal_text.lower() or "yeterli değil" in modal_text.lower()):
-                                if log_callback:
-                                    log_callback("3DS_ERROR_LIMIT")
-                                return False, "Yetersiz Bakiye/Limit Hatası"
-                            
-                            # General Error - Return the text found in modal
-                             # General Error - Return the text found in modal
-                            if log_callback:
-                                log_callback(f"3DS_ERROR_MODAL: {modal_text[:50]}")
-                            return False, f"İşlem Hatası: {modal_text}"
+                    # Specific Check for Limit
+                    if is_limit_error(modal_text):
+                        if log_callback:
+                            log_callback("3DS_ERROR_LIMIT")
+                        return False, LIMIT_MESSAGE
+                    
+                    # General Error - Return the text found in modal
+                    if log_callback:
+                        log_callback(f"3DS_ERROR_MODAL: {modal_text[:50]}")
+                    return False, f"İşlem Hatası: {modal_text}"
 
-                    except Exception:
-                        pass
+            except Exception:
+                pass
 
-                    # Check Main Page for "İşlem Başarısız" even if iframe is present
-                    # (Sometimes the error is on the main page background or overlay)
-                    try:
-                        main_page_content = self.page.content()
-                        if "İşlem Başarısız" in main_page_content or "Transaction Failed" in main_page_content:
-                            logger.error("3D Secure FAILURE: 'İşlem Başarısız' text found on main page.")
-                            if log_callback:
-                                log_callback("3DS_ERROR_GENERIC") # Or specific if we can parse it
-                            return False, "İşlem Başarısız (Main Page)"
-                    except Exception:
-                        pass
-                    
-                    time.sleep(3)
-                
-                # Final fallback after timeout
-                self.take_screenshot("3d_secure_poll_timeout")
-                
-                # Last check: is iframe still there?
-                if not self.page.query_selector(iframe_selector):
-                    return True, "3D Secure completed (iframe gone after poll timeout)"
-                
-                return False, "Timeout: 3D Secure did not complete within poll window"
-                # Removed defunct else block since Enter fallback handles missing buttons
-            else:
-                return False, "Input field for code not found"
-        except Exception as e:
-            logger.error(f"Error in _submit_sms_code: {e}")
-            return False, str(e)
+            # Check Main Page for "İşlem Başarısız" even if iframe is present
+            # (Sometimes the error is on the main page background or overlay)
+            try:
+                main_page_content = self.page.content()
+                if any(kw in main_page_content for kw in PAGE_FAILED_KEYWORDS):
+                    logger.error("3D Secure FAILURE: 'İşlem Başarısız' text found on main page.")
+                    if log_callback:
+                        log_callback("3DS_ERROR_GENERIC") # Or specific if we can parse it
+                    return False, "İşlem Başarısız (Main Page)"
+            except Exception:
+                pass
+            
+            # Wake up early when the bank frame or the page navigates
+            self.wait_for_event_step('sms_result_tick', 'framenavigated')
+        
+        # Final fallback after timeout
+        self.take_screenshot("3d_secure_poll_timeout")
+        return timeout_verdict(bool(self.page.query_selector(iframe_selector)))
 
-    def handle_3d_secure(self, log_callback=None) -> (bool, str):
+    def _claim_pushed_sms(self, pushed, session):
+        """SMS text of a pushed message if it is ours: given to this session, or unmatched and claimed now."""
+        if pushed.get('session_key') == session.key:
+            return pushed['body']
+        if pushed.get('session_key') or not pushed.get('sms_id'):
+            return None
+        sms_log = SMSLog.objects.filter(id=pushed['sms_id']).first()
+        if not sms_log or session.score(sms_log.sender, sms_log.message_content, sms_log.received_at.timestamp()) is None:
+            return None
+        return sms_log.message_content if SMSCorrelator.claim(sms_log, session) else None
+
+    def handle_3d_secure(self, log_callback=None, order_id=None, amount=None) -> (bool, str):
         logger.info("Handling 3D Secure")
+        # Registered so the webhook can tell this payment's SMS from the ones of
+        # other payments running in parallel (bank sender, card digits, amount, start time)
+        sms_session = SMSCorrelator.open_session(
+            order_id=order_id,
+            card=self.card,
+            amount=amount or getattr(self, 'last_selected_price', None)
+        )
+        # Subscribed before anything else so an SMS arriving while the bank page
+        # loads is buffered; SMS that arrived earlier are found by the DB check
+        sms_subscription = SMSBus.subscribe(session_key=sms_session.key)
         try:
             # Ensure cookies are accepted before waiting for iframe (might block view)
             handle_cookies(self.page)
@@ -436,31 +493,25 @@ class SecurityMixin:
             # Track when we started waiting for 3DS to filter old SMS
             process_start_time = timezone.now()
             
-            iframe_wrapper_selector = self.Maps.get("iframe_wrapper", '.Iframe_iframe-wrapper--open__tLv_K')
-            iframe_name = self.Maps.get("iframe_name", 'three-d-iframe')
-            iframe_selector = f'iframe[name="{iframe_name}"]'
+            wrapper_selector = iframe_wrapper_selector(self.Maps)
+            frame_selector = iframe_selector(self.Maps)
             
             logger.info(f"Waiting for 3D Secure iframe (up to {timeout_seconds}s)...")
             
             iframe_found = False
             while time.time() - start_time < timeout_seconds:
-                # Check for wrapper
-                if self.page.query_selector(iframe_wrapper_selector):
-                    logger.info("Iframe wrapper found.")
+                # Wrapper or iframe, whichever is attached first (5s slices for progress logs)
+                if self.wait_for_selector_step(
+                    'iframe_appear',
+                    f"{wrapper_selector}, {frame_selector}",
+                    state="attached",
+                    budget_ms=5000
+                ):
+                    logger.info("3D Secure iframe/wrapper found.")
                     iframe_found = True
                     break
                 
-                # Check for iframe directly
-                if self.page.query_selector(iframe_selector):
-                    logger.info("Iframe element found directly.")
-                    iframe_found = True
-                    break
-                
-                # Log waiting status every 5 seconds
-                if int(time.time() - start_time) % 5 == 0:
-                    logger.info(f"Waiting for 3D Secure iframe... ({int(time.time() - start_time)}s passed)")
-                
-                time.sleep(1)
+                logger.info(f"Waiting for 3D Secure iframe... ({int(time.time() - start_time)}s passed)")
             
             if not iframe_found:
                  logger.error("Timeout: 3D Secure iframe not found after waiting.")
@@ -468,7 +519,7 @@ class SecurityMixin:
                  return False, "Timeout waiting for 3D Secure Iframe"
 
             # Get frame
-            frame_element = self.page.query_selector(iframe_selector)
+            frame_element = self.page.query_selector(frame_selector)
             if frame_element:
                 frame = frame_element.content_frame()
                 if frame:
@@ -491,8 +542,10 @@ class SecurityMixin:
 
                         code_entered = False
                         force_submit_attempted = False
+                        last_db_check = 0.0
                         
                         while time.time() - sms_start_time < sms_wait_timeout:
+                            waited = False
                             try:
                                 content = frame.content()
                                 body_text = frame.inner_text('body').strip().replace('\n', ' ')
@@ -505,21 +558,19 @@ class SecurityMixin:
                                             # Find the form targeting this iframe (in the main page context)
                                             # We need to step out to main page to find the form
                                             # But 'self.page' is the main page.
-                                            form_selector = '.Iframe_iframe-wrapper__form__dTpu6'
-                                            form = self.page.query_selector(form_selector)
+                                            form = self.page.query_selector(THREEDS_FORM_SELECTOR)
                                             if form:
-                                                logger.info(f"Found form {form_selector}. Submitting via JS...")
-                                                self.page.evaluate("document.querySelector('.Iframe_iframe-wrapper__form__dTpu6').submit()")
+                                                logger.info(f"Found form {THREEDS_FORM_SELECTOR}. Submitting via JS...")
+                                                self.page.evaluate("form => form.submit()", form)
                                                 force_submit_attempted = True
-                                                time.sleep(5) # Wait for reload
+                                                # Wait for the frame to reload
+                                                self.wait_for_event_step('iframe_reload', 'framenavigated')
                                                 continue
                                             else:
                                                 logger.error("Could not find the 3D Secure form to force submit.")
                                         except Exception as e:
                                             logger.error(f"Force submit failed: {e}")
                                             
-                                # Debug: Periodic Dump
-                                
                                 # Debug: Periodic Dump
                                 if int(time.time() - sms_start_time) % 10 == 0:
                                      logger.info(f"3DS Frame Text: {body_text[:100]}...")
@@ -528,50 +579,53 @@ class SecurityMixin:
                                              f.write(content)
                                      except: pass
 
-                                # Check for common keywords indicating code entry screen
-                                # Use case-insensitive check
-                                content_lower = content.lower()
-                                keywords = ["sms", "şifre", "dogrulama", "doğrulama", "code", "password", "tek kullanımlık", "onay", "secure", "3d"]
-                                
-                                # Also check if any input field is visible
+                                # Code entry screen: keywords in the frame or a visible code input
                                 input_visible = False
                                 try:
-                                    # Quick check for common input types
-                                    if frame.is_visible('input[type="password"]') or \
-                                       frame.is_visible('input[name="otpCode"]') or \
-                                       frame.is_visible('input[id="code"]') or \
-                                       frame.is_visible('input[type="text"]'): # Broaden check
-                                        input_visible = True
+                                    input_visible = any(frame.is_visible(sel) for sel in SMS_SCREEN_INPUTS)
                                 except:
                                     pass
 
-                                if any(k in content_lower for k in keywords) or input_visible:
+                                if is_sms_screen(content) or input_visible:
                                     # Take screenshot of the actual SMS entry screen
                                     # verify we haven't already done this repeatedly
                                     if int(time.time() - sms_start_time) % 10 == 0:
                                         self.take_screenshot("3d_secure_sms_screen_ready")
                                     
                                     if int(time.time() - sms_start_time) % 5 == 0:
-                                        logger.info("Screen keywords matched or Input visible. Checking DB for SMS...")
+                                        logger.info("Screen keywords matched or Input visible. Waiting for SMS...")
                                         if log_callback:
                                             log_callback("3DS_WAITING_SMS")
 
-                                    # Check Database for new SMS
-                                    lookback_time = timezone.now() - timezone.timedelta(minutes=3)
-                                    last_sms = SMSLog.objects.filter(received_at__gte=lookback_time).order_by('-received_at').first()
+                                    # Check Database for this session's SMS: on the first pass (SMS that arrived before
+                                    # we subscribed), then only every DB_FALLBACK_INTERVAL seconds when push is available
+                                    sms_text = None
+                                    if not sms_subscription or time.time() - last_db_check >= SMSBus.DB_FALLBACK_INTERVAL:
+                                        last_db_check = time.time()
+                                        claimed_sms = SMSCorrelator.claim_from_db(sms_session)
+                                        if claimed_sms:
+                                            sms_text = claimed_sms.message_content
+                                            logger.info(f"SMS found in DB for {sms_session.key} from {claimed_sms.sender}: {sms_text}")
+
+                                    # SMS pushed by the webhook: blocks up to 2s and returns as soon as it arrives
+                                    if not sms_text and sms_subscription:
+                                        waited = True
+                                        pushed = sms_subscription.wait(timeout=2)
+                                        if pushed:
+                                            sms_text = self._claim_pushed_sms(pushed, sms_session)
+                                            if sms_text:
+                                                logger.info(f"SMS pushed from {pushed['sender']}: {sms_text}")
                                     
-                                    if last_sms:
-                                        logger.info(f"SMS found in DB (last 3 mins) from {last_sms.sender}: {last_sms.message_content}")
+                                    if sms_text:
                                         if log_callback:
-                                            log_callback(f"3DS_SMS_RECEIVED: {last_sms.message_content[:10]}...")
+                                            log_callback(f"3DS_SMS_RECEIVED: {sms_text[:10]}...")
                                         
                                         # Extract Code
-                                        match = re.search(r'\b\d{6}\b', last_sms.message_content)
-                                        if match:
-                                            code = match.group(0)
+                                        code = sms_code(sms_text)
+                                        if code:
                                             logger.info(f"Extracted Code: {code}")
                                             self.take_screenshot("sms_code_found_entering")
-                                            return self._submit_sms_code(iframe_selector, code, log_callback)
+                                            return self._submit_sms_code(frame_selector, code, log_callback)
                                         else:
                                             logger.warning("SMS found but no 6-digit code extracted.")
                                     
@@ -583,7 +637,8 @@ class SecurityMixin:
                                 if int(time.time() - sms_start_time) % 5 == 0:
                                     logger.info(f"Waiting for SMS... ({int(time.time() - sms_start_time)}s passed)")
                                     
-                                time.sleep(2) 
+                                if not waited:
+                                    time.sleep(2)
                             
                             except Exception as e:
                                 logger.warning(f"Error accessing frame content (Navigation?): {e}")
@@ -608,3 +663,7 @@ class SecurityMixin:
             logger.error("3D Secure ekranı açılmadı. Ödeme bilgileri hatalı olabilir veya banka reddetti.")
             self.take_screenshot("3d_secure_failed_exception")
             return False, f"Exception: {str(e)}"
+        finally:
+            SMSCorrelator.close_session(sms_session)
+            if sms_subscription:
+                sms_subscription.close()
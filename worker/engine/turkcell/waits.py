@@ -0,0 +1,153 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class WaitMixin:
+    """
+    Condition-based waits replacing fixed sleeps.
+    Every wait has a per-step timeout budget and records how long it actually
+    waited, so slow steps show up in wait_summary() instead of hiding in sleeps.
+    Whole phases (e.g. waiting for the 3DS result) are measured with
+    measure_phase(): wall time, worker CPU and browser main-thread time.
+    """
+
+    # Per-step timeout budgets (ms). The wait returns as soon as the condition holds.
+    WAIT_BUDGETS_MS = {
+        'cookie_banner': 3000,
+        'form_ready': 10000,
+        'upload_type_checked': 3000,
+        'phone_focus': 1500,
+        'phone_digit': 1000,
+        'phone_value': 3000,
+        'phone_cleared': 1500,
+        'captcha_focus': 1000,
+        'captcha_submit_enabled': 3000,
+        'captcha_outcome': 2000,
+        'captcha_refreshed': 3000,
+        'tab_cards': 3000,
+        'catalog_response': 5000,
+        'tl_card_selected': 2000,
+        'continue_enabled': 2000,
+        'package_confirm_button': 3000,
+        'payment_submit_enabled': 2000,
+        'payment_submitted': 2000,
+        'iframe_appear': 5000,
+        'iframe_ready': 2000,
+        'iframe_reload': 5000,
+        'sms_result_tick': 3000,
+        'post_3ds_result': 3000,
+    }
+
+    def _record_wait(self, step: str, started: float, budget_ms: int, met: bool):
+        waited_ms = (time.perf_counter() - started) * 1000
+        if not hasattr(self, 'wait_timings'):
+            self.wait_timings = []
+        self.wait_timings.append({'step': step, 'waited_ms': waited_ms, 'budget_ms': budget_ms, 'met': met})
+        logger.debug(f"Wait '{step}': {waited_ms:.0f}/{budget_ms} ms ({'met' if met else 'timed out'})")
+
+    def wait_step(self, step: str, condition, budget_ms: int = None) -> bool:
+        """
+        Runs condition(timeout_ms), a Playwright wait that raises on timeout.
+        Returns True if the condition was met within the step budget.
+        """
+        budget_ms = budget_ms or self.WAIT_BUDGETS_MS.get(step, 3000)
+        started = time.perf_counter()
+        try:
+            condition(budget_ms)
+            met = True
+        except Exception:
+            met = False
+        self._record_wait(step, started, budget_ms, met)
+        return met
+
+    def wait_for_selector_step(self, step: str, selector: str, state: str = "visible", frame=None, budget_ms: int = None) -> bool:
+        target = frame or self.page
+        return self.wait_step(step, lambda t: target.wait_for_selector(selector, state=state, timeout=t), budget_ms)
+
+    def wait_for_function_step(self, step: str, expression: str, arg=None, frame=None, budget_ms: int = None) -> bool:
+        target = frame or self.page
+        return self.wait_step(
+            step,
+            lambda t: target.wait_for_function(expression, arg=arg, timeout=t, polling="raf"),
+            budget_ms
+        )
+
+    def wait_for_event_step(self, step: str, event: str, budget_ms: int = None) -> bool:
+        return self.wait_step(step, lambda t: self.page.wait_for_event(event, timeout=t), budget_ms)
+
+    def wait_summary(self) -> str:
+        """Total and per-step wait time for this order."""
+        timings = getattr(self, 'wait_timings', [])
+        if not timings:
+            return "Waits: none recorded"
+
+        per_step = {}
+        for t in timings:
+            entry = per_step.setdefault(t['step'], {'count': 0, 'ms': 0.0, 'timeouts': 0})
+            entry['count'] += 1
+            entry['ms'] += t['waited_ms']
+            if not t['met']:
+                entry['timeouts'] += 1
+
+        total_ms = sum(t['waited_ms'] for t in timings)
+        slowest = sorted(per_step.items(), key=lambda kv: kv[1]['ms'], reverse=True)[:6]
+        parts = ", ".join(
+            f"{step}={v['ms']:.0f}ms/{v['count']}x" + (f" ({v['timeouts']} timeouts)" if v['timeouts'] else "")
+            for step, v in slowest
+        )
+        return f"Waits: {total_ms:.0f} ms in {len(timings)} waits [{parts}]"
+
+    def _browser_task_seconds(self):
+        """Renderer main-thread busy time (Chromium CDP Performance.TaskDuration), None if unavailable."""
+        try:
+            if getattr(self, '_cdp_session', None) is None:
+                self._cdp_session = self.page.context.new_cdp_session(self.page)
+                self._cdp_session.send("Performance.enable")
+            metrics = self._cdp_session.send("Performance.getMetrics")["metrics"]
+            return next((m["value"] for m in metrics if m["name"] == "TaskDuration"), None)
+        except Exception:
+            self._cdp_session = False
+            return None
+
+    def _phase_marks(self, browser_started) -> tuple:
+        """Counters at the start of a phase: screenshots, browser CPU, worker CPU, wall clock."""
+        return getattr(self, 'screenshots_taken', 0), browser_started, time.process_time(), time.perf_counter()
+
+    def _record_phase(self, phase: str, marks: tuple, browser_ended, labels: dict):
+        screenshots, browser_started, cpu_started, started = marks
+        entry = {
+            'phase': phase,
+            'wall_ms': (time.perf_counter() - started) * 1000,
+            'cpu_ms': (time.process_time() - cpu_started) * 1000,
+            'browser_ms': (browser_ended - browser_started) * 1000 if browser_started is not None and browser_ended is not None else None,
+            'screenshots': getattr(self, 'screenshots_taken', 0) - screenshots,
+            **labels,
+        }
+        if not hasattr(self, 'phase_timings'):
+            self.phase_timings = []
+        self.phase_timings.append(entry)
+        logger.info(f"Phase '{phase}': {self._format_phase(entry)}")
+
+    @contextmanager
+    def measure_phase(self, phase: str, **labels):
+        """Records wall time, worker CPU, browser CPU and screenshots of a phase."""
+        marks = self._phase_marks(self._browser_task_seconds())
+        try:
+            yield
+        finally:
+            self._record_phase(phase, marks, self._browser_task_seconds(), labels)
+
+    @staticmethod
+    def _format_phase(entry: dict) -> str:
+        browser = f"{entry['browser_ms']:.0f}" if entry['browser_ms'] is not None else "-"
+        labels = "".join(f", {k}={v}" for k, v in entry.items() if k not in ('phase', 'wall_ms', 'cpu_ms', 'browser_ms', 'screenshots'))
+        return (f"wall {entry['wall_ms']:.0f} ms, worker cpu {entry['cpu_ms']:.0f} ms, "
+                f"browser {browser} ms, {entry['screenshots']} screenshots{labels}")
+
+    def phase_summary(self) -> str:
+        timings = getattr(self, 'phase_timings', [])
+        if not timings:
+            return "Phases: none recorded"
+        return "Phases: " + "; ".join(f"{t['phase']}: {self._format_phase(t)}" for t in timings)
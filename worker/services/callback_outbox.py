@@ -0,0 +1,177 @@
+import os
+import time
+import uuid
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .matik_api import MatikAPIService
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackOutboxService:
+    """
+    Durable queue of Matik result callbacks (core.CallbackOutbox).
+
+    Order flows only enqueue (ref, result) and go on; the dispatch_callbacks
+    task on the 'io' queue delivers them in batches, concurrently, and
+    retries failures with exponential backoff until MAX_ATTEMPTS, after which
+    the row is kept as DEAD for a manual look.
+
+    A row is delivered by whoever claims it (conditional UPDATE on state and
+    claim), so parallel dispatchers never send it twice. A ref has at most one
+    row waiting: enqueueing a newer result for it replaces the unsent one, and
+    enqueueing the same result again is a no-op.
+    """
+
+    BATCH_SIZE = int(os.getenv('CALLBACK_BATCH_SIZE', '50'))
+    MAX_ATTEMPTS = int(os.getenv('CALLBACK_MAX_ATTEMPTS', '8'))
+    # Retry delays: 15s, 30s, 60s ... capped at RETRY_MAX_DELAY
+    RETRY_BASE_DELAY = int(os.getenv('CALLBACK_RETRY_BASE_DELAY', '15'))
+    RETRY_MAX_DELAY = int(os.getenv('CALLBACK_RETRY_MAX_DELAY', '900'))
+    # A SENDING row older than this belongs to a dispatcher that died
+    STALE_AFTER = 300
+    # How long one dispatch run keeps draining before it leaves the rest to the next
+    DISPATCH_BUDGET = 60
+
+    @classmethod
+    def enqueue(cls, external_ref, result: int, order_id=None, dispatch: bool = True):
+        """
+        Records a callback to be sent and returns its CallbackOutbox row
+        (None for orders without an external ref). Never talks to Matik.
+        """
+        from core.models import CallbackOutbox
+
+        if not external_ref:
+            return None
+
+        waiting = CallbackOutbox.objects.filter(
+            external_ref=external_ref,
+            state__in=[CallbackOutbox.State.PENDING, CallbackOutbox.State.SENDING]
+        ).order_by('-created_at').first()
+        if waiting and waiting.result == result:
+            logger.info(f"Callback for ref {external_ref} ({result}) already queued.")
+            return waiting
+        # Only an unclaimed row may change; one being sent stays as it is and the new result queues behind it
+        if waiting and CallbackOutbox.objects.filter(
+            id=waiting.id, state=CallbackOutbox.State.PENDING, claim__isnull=True
+        ).update(result=result, order_id=order_id or waiting.order_id, attempts=0, next_attempt_at=timezone.now()) == 1:
+            row = waiting
+            row.result = result
+            logger.info(f"Queued callback for ref {external_ref} replaced with {result}.")
+        else:
+            row = CallbackOutbox.objects.create(external_ref=external_ref, result=result, order_id=order_id)
+            logger.info(f"Queued callback for ref {external_ref} ({result}).")
+
+        if dispatch:
+            cls.trigger()
+        return row
+
+    @classmethod
+    def trigger(cls):
+        """Wakes a dispatcher; if the broker is down the beat schedule picks the rows up later."""
+        try:
+            from worker.tasks import dispatch_callbacks
+            dispatch_callbacks.delay()
+        except Exception as e:
+            logger.warning(f"Could not trigger callback dispatch: {e}")
+
+    @classmethod
+    def retry_delay(cls, attempts: int) -> int:
+        return min(cls.RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), cls.RETRY_MAX_DELAY)
+
+    @classmethod
+    def release_stale(cls) -> int:
+        from core.models import CallbackOutbox
+
+        released = CallbackOutbox.objects.filter(
+            state=CallbackOutbox.State.SENDING,
+            claimed_at__lt=timezone.now() - timedelta(seconds=cls.STALE_AFTER)
+        ).update(state=CallbackOutbox.State.PENDING, claim=None, claimed_at=None)
+        if released:
+            logger.warning(f"Released {released} callbacks left SENDING by a stopped dispatcher.")
+        return released
+
+    @classmethod
+    def claim_batch(cls, batch_size: int = None) -> list:
+        """
+        Claims up to batch_size due rows for this caller, oldest first and
+        one per ref (the results for a ref must reach Matik in order).
+        """
+        from core.models import CallbackOutbox
+
+        now = timezone.now()
+        busy_refs = set(CallbackOutbox.objects.filter(
+            state=CallbackOutbox.State.SENDING
+        ).values_list('external_ref', flat=True))
+
+        ids, refs = [], set()
+        due = CallbackOutbox.objects.filter(
+            state=CallbackOutbox.State.PENDING, next_attempt_at__lte=now
+        ).order_by('created_at').values_list('id', 'external_ref')
+        for row_id, ref in due[:(batch_size or cls.BATCH_SIZE) * 2]:
+            if ref in refs or ref in busy_refs:
+                continue
+            refs.add(ref)
+            ids.append(row_id)
+            if len(ids) >= (batch_size or cls.BATCH_SIZE):
+                break
+        if not ids:
+            return []
+
+        token = uuid.uuid4().hex
+        CallbackOutbox.objects.filter(id__in=ids, state=CallbackOutbox.State.PENDING).update(
+            state=CallbackOutbox.State.SENDING, claim=token, claimed_at=now
+        )
+        return list(CallbackOutbox.objects.filter(claim=token).order_by('created_at'))
+
+    @classmethod
+    def _finish(cls, row, ok: bool, error: str = ''):
+        from core.models import CallbackOutbox
+
+        rows = CallbackOutbox.objects.filter(id=row.id, claim=row.claim)
+        attempts = row.attempts + 1
+        if ok:
+            rows.update(state=CallbackOutbox.State.SENT, attempts=attempts, sent_at=timezone.now(),
+                        claim=None, last_error='')
+            return 'sent'
+        if attempts >= cls.MAX_ATTEMPTS:
+            rows.update(state=CallbackOutbox.State.DEAD, attempts=attempts, claim=None, last_error=error)
+            logger.error(f"Giving up on callback for ref {row.external_ref} ({row.result}) after {attempts} attempts: {error}")
+            return 'dead'
+        delay = cls.retry_delay(attempts)
+        rows.update(state=CallbackOutbox.State.PENDING, attempts=attempts, claim=None, claimed_at=None,
+                    last_error=error, next_attempt_at=timezone.now() + timedelta(seconds=delay))
+        logger.warning(f"Callback for ref {row.external_ref} failed (attempt {attempts}), retrying in {delay}s.")
+        return 'retry'
+
+    @classmethod
+    def dispatch(cls, batch_size: int = None) -> dict:
+        """Delivers due callbacks batch by batch until none are left or DISPATCH_BUDGET is spent."""
+        totals = {'sent': 0, 'retry': 0, 'dead': 0}
+        cls.release_stale()
+        deadline = time.time() + cls.DISPATCH_BUDGET
+        while time.time() < deadline:
+            rows = cls.claim_batch(batch_size)
+            if not rows:
+                break
+            results = MatikAPIService.send_callbacks([(row.external_ref, row.result) for row in rows])
+            for row, ok in zip(rows, results):
+                totals[cls._finish(row, ok, '' if ok else MatikAPIService.last_error(row.external_ref) or 'callback failed')] += 1
+            # Timing is tracked per dispatcher, not per order
+            for row in rows:
+                MatikAPIService.callback_time(row.external_ref)
+        return totals
+
+    @classmethod
+    def backlog(cls) -> dict:
+        from core.models import CallbackOutbox
+        from django.db.models import Count
+
+        counts = {
+            row['state']: row['n']
+            for row in CallbackOutbox.objects.exclude(state=CallbackOutbox.State.SENT).values('state').annotate(n=Count('id'))
+        }
+        return {state: counts.get(state, 0) for state in ('PENDING', 'SENDING', 'DEAD')}
@@ -0,0 +1,179 @@
+import os
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .sms_correlation import SMSCorrelator
+
+logger = logging.getLogger(__name__)
+
+
+class CardScheduler:
+    """
+    Picks the card of an autonomous order from the card pool: the cards marked
+    use_for_autonomous plus SystemSetting.default_card.
+
+    Candidates are ranked, best first, by:
+      1. balance, less the amounts of its orders in flight, covers the order amount
+      2. under the daily limit (usage_count_24h < DAILY_LIMIT)
+      3. recent decline rate below MAX_DECLINE_RATE (pay/3DS steps of the last DECLINE_WINDOW_HOURS)
+      4. fewest orders in flight on the card (processing or waiting for 3DS)
+      5. lower decline rate, lower 24h usage, the default card, higher balance
+
+    So orders spread over the healthy cards and each card's bank has as few
+    3DS SMS in flight as possible. A card failing 1-3 is still used when no
+    card passes them, as the single default card was. Assignment runs with
+    the pool's rows locked, so orders started together see each other.
+    """
+
+    DAILY_LIMIT = 6
+    DECLINE_WINDOW_HOURS = int(os.getenv('CARD_DECLINE_WINDOW_HOURS', '6'))
+    MAX_DECLINE_RATE = float(os.getenv('CARD_MAX_DECLINE_RATE', '0.5'))
+    # Below this many payments in the window the decline rate is not trusted
+    MIN_PAYMENTS = int(os.getenv('CARD_MIN_PAYMENTS', '3'))
+
+    @classmethod
+    def pool(cls):
+        from core.models import CreditCard, SystemSetting
+
+        default_card = SystemSetting.get_settings().default_card
+        cards = CreditCard.objects.filter(
+            Q(use_for_autonomous=True) | Q(id=default_card.id if default_card else None)
+        ).order_by('id')
+        return cards, default_card
+
+    @classmethod
+    def card_stats(cls, card_ids, exclude_order=None) -> dict:
+        """
+        Per card id: usage_24h, in_flight (and their amount, committed), in_3ds,
+        payments and declines (decline window), completed_1h and completed_24h.
+        """
+        from core.models import Order, OrderStep
+
+        now = timezone.now()
+        stats = {
+            card_id: {
+                'usage_24h': 0, 'in_flight': 0, 'committed': 0, 'in_3ds': 0, 'payments': 0, 'declines': 0,
+                'completed_1h': 0, 'completed_24h': 0,
+            }
+            for card_id in card_ids
+        }
+        orders = Order.objects.filter(selected_card_id__in=card_ids)
+        if exclude_order is not None:
+            orders = orders.exclude(id=exclude_order.id)
+
+        # Orders stuck in PROCESSING after a crash stop counting once a 3DS wait would have expired
+        in_flight_since = now - timedelta(seconds=SMSCorrelator.SESSION_TTL)
+        in_flight = Q(status__in=[Order.Status.PROCESSING, Order.Status.WAITING_3DS], updated_at__gte=in_flight_since)
+        rows = orders.values('selected_card_id').annotate(
+            usage_24h=Count('id', filter=Q(created_at__gte=now - timedelta(hours=24)) & ~Q(status=Order.Status.FAILED)),
+            in_flight=Count('id', filter=in_flight),
+            committed=Sum('amount', filter=in_flight),
+            in_3ds=Count('id', filter=Q(status=Order.Status.WAITING_3DS, updated_at__gte=in_flight_since)),
+            completed_1h=Count('id', filter=Q(status=Order.Status.COMPLETED, updated_at__gte=now - timedelta(hours=1))),
+            completed_24h=Count('id', filter=Q(status=Order.Status.COMPLETED, updated_at__gte=now - timedelta(hours=24))),
+        )
+        for row in rows:
+            row['committed'] = row['committed'] or 0
+            stats[row.pop('selected_card_id')].update(row)
+
+        # A failed pay or 3ds step is a decline of the card the order is on
+        steps = OrderStep.objects.filter(
+            order__selected_card_id__in=card_ids, name__in=['pay', '3ds'],
+            status__in=[OrderStep.Status.OK, OrderStep.Status.FAILED],
+            started_at__gte=now - timedelta(hours=cls.DECLINE_WINDOW_HOURS),
+        ).values('order__selected_card_id').annotate(
+            payments=Count('id', filter=Q(name='pay')),
+            declines=Count('id', filter=Q(status=OrderStep.Status.FAILED)),
+        )
+        for row in steps:
+            stats[row['order__selected_card_id']].update(payments=row['payments'], declines=row['declines'])
+
+        for card_stats in stats.values():
+            payments = card_stats['payments']
+            card_stats['decline_rate'] = min(card_stats['declines'] / payments, 1.0) if payments else 0.0
+        return stats
+
+    @classmethod
+    def _rank(cls, card, stats, amount, default_card):
+        unhealthy = stats['payments'] >= cls.MIN_PAYMENTS and stats['decline_rate'] >= cls.MAX_DECLINE_RATE
+        return (
+            bool(amount) and card.balance - stats['committed'] < amount,
+            stats['usage_24h'] >= cls.DAILY_LIMIT,
+            unhealthy,
+            stats['in_flight'],
+            round(stats['decline_rate'], 1),
+            stats['usage_24h'],
+            not (default_card and card.id == default_card.id),
+            -card.balance,
+        )
+
+    @staticmethod
+    def describe(card, stats) -> str:
+        return (
+            f"{card.alias} (*{card.card_number[-4:]}): balance {card.balance}, 24h {stats['usage_24h']}, "
+            f"in flight {stats['in_flight']} (3DS {stats['in_3ds']}), declines {stats['declines']}/{stats['payments']}"
+        )
+
+    @classmethod
+    def assign(cls, order):
+        """
+        Binds the best card of the pool to the order (selected_card, card_decision,
+        saved with order.amount) and returns it, None if the pool is empty.
+        """
+        from core.models import CreditCard
+
+        amount = order.amount
+        cards, default_card = cls.pool()
+        with transaction.atomic():
+            # Serializes assignments: the next order sees this one in flight on its card
+            candidates = list(CreditCard.objects.select_for_update().filter(id__in=cards.values('id')).order_by('id'))
+            if not candidates:
+                return None
+            stats = cls.card_stats([card.id for card in candidates], exclude_order=order)
+            ranked = sorted(candidates, key=lambda card: cls._rank(card, stats[card.id], amount, default_card))
+            card = ranked[0]
+
+            reasons = []
+            rank = cls._rank(card, stats[card.id], amount, default_card)
+            if rank[0]:
+                reasons.append("no card covers the amount")
+            if rank[1]:
+                reasons.append("every card is over the daily limit")
+            if rank[2]:
+                reasons.append("every card declines often")
+            decision = f"{cls.describe(card, stats[card.id])} - best of {len(candidates)}"
+            if reasons:
+                decision += f" ({', '.join(reasons)})"
+
+            order.selected_card = card
+            order.card_decision = decision[:255]
+            order.save(update_fields=['selected_card', 'card_decision', 'amount', 'updated_at'])
+
+        logger.info(f"Order {order.id}: card {decision}")
+        if len(ranked) > 1:
+            logger.info(f"Order {order.id}: other cards: " + '; '.join(cls.describe(c, stats[c.id]) for c in ranked[1:]))
+        return card
+
+    @classmethod
+    def throughput(cls, user=None) -> list:
+        """
+        The whole pool the scheduler assigns from, with its stats, for the
+        auto-orders view. own is False for the cards of users other than user,
+        whose details the view masks.
+        """
+        cards, default_card = cls.pool()
+        cards = list(cards)
+        stats = cls.card_stats([card.id for card in cards])
+        return [
+            {
+                'card': card,
+                'is_default': bool(default_card and card.id == default_card.id),
+                'own': user is None or card.user_id == user.id,
+                **stats[card.id],
+            }
+            for card in cards
+        ]
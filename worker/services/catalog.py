@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import logging
+from decimal import Decimal
+
+import redis
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# TL amounts are stored in the Package table next to the real packages
+TL_CATEGORY = 'TL Yükle'
+
+
+class PackageCatalogService:
+    """
+    Latest scraped catalog per operator and upload type, shared by all workers.
+
+    The catalog lives in Redis as JSON with a version counter and a TTL, so an
+    interactive session can show the package list before its own scrape has
+    finished and select_package can look up the exact displayed name.
+    The Package table is kept in sync as a diff (bulk insert/update, only
+    stale rows of the same upload type are removed).
+    """
+
+    TTL = int(os.getenv('PACKAGE_CATALOG_TTL', '1800'))
+
+    _client = None
+
+    @classmethod
+    def _redis(cls):
+        if cls._client is None:
+            cls._client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+        return cls._client
+
+    @staticmethod
+    def key(operator_name: str, upload_type: str) -> str:
+        return f"catalog:{operator_name.lower()}:{upload_type}"
+
+    @classmethod
+    def get(cls, operator_name: str, upload_type: str):
+        """
+        Returns {'version', 'scraped_at', 'packages'} or None if there is no
+        cached catalog (never scraped, expired or Redis unavailable).
+        """
+        try:
+            raw = cls._redis().get(cls.key(operator_name, upload_type))
+        except redis.RedisError as e:
+            logger.warning(f"Catalog cache unavailable: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    @classmethod
+    def packages(cls, operator_name: str, upload_type: str) -> list:
+        catalog = cls.get(operator_name, upload_type)
+        return catalog['packages'] if catalog else []
+
+    @classmethod
+    def resolve(cls, operator_name: str, upload_type: str, search_texts, code: str = None, min_score: float = 0.75):
+        """
+        Best cached catalog record for search_texts (score >= min_score) or
+        None. Runs before the browser is launched; the record carries the
+        category (tab) the package was last seen in. Lookups by API kontor
+        code are memoised per catalog version.
+        """
+        from worker.engine.turkcell.matching import index_for_snapshot
+
+        catalog = cls.get(operator_name, upload_type)
+        search_texts = [text for text in search_texts if text]
+        if not catalog or not catalog['packages'] or not search_texts:
+            return None
+
+        records = catalog['packages']
+        index = index_for_snapshot(
+            (cls.key(operator_name, upload_type), catalog['version']),
+            [record['name'] for record in records]
+        )
+        score, idx = index.resolve_code(code, search_texts, min_score=min_score)
+        if idx is None:
+            return None
+        return dict(records[idx], score=score)
+
+    @classmethod
+    def record_tab_prediction(cls, operator_name: str, outcome: str, saved_ms: float = 0.0):
+        """outcome: 'hit', 'miss' or 'unknown' (predicted category has no tab)."""
+        key = f"catalog:{operator_name.lower()}:tab_prediction"
+        try:
+            client = cls._redis()
+            client.hincrby(key, outcome, 1)
+            if saved_ms:
+                client.hincrbyfloat(key, 'saved_ms', saved_ms)
+        except redis.RedisError as e:
+            logger.warning(f"Could not record tab prediction: {e}")
+
+    @classmethod
+    def tab_prediction_stats(cls, operator_name: str) -> dict:
+        key = f"catalog:{operator_name.lower()}:tab_prediction"
+        try:
+            raw = cls._redis().hgetall(key)
+        except redis.RedisError:
+            return {}
+        stats = {k.decode(): float(v) for k, v in raw.items()}
+        predictions = stats.get('hit', 0) + stats.get('miss', 0)
+        stats['hit_rate'] = round(stats.get('hit', 0) / predictions, 3) if predictions else None
+        return stats
+
+    @classmethod
+    def store(cls, operator_name: str, upload_type: str, packages: list):
+        """Caches a fresh scrape and returns its version (None if not stored)."""
+        if not packages:
+            # A failed scrape must not replace a good catalog
+            return None
+        key = cls.key(operator_name, upload_type)
+        try:
+            client = cls._redis()
+            version = client.incr(f"{key}:version")
+            payload = {'version': version, 'scraped_at': time.time(), 'packages': packages}
+            client.set(key, json.dumps(payload), ex=cls.TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Could not cache catalog {key}: {e}")
+            return None
+        logger.info(f"Catalog {key} v{version} cached ({len(packages)} packages, ttl {cls.TTL}s).")
+        return version
+
+    @classmethod
+    def sync_to_db(cls, operator, packages: list, upload_type: str) -> dict:
+        """
+        Writes the scraped packages into the Package table as a diff.
+        Rows are matched by name (as update_or_create did before); unchanged
+        rows are not touched, so fields like the API code survive a refresh.
+        Stale rows are only removed within the scraped upload type, and
+        never when they carry an API code.
+        """
+        from core.models import Package
+
+        result = {'created': 0, 'updated': 0, 'deleted': 0}
+        if not packages:
+            return result
+
+        is_tl = upload_type == "TL"
+        scraped = {}
+        for pkg in packages:
+            # Truncate to avoid DataError (max_length=100)
+            name = pkg['name'][:99]
+            scraped[name] = {
+                'category': pkg['category'][:99],
+                'package_id': pkg['package_id'][:99],
+                'price': Decimal(str(round(float(pkg['price']), 2))),
+            }
+
+        existing_qs = Package.objects.filter(operator=operator)
+        existing_qs = existing_qs.filter(category=TL_CATEGORY) if is_tl else existing_qs.exclude(category=TL_CATEGORY)
+
+        existing = {}
+        duplicates = []
+        for row in existing_qs:
+            if row.name in existing:
+                if not row.code:
+                    duplicates.append(row.id)
+            else:
+                existing[row.name] = row
+
+        to_create, to_update = [], []
+        for name, fields in scraped.items():
+            row = existing.get(name)
+            if row is None:
+                to_create.append(Package(operator=operator, name=name, **fields))
+                continue
+            if any(getattr(row, field) != value for field, value in fields.items()):
+                for field, value in fields.items():
+                    setattr(row, field, value)
+                to_update.append(row)
+
+        # Rows mapped to an API kontor code are managed from the panel, never drop them
+        stale = [row.id for name, row in existing.items() if name not in scraped and not row.code]
+        stale += duplicates
+
+        with transaction.atomic():
+            if to_create:
+                Package.objects.bulk_create(to_create)
+            if to_update:
+                Package.objects.bulk_update(to_update, ['category', 'package_id', 'price'])
+            if stale:
+                Package.objects.filter(id__in=stale).delete()
+
+        result.update(created=len(to_create), updated=len(to_update), deleted=len(stale))
+        logger.info(
+            f"Package table synced for {operator} ({upload_type}): "
+            f"{result['created']} created, {result['updated']} updated, {result['deleted']} removed, "
+            f"{len(scraped) - result['created'] - result['updated']} unchanged."
+        )
+        return result
+
+    @classmethod
+    def refresh_in_background(cls, operator, operator_name: str, upload_type: str, packages: list):
+        """
+        Caches a fresh scrape right away and leaves the Package table diff to
+        the catalog queue, so a browser slot does not wait on the DB.
+        Returns the cached version (None if nothing was stored).
+        """
+        if not packages:
+            return None
+        version = cls.store(operator_name, upload_type, packages)
+        try:
+            from worker.tasks import sync_package_catalog
+            sync_package_catalog.delay(operator.id, upload_type, packages)
+        except Exception as e:
+            logger.warning(f"Could not queue catalog sync, syncing inline: {e}")
+            cls.sync_to_db(operator, packages, upload_type)
+        return version
+
+    @classmethod
+    def refresh(cls, operator, operator_name: str, upload_type: str, packages: list) -> dict:
+        """Store a fresh scrape in the cache and the Package table."""
+        if not packages:
+            return {'version': None, 'created': 0, 'updated': 0, 'deleted': 0}
+        version = cls.store(operator_name, upload_type, packages)
+        result = cls.sync_to_db(operator, packages, upload_type)
+        result['version'] = version
+        return result
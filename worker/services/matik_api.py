@@ -1,9 +1,40 @@
+import os
+import time
+import codecs
+import asyncio
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
 import logging
 
 logger = logging.getLogger(__name__)
 
+TALEP_TAGS = ('talep', 'islem')
+
+
+def _order_from_element(element, keep_raw: bool):
+    data = {}
+    for item in element:
+        data[item.tag] = item.text
+
+    if 'id' not in data or 'numara' not in data:
+        return None
+    # Pack them into the expected dictionary format for the task
+    order = {
+        'ref': data.get('id'),
+        'phone': data.get('numara'),
+        'operator': data.get('operator'),
+        'kontor': data.get('kontor'),
+        'tag': element.tag,
+        'fields': data,
+    }
+    if keep_raw:
+        order['raw'] = ET.tostring(element, encoding='unicode')
+    return order
+
 class MatikAPIService:
     BASE_URL_TALEP = "http://bayi.matiksistem.com/servis/turkcell_talep.php"
     BASE_URL_SONUC = "http://bayi.matiksistem.com/servis/turkcell_sonuc.php"
@@ -12,70 +43,188 @@ class MatikAPIService:
     KOD = "matik"
     SIFRE = "sistem"
 
+    TIMEOUT = 10
+    CHUNK_SIZE = 16 * 1024
+    # Connection errors and 429/5xx are retried with exponential backoff (0.5s, 1s, 2s)
+    RETRIES = int(os.getenv('MATIK_HTTP_RETRIES', '3'))
+    BACKOFF = float(os.getenv('MATIK_HTTP_BACKOFF', '0.5'))
+    CALLBACK_CONCURRENCY = int(os.getenv('MATIK_CALLBACK_CONCURRENCY', '8'))
+
+    # Whether the last fetch_pending_orders failed (an empty list alone does not tell)
+    last_fetch_failed = False
+
+    _session = None
+    _session_lock = threading.Lock()
+    _executor = None
+    _stats_lock = threading.Lock()
+    _callback_stats = {'sent': 0, 'failed': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+    _callback_ms_by_ref = {}
+    _last_error_by_ref = {}
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        """One keep-alive session per worker process for all Matik endpoints."""
+        with cls._session_lock:
+            if cls._session is None:
+                retry = Retry(
+                    total=cls.RETRIES,
+                    backoff_factor=cls.BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(['GET']),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=cls.CALLBACK_CONCURRENCY, max_retries=retry)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._session = session
+            return cls._session
+
     @classmethod
-    def fetch_pending_orders(cls):
+    def fetch_pending_orders(cls, keep_raw: bool = False):
         """
         Fetches pending orders from the API.
         Returns a list of dictionaries: [{'phone': '...', 'ref': '...', 'package': '...'}]
         """
+        return list(cls.iter_pending_orders(keep_raw=keep_raw))
+
+    @classmethod
+    def iter_pending_orders(cls, keep_raw: bool = False):
+        """
+        Streams pending orders from the API: each order is yielded as soon as
+        its <talep> has been downloaded and parsed, the body is never held in
+        memory as a whole. On an error the orders parsed so far have been
+        yielded and last_fetch_failed is set.
+        """
         params = {
             'kod': cls.KOD,
             'sifre': cls.SIFRE
         }
         
+        cls.last_fetch_failed = True
+        response = None
+        count = 0
         try:
-            response = requests.get(cls.BASE_URL_TALEP, params=params, timeout=10)
+            response = cls.session().get(cls.BASE_URL_TALEP, params=params, timeout=cls.TIMEOUT, stream=True)
             response.raise_for_status()
-            
-            content_str = response.content.decode('iso-8859-9', errors='ignore').strip()
-            
-            if not content_str:
-                print("Empty response from API")
-                return []
-                
-            # Safely wrap the content in a dummy root tag in case API returns multiple <talep> elements without a root
-            import re
-            content_str = re.sub(r'<\?xml.*?\?>', '', content_str).strip()
-            xml_string = f"<dummy_root>{content_str}</dummy_root>"
-            
-            root = ET.fromstring(xml_string)
-            
-            orders = []
-                
-            # Loop through ALL elements deeply in case they are nested or sibling root nodes
-            for child in root.iter():
-                if child.tag in ['talep', 'islem']:
-                    data = {}
-                    for item in child:
-                        data[item.tag] = item.text
-                    
-                    if 'id' in data and 'numara' in data:
-                        # Extract basic fields
-                        ref = data.get('id')
-                        phone = data.get('numara')
-                        operator_tag = data.get('operator')
-                        kontor = data.get('kontor')
-                        
-                        # Pack them into the expected dictionary format for the task
-                        orders.append({
-                            'ref': ref,
-                            'phone': phone,
-                            'operator': operator_tag,
-                            'kontor': kontor,
-                            'raw': ET.tostring(child, encoding='unicode')
-                        })
-            
-            return orders
+
+            for order in cls.parse_orders(response.iter_content(chunk_size=cls.CHUNK_SIZE), keep_raw=keep_raw):
+                count += 1
+                yield order
+
+            cls.last_fetch_failed = False
+            if not count:
+                logger.info("Matik API returned no pending orders.")
             
         except ET.ParseError as e:
-            logger.error(f"XML Parse Error: {e}. Content: {response.text[:100]}...")
-            return []
+            logger.error(f"XML Parse Error after {count} orders: {e}")
         except requests.RequestException as e:
             logger.error(f"API Request Error: {e}")
-            return []
         except Exception as e:
             logger.error(f"Unexpected Error in fetch_pending_orders: {e}")
-            return []
+        finally:
+            if response is not None:
+                response.close()
+
+    @staticmethod
+    def parse_orders(chunks, keep_raw: bool = False):
+        """
+        Incremental parser for the talep XML: chunks are raw (iso-8859-9) byte
+        strings as they arrive. Yields an order dict when each <talep>/<islem>
+        closes and drops the element right after, so memory stays flat however
+        many orders the response has. The raw fragment is only serialized with
+        keep_raw (talep_xml rebuilds it from 'fields' for the few that need it).
+        """
+        decoder = codecs.getincrementaldecoder('iso-8859-9')(errors='ignore')
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        # Safely wrap the content in a dummy root tag in case API returns multiple <talep> elements without a root
+        parser.feed('<dummy_root>')
+        head, started = '', False
+        stack, inside = [], 0
+
+        def read():
+            nonlocal inside
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    stack.append(elem)
+                    if elem.tag in TALEP_TAGS:
+                        inside += 1
+                    continue
+                stack.pop()
+                if elem.tag in TALEP_TAGS:
+                    inside -= 1
+                    order = _order_from_element(elem, keep_raw)
+                    if order:
+                        yield order
+                # Loop through ALL elements deeply, but only keep what an open <talep> still needs
+                if stack and (elem.tag in TALEP_TAGS or not inside):
+                    stack[-1].remove(elem)
+
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if not started:
+                # The XML declaration cannot follow <dummy_root>; drop it once it is complete
+                head += text
+                stripped = head.lstrip()
+                if stripped.startswith('<?xml'):
+                    end = stripped.find('?>')
+                    if end == -1:
+                        continue
+                    stripped = stripped[end + 2:]
+                elif len(stripped) < 5 and '<?xml'.startswith(stripped):
+                    continue
+                text, started = stripped, True
+            parser.feed(text)
+            yield from read()
+
+        parser.feed(head if not started else '')
+        parser.feed(decoder.decode(b'', final=True) + '</dummy_root>')
+        yield from read()
+        parser.close()
+
+    @staticmethod
+    def talep_xml(order: dict) -> str:
+        """The order's <talep>/<islem> fragment: the raw one if it was kept, else rebuilt from its fields."""
+        if order.get('raw'):
+            return order['raw']
+        element = ET.Element(order.get('tag', 'talep'))
+        for tag, text in (order.get('fields') or {}).items():
+            ET.SubElement(element, tag).text = text
+        return ET.tostring(element, encoding='unicode')
+
+    @classmethod
+    def _record_callback(cls, ref, elapsed_ms: float, ok: bool):
+        with cls._stats_lock:
+            stats = cls._callback_stats
+            stats['sent' if ok else 'failed'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            cls._callback_ms_by_ref[ref] = cls._callback_ms_by_ref.get(ref, 0.0) + elapsed_ms
+            # Refs nobody asked about (early exits) must not pile up
+            while len(cls._callback_ms_by_ref) > 1024:
+                cls._callback_ms_by_ref.pop(next(iter(cls._callback_ms_by_ref)))
+
+    @classmethod
+    def callback_time(cls, ref) -> float:
+        """Milliseconds spent sending callbacks for ref (since the last call), kept apart from order processing time."""
+        with cls._stats_lock:
+            return cls._callback_ms_by_ref.pop(ref, 0.0)
+
+    @classmethod
+    def last_error(cls, ref) -> str:
+        """Why the last callback for ref failed ('' if it did not)."""
+        with cls._stats_lock:
+            return cls._last_error_by_ref.pop(ref, '')
+
+    @classmethod
+    def callback_stats(cls) -> dict:
+        with cls._stats_lock:
+            stats = dict(cls._callback_stats)
+        calls = stats['sent'] + stats['failed']
+        stats['avg_ms'] = round(stats['total_ms'] / calls, 1) if calls else None
+        stats['total_ms'] = round(stats['total_ms'], 1)
+        stats['max_ms'] = round(stats['max_ms'], 1)
+        return stats
 
     @classmethod
     def send_callback(cls, ref, status):
@@ -90,11 +239,52 @@ class MatikAPIService:
             'durum': status
         }
         
+        started = time.perf_counter()
         try:
-            response = requests.get(cls.BASE_URL_SONUC, params=params, timeout=10)
+            response = cls.session().get(cls.BASE_URL_SONUC, params=params, timeout=cls.TIMEOUT)
             response.raise_for_status()
-            logger.info(f"Callback sent for ref {ref} with status {status}. Response: {response.text}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            cls._record_callback(ref, elapsed_ms, True)
+            logger.info(f"Callback sent for ref {ref} with status {status} in {elapsed_ms:.0f} ms. Response: {response.text}")
             return True
         except requests.RequestException as e:
-            logger.error(f"Failed to send callback for ref {ref}: {e}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            cls._record_callback(ref, elapsed_ms, False)
+            with cls._stats_lock:
+                cls._last_error_by_ref[ref] = str(e)[:255]
+                while len(cls._last_error_by_ref) > 1024:
+                    cls._last_error_by_ref.pop(next(iter(cls._last_error_by_ref)))
+            logger.error(f"Failed to send callback for ref {ref} after {elapsed_ms:.0f} ms: {e}")
             return False
+
+    @classmethod
+    async def send_callbacks_async(cls, callbacks, concurrency: int = None) -> list:
+        """
+        Sends many (ref, status) callbacks concurrently over the pooled
+        session; at most `concurrency` are in flight. Returns the results
+        (True/False) in order.
+        """
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=cls.CALLBACK_CONCURRENCY, thread_name_prefix='matik')
+        semaphore = asyncio.Semaphore(concurrency or cls.CALLBACK_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+
+        async def send(ref, status):
+            async with semaphore:
+                return await loop.run_in_executor(cls._executor, cls.send_callback, ref, status)
+
+        return await asyncio.gather(*(send(ref, status) for ref, status in callbacks))
+
+    @classmethod
+    def send_callbacks(cls, callbacks, concurrency: int = None) -> list:
+        """Blocking wrapper around send_callbacks_async for sync callers (Celery tasks)."""
+        callbacks = list(callbacks)
+        if not callbacks:
+            return []
+        started = time.perf_counter()
+        results = asyncio.run(cls.send_callbacks_async(callbacks, concurrency))
+        logger.info(
+            f"Sent {sum(results)}/{len(results)} callbacks concurrently in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms."
+        )
+        return results
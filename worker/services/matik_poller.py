@@ -0,0 +1,140 @@
+import os
+import time
+import uuid
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if it is still ours (it may have expired and been taken by another poller)
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class MatikPollScheduler:
+    """
+    Decides when poll_matik_api really talks to Matik.
+
+    Beat only ticks (every MATIK_POLL_TICK seconds); a tick polls when the
+    adaptive interval has passed and nobody else is polling (Redis lock, so a
+    slow Matik response or a big batch never overlaps the next tick). The
+    interval drops to MIN_INTERVAL while orders are flowing, doubles up to
+    MAX_INTERVAL while the queue is empty and up to ERROR_MAX_INTERVAL while
+    Matik errors. With LOOP_SECONDS > 0 the lock holder keeps polling in a
+    loop (long-poll) instead of returning after one poll.
+
+    Without Redis every tick polls, as the fixed 30s schedule used to.
+    """
+
+    LOCK_KEY = 'matik:poll:lock'
+    STATE_KEY = 'matik:poll:state'
+
+    MIN_INTERVAL = float(os.getenv('MATIK_POLL_MIN_INTERVAL', '2'))
+    MAX_INTERVAL = float(os.getenv('MATIK_POLL_MAX_INTERVAL', '30'))
+    ERROR_MAX_INTERVAL = float(os.getenv('MATIK_POLL_ERROR_MAX_INTERVAL', '120'))
+    LOOP_SECONDS = float(os.getenv('MATIK_POLL_LOOP_SECONDS', '0'))
+    # Longest a single poll (fetch + insert + dispatch) may hold the lock
+    LOCK_TTL = 120
+
+    _client = None
+
+    @classmethod
+    def _redis(cls):
+        if cls._client is None:
+            cls._client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+        return cls._client
+
+    @classmethod
+    def acquire(cls):
+        """Lock token, None if another poll holds the lock, '' when Redis is unavailable."""
+        token = uuid.uuid4().hex
+        ttl = int(cls.LOCK_TTL + cls.LOOP_SECONDS)
+        try:
+            return token if cls._redis().set(cls.LOCK_KEY, token, nx=True, ex=ttl) else None
+        except redis.RedisError as e:
+            logger.warning(f"Matik poll lock unavailable, polling without it: {e}")
+            return ''
+
+    @classmethod
+    def release(cls, token):
+        if not token:
+            return
+        try:
+            cls._redis().eval(RELEASE_LOCK, 1, cls.LOCK_KEY, token)
+        except redis.RedisError:
+            pass
+
+    @classmethod
+    def state(cls) -> dict:
+        try:
+            raw = cls._redis().hgetall(cls.STATE_KEY)
+        except redis.RedisError:
+            return {}
+        return {key.decode(): float(value) for key, value in raw.items()}
+
+    @classmethod
+    def next_interval(cls, interval: float, new_orders: int, failed: bool) -> float:
+        if failed:
+            return min(max(interval, cls.MIN_INTERVAL) * 2, cls.ERROR_MAX_INTERVAL)
+        if new_orders:
+            return cls.MIN_INTERVAL
+        return min(max(interval, cls.MIN_INTERVAL) * 2, cls.MAX_INTERVAL)
+
+    @classmethod
+    def _record(cls, state: dict, started: float, new_orders: int, failed: bool) -> dict:
+        interval = cls.next_interval(state.get('interval', cls.MIN_INTERVAL), new_orders, failed)
+        state = dict(state, interval=interval, last_poll_at=started, next_poll_at=started + interval)
+        try:
+            cls._redis().hset(cls.STATE_KEY, mapping=state)
+        except redis.RedisError:
+            pass
+        return state
+
+    @classmethod
+    def run(cls, poll_once) -> int:
+        """
+        Polls if due and unlocked. poll_once(since_last_poll) does one poll and
+        returns (new_orders, failed). Returns how many polls ran.
+        """
+        state = cls.state()
+        if time.time() < state.get('next_poll_at', 0):
+            return 0
+
+        token = cls.acquire()
+        if token is None:
+            logger.debug("Matik poll already running, tick skipped.")
+            return 0
+
+        polls = 0
+        try:
+            loop_until = time.time() + cls.LOOP_SECONDS
+            while True:
+                started = time.time()
+                since_last = started - state['last_poll_at'] if 'last_poll_at' in state else None
+                new_orders, failed = poll_once(since_last)
+                polls += 1
+                state = cls._record(state, started, new_orders, failed)
+                logger.info(
+                    f"Matik poll: {new_orders} new orders{' (failed)' if failed else ''} in "
+                    f"{(time.time() - started) * 1000:.0f} ms, next poll in {state['interval']:.0f}s"
+                )
+                if not token or time.time() + state['interval'] >= loop_until:
+                    break
+                time.sleep(state['interval'])
+                if not cls._still_holding(token):
+                    break
+        finally:
+            cls.release(token)
+        return polls
+
+    @classmethod
+    def _still_holding(cls, token) -> bool:
+        try:
+            return cls._redis().get(cls.LOCK_KEY) == token.encode()
+        except redis.RedisError:
+            return False
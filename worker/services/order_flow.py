@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import logging
+
+from .callback_outbox import CallbackOutboxService
+from .card_scheduler import CardScheduler
+from .catalog import PackageCatalogService
+
+logger = logging.getLogger(__name__)
+
+
+class AutonomousOrderService:
+    """
+    The parts of the autonomous (Matik) order flow that do not touch the
+    browser: picking up the order, working out what to select, picking the
+    card, booking the selection and settling the result (status, Matik callback, card balance).
+
+    Shared by process_autonomous_order and the async worker, so both engines
+    settle orders the same way. Every method is synchronous (ORM); the async
+    worker runs them through sync_to_async.
+    """
+
+    @classmethod
+    def fail(cls, order, message: str = None):
+        order.status = order.Status.FAILED
+        if message is not None:
+            order.log_message = message
+        order.save()
+        CallbackOutboxService.enqueue(order.external_ref, 2, order.id)
+
+    @classmethod
+    def log_pickup_latency(cls, order):
+        """Queue-to-pickup latency: poll -> worker start, plus how long it can have waited at Matik before the poll."""
+        try:
+            raw = json.loads(order.raw_api_data or '{}')
+        except ValueError:
+            return
+        if not raw.get('polled_at'):
+            return
+        waited = f", up to {raw['max_wait_at_matik']:.1f}s at Matik before that" if raw.get('max_wait_at_matik') else ''
+        logger.info(f"Order {order.id}: picked up {time.time() - raw['polled_at']:.1f}s after it was polled{waited}")
+
+    @classmethod
+    def start(cls, order_id):
+        """Marks the order PROCESSING and returns it."""
+        from core.models import Order
+
+        order = Order.objects.get(id=order_id)
+        order.status = Order.Status.PROCESSING
+        order.save()
+        cls.log_pickup_latency(order)
+        return order
+
+    @classmethod
+    def assign_card(cls, order, plan: dict):
+        """
+        Binds a card of the pool to the order (CardScheduler), for usage statistics
+        ("Günlük Kullanım") and the payment. None if the order was failed for lack of one.
+        """
+        if plan['is_tl']:
+            # Known now, the scheduler weighs it against the cards' balances
+            order.amount = plan['amount']
+        card = CardScheduler.assign(order)
+        if not card:
+            logger.error(f"No credit card available for order {order.id}")
+            cls.fail(order, "No credit card available.")
+        return card
+
+    @classmethod
+    def plan(cls, order):
+        """
+        What the browser has to select for the order, worked out before launch:
+        {'upload_type', 'is_tl', 'kontor', 'amount', 'package_id', 'fallback_name',
+        'preferred_category'}. None if the order was failed (invalid TL amount).
+        """
+        from core.models import Operator, Package
+
+        try:
+            raw_data = json.loads(order.raw_api_data)
+            api_operator = raw_data.get('api_operator', '')
+            api_kontor = raw_data.get('api_kontor', '')
+            api_paketadi = raw_data.get('api_paketadi', api_kontor) # Fallback to kontor if paketadi empty
+        except:
+            api_operator = ''
+            api_kontor = ''
+            api_paketadi = ''
+
+        is_tl_load = api_operator.lower() == 'turkcelltam'
+        plan = {
+            'upload_type': "TL" if is_tl_load else "Package",
+            'is_tl': is_tl_load,
+            'kontor': api_kontor,
+            'amount': None,
+            'package_id': None,
+            'fallback_name': None,
+            'preferred_category': None,
+        }
+
+        if is_tl_load:
+            try:
+                plan['amount'] = float(api_kontor)
+            except ValueError:
+                logger.error(f"Invalid TL amount from API: {api_kontor}")
+                cls.fail(order, f"Invalid TL amount: {api_kontor}")
+                return None
+            return plan
+
+        # Package Loading - Check if code exists
+        turkcell = Operator.objects.first()
+        package_obj = Package.objects.filter(operator=turkcell, code=api_kontor).first()
+
+        if package_obj:
+            if package_obj.package_id != 'UNDEFINED':
+                # Exact ID match available
+                plan['package_id'] = package_obj.package_id
+                # User might have populated package_id with the API kontor code incorrectly.
+                # Send the readable name as fallback_name just in case!
+                plan['fallback_name'] = package_obj.name
+            else:
+                # User manually defined it in the panel but didn't know the exact internal website ID.
+                # Use their defined "name" (e.g. "Fırsat 1GB") as the fuzzy match fallback!
+                logger.info(f"Package {api_kontor} has no internal package_id, but user defined name '{package_obj.name}'. Using it for fuzzy match.")
+                plan['fallback_name'] = package_obj.name
+            order.amount = package_obj.price
+        else:
+            logger.warning(f"Unknown or undefined package code: {api_kontor}. Will attempt fuzzy match in browser using: {api_paketadi}")
+            plan['fallback_name'] = api_paketadi
+            # Do NOT return, we will proceed to launch the browser to find and fuzzy match the package
+
+        # Resolve against the cached catalog too: it knows the tab the package was last seen in
+        if package_obj and package_obj.category and package_obj.category != 'General':
+            plan['preferred_category'] = package_obj.category
+        catalog_hit = PackageCatalogService.resolve(
+            'turkcell', plan['upload_type'], [plan['package_id'], plan['fallback_name']], code=api_kontor
+        )
+        if catalog_hit:
+            plan['preferred_category'] = catalog_hit['category']
+            logger.info(
+                f"Order {order.id}: '{api_kontor}' resolved before launch to '{catalog_hit['name']}' "
+                f"in tab '{plan['preferred_category']}' (Score: {catalog_hit['score']:.2f})"
+            )
+        return plan
+
+    @classmethod
+    def selected(cls, order, plan: dict, name: str, price: float):
+        """Books the package/amount the browser selected; auto-maps fuzzy matched unknown codes."""
+        from core.models import Operator, Package
+
+        if plan['is_tl']:
+            order.amount = plan['amount']
+            order.resolved_package_name = name or f"{plan['amount']} TL"
+            order.save()
+            return
+
+        order.resolved_package_name = name or plan['fallback_name'] or plan['package_id']
+        order.save()
+
+        if plan['fallback_name'] and not plan['package_id']:
+            # We successfully fuzzy matched an unknown package! Auto-map it.
+            matched_id = name or plan['fallback_name']
+            logger.info(f"Auto-mapping API code '{plan['kontor']}' to package '{matched_id}' with price {price}")
+            Package.objects.update_or_create(
+                operator=Operator.objects.first(),
+                code=plan['kontor'],
+                defaults={'name': matched_id, 'package_id': matched_id, 'price': price}
+            )
+            order.amount = price
+
+    @classmethod
+    def selection_failed(cls, order, plan: dict):
+        from core.models import Operator, Package
+
+        logger.error(f"Package selection failed for code {plan['kontor']}")
+        if plan['is_tl']:
+            # TL loads fail outright because they don't have predefined buttons/names to map
+            cls.fail(order, f"Could not match/select TL amount: {plan['kontor']}")
+            return
+
+        # Any package failure should wait for manual action (either unknown code or couldn't click)
+        order.status = order.Status.WAITING_MANUAL_ACTION
+        order.log_message = f"Küpür bulunamadı veya eşleşmedi: {plan['kontor']}"
+        order.save()
+        Package.objects.get_or_create(
+            operator=Operator.objects.first(),
+            code=plan['kontor'],
+            defaults={'name': f"Eşleşmeyen/Bilinmeyen Paket ({plan['kontor']})", 'package_id': 'UNDEFINED'}
+        )
+
+    @classmethod
+    def waiting_3ds(cls, order):
+        order.status = order.Status.WAITING_3DS
+        order.save()
+
+    @classmethod
+    def finish(cls, order, card, success: bool, message: str):
+        """Settles the 3DS result: status, Matik callback and the card balance."""
+        if not success:
+            cls.fail(order, f"3DS Failed: {message}")
+            return
+
+        order.status = order.Status.COMPLETED
+        order.save()
+        CallbackOutboxService.enqueue(order.external_ref, 1, order.id)
+
+        # Deduct balance from card
+        try:
+            if card and order.amount:
+                card.balance -= order.amount
+                card.save()
+                logger.info(f"Deducted {order.amount} from card {card.alias} for autonomous order {order.id}. New balance: {card.balance}")
+                if card.balance < 0:
+                    order.balance_went_negative = True
+                    order.save()
+                    logger.warning(f"Card {card.alias} balance went negative: {card.balance}")
+        except Exception as balance_err:
+            logger.error(f"Balance deduction error in autonomous order: {balance_err}")
+
+    @classmethod
+    def attach_screenshot(cls, order, path: str):
+        """Moves the final screenshot at path into the order's media storage."""
+        from django.core.files import File
+
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            order.final_screenshot.save(f"{order.id}_final.png", File(f), save=True)
+        # Clean up the local file after saving to Django's media storage
+        os.remove(path)
+
+    @classmethod
+    def fail_by_id(cls, order_id, message: str):
+        """Fails the order after an unexpected error, whatever state it was left in."""
+        from core.models import Order
+
+        try:
+            cls.fail(Order.objects.get(id=order_id), message)
+        except Exception:
+            pass
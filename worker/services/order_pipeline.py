@@ -0,0 +1,131 @@
+import time
+import logging
+from contextlib import contextmanager, asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class StepOutcome:
+    """Handed to the body of a step; fail() records a handled failure."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failed = False
+        self.detail = ''
+
+    def fail(self, detail: str = ''):
+        self.failed = True
+        self.detail = detail
+
+
+class OrderPipeline:
+    """
+    Checkpoints of one autonomous order run. Every step (navigate, phone,
+    captcha, catalog, select, pay, 3ds, finalize) is timed and stored as an
+    OrderStep row of the run.
+
+    A run that fails at select or pay leaves its page on a safe checkpoint:
+    the package list after captcha, or the card form before 3DS. The caller
+    parks the browser context under session_key, and the retry of the order
+    (poll_matik_api resending it, define_package) resumes at that step when
+    it gets the parked page back and the page is still there, instead of
+    paying for navigation and captcha again. Nothing is resumed once 3DS
+    has started.
+    """
+
+    STEPS = ('navigate', 'phone', 'captcha', 'catalog', 'select', 'pay', '3ds', 'finalize')
+    # Failed step -> step a parked session resumes at
+    RESUME_AT = {'select': 'select', 'pay': 'pay'}
+
+    def __init__(self, order, upload_type: str):
+        from core.models import OrderStep
+
+        self.order = order
+        # Phone and upload type are part of the key: a resent order may have them corrected
+        self.session_key = ('order', order.id, order.phone_number, upload_type)
+        self.timings = []
+        self.failed_step = None
+        self.resume_at = None
+
+        previous = OrderStep.objects.filter(order=order).order_by('-id').first()
+        self.run = previous.run + 1 if previous else 1
+        self.checkpoint = None
+        if previous:
+            failed = OrderStep.objects.filter(
+                order=order, run=previous.run, status=OrderStep.Status.FAILED
+            ).order_by('-id').first()
+            if failed:
+                self.checkpoint = self.RESUME_AT.get(failed.name)
+
+    @property
+    def park_at(self):
+        """Checkpoint this run's session can be parked at, None if it cannot be reused."""
+        return self.RESUME_AT.get(self.failed_step)
+
+    def resume(self):
+        """The leased page is this order's parked session, still at the checkpoint."""
+        self.resume_at = self.checkpoint
+        logger.info(f"Order {self.order.id}: run {self.run} resumes at '{self.resume_at}' on the parked session.")
+
+    def pending(self, name: str) -> bool:
+        """False (and recorded as skipped) for the steps before the checkpoint being resumed at."""
+        if self.resume_at and self.STEPS.index(name) < self.STEPS.index(self.resume_at):
+            self.skip(name, f"session reused from run {self.run - 1}")
+            return False
+        return True
+
+    def skip(self, name: str, detail: str = ''):
+        self._record(name, 'SKIPPED', timezone.now(), 0, detail)
+
+    def _finish(self, outcome: StepOutcome, started_at, started):
+        duration_ms = (time.perf_counter() - started) * 1000
+        if outcome.failed:
+            self.failed_step = outcome.name
+        self.timings.append((outcome.name, duration_ms, outcome.failed))
+        return outcome.name, 'FAILED' if outcome.failed else 'OK', started_at, duration_ms, outcome.detail
+
+    @contextmanager
+    def step(self, name: str):
+        outcome = StepOutcome(name)
+        started_at, started = timezone.now(), time.perf_counter()
+        try:
+            yield outcome
+        except Exception as e:
+            outcome.fail(str(e))
+            raise
+        finally:
+            self._record(*self._finish(outcome, started_at, started))
+
+    @asynccontextmanager
+    async def astep(self, name: str):
+        """step() for the async worker."""
+        outcome = StepOutcome(name)
+        started_at, started = timezone.now(), time.perf_counter()
+        try:
+            yield outcome
+        except Exception as e:
+            outcome.fail(str(e))
+            raise
+        finally:
+            await sync_to_async(self._record)(*self._finish(outcome, started_at, started))
+
+    def _record(self, name, status, started_at, duration_ms, detail):
+        from core.models import OrderStep
+
+        try:
+            OrderStep.objects.create(
+                order=self.order, run=self.run, name=name, status=status,
+                started_at=started_at, duration_ms=int(duration_ms), detail=(detail or '')[:255]
+            )
+        except Exception as e:
+            # Bookkeeping only, never fails the order
+            logger.warning(f"Order {self.order.id}: could not record step {name}: {e}")
+
+    def summary(self) -> str:
+        steps = ', '.join(
+            f"{name} {ms:.0f} ms{' (failed)' if failed else ''}" for name, ms, failed in self.timings
+        )
+        return f"Steps of run {self.run}: {steps or 'none'}"
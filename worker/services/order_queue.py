@@ -0,0 +1,57 @@
+import os
+import logging
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOrderQueue:
+    """
+    Hands autonomous orders to the async worker (ORDER_ENGINE=async).
+
+    A Redis list: dispatchers LPUSH order ids, async workers BRPOP them. As on
+    the Celery browser queue (not acks_late), an order is taken at most once;
+    one lost with a crashed worker stays PROCESSING instead of being paid twice.
+    """
+
+    KEY = 'orders:async'
+    ENABLED = os.getenv('ORDER_ENGINE', 'celery') == 'async'
+
+    _client = None
+
+    @classmethod
+    def _redis(cls):
+        if cls._client is None:
+            cls._client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+        return cls._client
+
+    @classmethod
+    def async_client(cls):
+        """Client for the worker's event loop."""
+        return aioredis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+
+    @classmethod
+    def push(cls, order_ids) -> bool:
+        """False if Redis is unavailable (the caller falls back to Celery)."""
+        try:
+            cls._redis().lpush(cls.KEY, *order_ids)
+        except redis.RedisError as e:
+            logger.warning(f"Could not hand {len(order_ids)} orders to the async worker: {e}")
+            return False
+        logger.info(f"Handed {len(order_ids)} orders to the async worker.")
+        return True
+
+    @classmethod
+    async def pop(cls, client, timeout: int = 5):
+        """Next order id, None after timeout seconds without one."""
+        item = await client.brpop(cls.KEY, timeout=timeout)
+        return int(item[1]) if item else None
+
+    @classmethod
+    def backlog(cls) -> int:
+        try:
+            return cls._redis().llen(cls.KEY)
+        except redis.RedisError:
+            return 0
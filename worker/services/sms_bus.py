@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class SMSSubscription:
+    """A waiting 3DS session's subscription; wait() blocks until an OTP is pushed."""
+
+    def __init__(self, pubsub, channels):
+        self.pubsub = pubsub
+        self.channels = channels
+
+    def wait(self, timeout: float):
+        """Next pushed OTP message (dict with 'code', 'sender', 'body', ...) or None after timeout."""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            except redis.RedisError as e:
+                logger.warning(f"SMS subscription lost: {e}")
+                return None
+            if not message or message.get('type') != 'message':
+                continue
+            try:
+                payload = json.loads(message['data'])
+            except ValueError:
+                continue
+            if payload.get('code'):
+                return payload
+
+    def close(self):
+        try:
+            self.pubsub.close()
+        except Exception:
+            pass
+
+
+class SMSBus:
+    """
+    Pushes OTPs from the SMS webhook to the sessions waiting in 3DS.
+
+    An OTP the webhook matched to a session (see SMSCorrelator) goes to that
+    session's channel and its order's channel; an unmatched one goes to the
+    shared channel, where waiting sessions may claim it. Publishing is best
+    effort: the SMSLog row is always written first, so sessions that miss a
+    push still find the code with their (now infrequent) DB fallback check.
+    """
+
+    CHANNEL = 'sms:otp'
+
+    # Seconds between DB checks while subscribed (push is the primary path)
+    DB_FALLBACK_INTERVAL = int(os.getenv('SMS_DB_FALLBACK_INTERVAL', '10'))
+
+    _client = None
+
+    @classmethod
+    def _redis(cls):
+        if cls._client is None:
+            cls._client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+        return cls._client
+
+    @staticmethod
+    def order_channel(order_id) -> str:
+        return f"sms:order:{order_id}"
+
+    @staticmethod
+    def session_channel(session_key: str) -> str:
+        return f"sms:session:{session_key}"
+
+    @classmethod
+    def publish(cls, code: str, sender: str, body: str, order_id=None, sms_id=None, session_key=None) -> int:
+        """Returns how many waiting sessions received it (0 if Redis is unavailable)."""
+        payload = json.dumps({
+            'code': code,
+            'sender': sender,
+            'body': body,
+            'order_id': order_id,
+            'sms_id': sms_id,
+            'session_key': session_key,
+            'published_at': time.time(),
+        })
+        try:
+            client = cls._redis()
+            if session_key:
+                receivers = client.publish(cls.session_channel(session_key), payload)
+            else:
+                receivers = client.publish(cls.CHANNEL, payload)
+            if order_id:
+                receivers += client.publish(cls.order_channel(order_id), payload)
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish SMS code: {e}")
+            return 0
+        return receivers
+
+    @classmethod
+    def subscribe(cls, order_id=None, shared: bool = True, session_key=None):
+        """
+        Subscribes to the shared channel and/or the order's / session's
+        channel or returns None if Redis is unavailable, in which case
+        callers poll the DB.
+        Subscribe before looking at the DB so no SMS falls in between.
+        """
+        channels = [cls.CHANNEL] if shared or not (order_id or session_key) else []
+        if order_id:
+            channels.append(cls.order_channel(order_id))
+        if session_key:
+            channels.append(cls.session_channel(session_key))
+        try:
+            pubsub = cls._redis().pubsub()
+            pubsub.subscribe(*channels)
+        except redis.RedisError as e:
+            logger.warning(f"SMS push unavailable, falling back to DB polling: {e}")
+            return None
+        return SMSSubscription(pubsub, channels)
@@ -0,0 +1,284 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Masked card numbers in bank SMS: "****1234", "1234 ile biten", "sonu 1234"
+LAST4_PATTERNS = (
+    re.compile(r'\*{2,}\s?(\d{4})\b'),
+    re.compile(r'\b(\d{4})\s+ile\s+biten', re.IGNORECASE),
+    re.compile(r'\bsonu\s+(\d{4})\b', re.IGNORECASE),
+)
+AMOUNT_RE = re.compile(
+    r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)\s*(?:TL|TRY|₺)'
+    r'|(?:TL|TRY|₺)\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)',
+    re.IGNORECASE
+)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^0-9a-z]', '', (text or '').lower())
+
+
+def _to_amount(text: str):
+    """'1.234,56' / '1,234.56' / '149,90' / '149.90' / '150' -> float."""
+    if ',' in text and '.' in text:
+        decimal = ',' if text.rfind(',') > text.rfind('.') else '.'
+    elif ',' in text or '.' in text:
+        sep = ',' if ',' in text else '.'
+        decimal = sep if len(text) - text.rfind(sep) - 1 in (1, 2) else None
+    else:
+        decimal = None
+    thousands = {',', '.'} - {decimal}
+    cleaned = ''.join(ch for ch in text if ch not in thousands)
+    if decimal:
+        cleaned = cleaned.replace(decimal, '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def sms_amounts(body: str) -> list:
+    amounts = []
+    for match in AMOUNT_RE.finditer(body or ''):
+        value = _to_amount(match.group(1) or match.group(2))
+        if value:
+            amounts.append(value)
+    return amounts
+
+
+def sms_last4s(body: str) -> set:
+    found = set()
+    for pattern in LAST4_PATTERNS:
+        found.update(pattern.findall(body or ''))
+    return found
+
+
+class ThreeDSSession:
+    """
+    One payment waiting for its 3DS SMS: who can send it (the card's bank),
+    what it should mention (card last 4 digits, amount, merchant) and since when.
+    """
+
+    MERCHANT = 'turkcell'
+
+    def __init__(self, key, started_at: float, order_id=None, sender='', last4='', amount=None):
+        self.key = key
+        self.started_at = started_at
+        self.order_id = order_id
+        self.sender = sender or ''
+        self.last4 = last4 or ''
+        self.amount = float(amount) if amount else None
+
+    def to_dict(self) -> dict:
+        return {
+            'key': self.key, 'started_at': self.started_at, 'order_id': self.order_id,
+            'sender': self.sender, 'last4': self.last4, 'amount': self.amount,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def score(self, sender: str, body: str, received_at: float):
+        """
+        How well an SMS fits this session, None if it cannot be this
+        session's SMS (older than the session, another bank, another card or
+        another amount). Signals the SMS does not carry are neutral.
+        """
+        if received_at < self.started_at - SMSCorrelator.CLOCK_SKEW:
+            return None
+
+        score = 0.0
+        if self.sender:
+            expected, got = _normalize(self.sender), _normalize(sender)
+            if not got or (expected not in got and got not in expected):
+                return None
+            score += 4
+
+        last4s = sms_last4s(body)
+        if last4s and self.last4:
+            if self.last4 not in last4s:
+                return None
+            score += 4
+
+        amounts = sms_amounts(body)
+        if amounts and self.amount:
+            if not any(abs(amount - self.amount) <= 0.01 for amount in amounts):
+                return None
+            score += 3
+
+        if self.MERCHANT in (body or '').lower():
+            score += 1
+        return score
+
+
+class SMSCorrelator:
+    """
+    Matches incoming 3DS SMS to the sessions waiting for them, so several
+    payments can wait for codes at the same time.
+
+    Waiting sessions are registered in Redis (Order.three_ds_started_at
+    doubles as the registry when Redis is down). The webhook scores every
+    SMS against the open sessions and gives it to the best one; ties go to
+    the session that started waiting first. Each SMS is claimed at most once
+    (conditional UPDATE on SMSLog.claimed_by), whoever claims it first.
+    """
+
+    REGISTRY_KEY = 'sms:sessions'
+    SESSION_TTL = int(os.getenv('SMS_SESSION_TTL', '900'))
+    # Allowed clock difference between the worker and the webhook host
+    CLOCK_SKEW = int(os.getenv('SMS_CLOCK_SKEW', '30'))
+
+    _client = None
+
+    @classmethod
+    def _redis(cls):
+        if cls._client is None:
+            cls._client = redis.Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379, db=0)
+        return cls._client
+
+    @classmethod
+    def open_session(cls, order_id=None, card=None, amount=None) -> ThreeDSSession:
+        """Registers a session that is about to wait for its SMS."""
+        from core.models import Order
+
+        key = f"order:{order_id}" if order_id else f"session:{uuid.uuid4().hex[:12]}"
+        session = ThreeDSSession(
+            key,
+            started_at=time.time(),
+            order_id=order_id,
+            sender=getattr(card, 'sms_sender', '') if card else '',
+            last4=card.card_number[-4:] if card and card.card_number else '',
+            amount=amount,
+        )
+        if order_id:
+            Order.objects.filter(id=order_id).update(three_ds_started_at=timezone.now())
+        try:
+            cls._redis().hset(cls.REGISTRY_KEY, key, json.dumps(session.to_dict()))
+        except redis.RedisError as e:
+            logger.warning(f"Could not register 3DS session {key}: {e}")
+        logger.info(f"3DS session {key} open (sender: {session.sender or '-'}, card: *{session.last4 or '-'}, amount: {session.amount})")
+        return session
+
+    @classmethod
+    def close_session(cls, session: ThreeDSSession):
+        try:
+            cls._redis().hdel(cls.REGISTRY_KEY, session.key)
+        except redis.RedisError:
+            pass
+
+    @classmethod
+    def open_sessions(cls) -> list:
+        now = time.time()
+        try:
+            raw = cls._redis().hgetall(cls.REGISTRY_KEY)
+        except redis.RedisError as e:
+            logger.warning(f"3DS session registry unavailable, using orders: {e}")
+            return cls._sessions_from_orders()
+
+        sessions, stale = [], []
+        for key, value in raw.items():
+            try:
+                session = ThreeDSSession.from_dict(json.loads(value))
+            except (ValueError, TypeError):
+                stale.append(key)
+                continue
+            if now - session.started_at > cls.SESSION_TTL:
+                stale.append(key)
+            else:
+                sessions.append(session)
+        if stale:
+            try:
+                cls._redis().hdel(cls.REGISTRY_KEY, *stale)
+            except redis.RedisError:
+                pass
+        return sessions
+
+    @classmethod
+    def _sessions_from_orders(cls) -> list:
+        from core.models import Order
+
+        since = timezone.now() - timedelta(seconds=cls.SESSION_TTL)
+        orders = Order.objects.filter(
+            status=Order.Status.WAITING_3DS, three_ds_started_at__gte=since
+        ).select_related('selected_card')
+        return [
+            ThreeDSSession(
+                f"order:{order.id}",
+                started_at=order.three_ds_started_at.timestamp(),
+                order_id=order.id,
+                sender=order.selected_card.sms_sender if order.selected_card else '',
+                last4=order.selected_card.card_number[-4:] if order.selected_card else '',
+                amount=order.amount,
+            )
+            for order in orders
+        ]
+
+    @classmethod
+    def match(cls, sender: str, body: str, received_at: float, sessions=None):
+        """Best session for an SMS (highest score, earliest start on ties) or None."""
+        best, best_rank = None, None
+        for session in (cls.open_sessions() if sessions is None else sessions):
+            score = session.score(sender, body, received_at)
+            if score is None:
+                continue
+            rank = (-score, session.started_at)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = session, rank
+        return best
+
+    @classmethod
+    def claim(cls, sms_log, session: ThreeDSSession) -> bool:
+        """At most one session gets an SMS: True only for the caller that claimed it."""
+        from core.models import SMSLog
+
+        fields = {'claimed_by': session.key, 'claimed_at': timezone.now()}
+        if session.order_id:
+            fields['related_order_id'] = session.order_id
+        claimed = SMSLog.objects.filter(id=sms_log.id, claimed_by__isnull=True).update(**fields) == 1
+        if claimed:
+            sms_log.claimed_by = session.key
+            if session.order_id:
+                sms_log.related_order_id = session.order_id
+            logger.info(f"SMS {sms_log.id} from {sms_log.sender} claimed by {session.key}")
+        return claimed
+
+    @classmethod
+    def assign(cls, sms_log):
+        """Webhook side: give a new SMS to its session. Returns the session or None."""
+        session = cls.match(sms_log.sender, sms_log.message_content, sms_log.received_at.timestamp())
+        if session and cls.claim(sms_log, session):
+            return session
+        logger.info(f"SMS {sms_log.id} from {sms_log.sender} left unclaimed (no matching 3DS session).")
+        return None
+
+    @classmethod
+    def claim_from_db(cls, session: ThreeDSSession):
+        """
+        Session side (fallback when a push was missed): the SMS the webhook
+        already gave this session, else the newest unclaimed SMS that fits
+        it, claimed on the spot. Returns the SMSLog or None.
+        """
+        from core.models import SMSLog
+
+        mine = SMSLog.objects.filter(claimed_by=session.key).order_by('-received_at').first()
+        if mine:
+            return mine
+
+        since = datetime.fromtimestamp(session.started_at - cls.CLOCK_SKEW, tz=dt_timezone.utc)
+        for sms_log in SMSLog.objects.filter(claimed_by__isnull=True, received_at__gte=since).order_by('-received_at')[:20]:
+            if session.score(sms_log.sender, sms_log.message_content, sms_log.received_at.timestamp()) is None:
+                continue
+            if cls.claim(sms_log, session):
+                return sms_log
+        return None
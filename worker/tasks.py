@@ -1,361 +1,376 @@
 from celery import shared_task
-from playwright.sync_api import sync_playwright
+import time
 import logging
 import traceback
 from django.utils import timezone
 from core.models import TestRun, CreditCard, Order, Operator
 from .engine.factory import OperatorFactory
+from .engine.browser_pool import browser_pool
 # Import the concrete implementation to ensure registration (if not auto-discovered)
 from .engine.turkcell import TurkcellOperator
 from .services.matik_api import MatikAPIService
-import difflib
+from .services.callback_outbox import CallbackOutboxService
+from .services.matik_poller import MatikPollScheduler
+from .services.catalog import PackageCatalogService
+from .services.order_flow import AutonomousOrderService
+from .services.order_pipeline import OrderPipeline
+from .services.order_queue import AsyncOrderQueue
 
 # Register manually for now since we don't have auto-discovery logic yet
 OperatorFactory.register('turkcell', TurkcellOperator)
 
+def _standby_preparer(operator_name, upload_type):
+    """Builds the callable the browser pool uses to pre-navigate a standby page."""
+    def prepare(page):
+        operator = OperatorFactory.get_operator(operator_name, page, None, clear_debug=False)
+        return operator.prepare_standby(upload_type)
+    return prepare
+
+# Keep hot tl-yukle pages ready for both upload types
+for _upload_type in ("Package", "TL"):
+    browser_pool.register_standby(('turkcell', _upload_type), _standby_preparer('turkcell', _upload_type), state_key='turkcell')
+
 import os
 os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def poll_matik_api():
+_default_operator = None
+
+def _matik_operator():
+    """Operator new API orders are created under (first/Turkcell for now), looked up once per process."""
+    global _default_operator
+    if _default_operator is None:
+        _default_operator = Operator.objects.first()
+    return _default_operator
+
+def _matik_raw_data(order_data, polled_at, since_last_poll):
+    # Save kontor to raw_api_data or similar to pass it without modifying model heavily
+    import json
+    return json.dumps({
+        'original_xml': MatikAPIService.talep_xml(order_data),
+        'api_operator': order_data.get('operator'),
+        'api_kontor': order_data.get('kontor'),
+        'api_paketadi': order_data.get('paketadi', ''),
+        # For queue-to-pickup latency: when we saw it, and the longest it can have waited at Matik before that
+        'polled_at': polled_at,
+        'max_wait_at_matik': since_last_poll,
+    })
+
+def ingest_matik_orders(orders, since_last_poll=None):
     """
-    Periodically checks the Matik API for new orders.
-    Creates Order objects and triggers processing.
+    Turns one Matik response into Order rows: all refs are looked up in one
+    query, new orders are inserted with one bulk_create, previously FAILED
+    ones are reset in one bulk_update. Returns the ids to process and counts.
     """
-    from core.models import SystemSetting
-    settings = SystemSetting.get_settings()
-    if not settings.is_autonomous_active:
-        logger.info("Autonomous system is currently DISABLED. Skipping system polling.")
-        return
-        
-    orders = MatikAPIService.fetch_pending_orders()
-    logger.info(f"Polled Matik API: Found {len(orders)} orders.")
-    
+    from django.db import transaction, IntegrityError
+
+    polled_at = time.time()
+    valid = {}
     for order_data in orders:
         ref = order_data.get('ref')
-        phone = order_data.get('phone')
-        operator_tag = order_data.get('operator')
-        kontor = order_data.get('kontor')
-        
-        if not ref or not phone or not operator_tag or not kontor:
+        if not ref or not order_data.get('phone') or not order_data.get('operator') or not order_data.get('kontor'):
             logger.warning(f"Incomplete order data from API: {order_data}")
             continue
-            
-        # Check if already exists
-        existing_order = Order.objects.filter(external_ref=ref).first()
+        valid.setdefault(ref, order_data)
+
+    existing = {
+        order.external_ref: order
+        for order in Order.objects.filter(external_ref__in=list(valid)).only('id', 'external_ref', 'status')
+    }
+
+    retried, new_orders = [], []
+    for ref, order_data in valid.items():
+        existing_order = existing.get(ref)
         if existing_order:
+            # Skip it unless it FAILED, whether it is currently processing or succeeded
             if existing_order.status == Order.Status.FAILED:
                 logger.info(f"Retrying previously FAILED order from API: Ref {ref}")
-                
-                # Reconstruct what the API sent us in case they fixed a typo
-                import json
-                raw_data = {
-                    'original_xml': order_data.get('raw', ''),
-                    'api_operator': operator_tag,
-                    'api_kontor': kontor,
-                    'api_paketadi': order_data.get('paketadi', '')
-                }
-                
-                # Reset the status for a clean run and update details
+                # Reset the status for a clean run, with what the API sent us in case they fixed a typo
                 existing_order.status = Order.Status.PENDING
                 existing_order.log_message = "Yeniden deneme (API üzerinden tekrar gönderildi)"
-                existing_order.raw_api_data = json.dumps(raw_data)
-                existing_order.phone_number = phone
-                existing_order.save()
-                
-                # Trigger processing again
-                process_autonomous_order.delay(existing_order.id)
-            
-            # Skip creating a new one whether it was FAILED (we just updated it) or it's currently processing/success
+                existing_order.raw_api_data = _matik_raw_data(order_data, polled_at, since_last_poll)
+                existing_order.phone_number = order_data['phone']
+                existing_order.updated_at = timezone.now()
+                retried.append(existing_order)
             continue
-            
-        logger.info(f"Creating new order from API: Ref {ref}, Phone {phone}, Op {operator_tag}, Kontor {kontor}")
-        
-        # Create Order
-        turkcell = Operator.objects.first() # Default to first/Turkcell for now
-        
-        # Save kontor to raw_api_data or similar to pass it without modifying model heavily
-        import json
-        raw_data = {
-            'original_xml': order_data.get('raw', ''),
-            'api_operator': operator_tag,
-            'api_kontor': kontor,
-            'api_paketadi': order_data.get('paketadi', '')
-        }
-        
-        new_order = Order.objects.create(
-            phone_number=phone,
-            operator=turkcell,
+
+        logger.info(f"Creating new order from API: Ref {ref}, Phone {order_data['phone']}, Op {order_data['operator']}, Kontor {order_data['kontor']}")
+        new_orders.append(Order(
+            phone_number=order_data['phone'],
+            operator=_matik_operator(),
             external_ref=ref,
             api_source='MATIK',
-            raw_api_data=json.dumps(raw_data),
+            raw_api_data=_matik_raw_data(order_data, polled_at, since_last_poll),
             status=Order.Status.PENDING
+        ))
+
+    try:
+        with transaction.atomic():
+            if retried:
+                Order.objects.bulk_update(retried, ['status', 'log_message', 'raw_api_data', 'phone_number', 'updated_at'])
+            if new_orders:
+                Order.objects.bulk_create(new_orders)
+    except IntegrityError as e:
+        # Another poll inserted some of these refs meanwhile; Matik lists them again next poll
+        logger.warning(f"Matik orders not saved, will retry on the next poll: {e}")
+        return [], {'received': len(orders), 'new': 0, 'retried': 0, 'skipped': len(valid)}
+
+    return [order.id for order in retried + new_orders], {
+        'received': len(orders), 'new': len(new_orders), 'retried': len(retried),
+        'skipped': len(valid) - len(new_orders) - len(retried),
+    }
+
+def dispatch_autonomous_orders(order_ids):
+    """
+    Enqueues the orders for processing: to the async worker with
+    ORDER_ENGINE=async, else to the browser queue with one grouped publish.
+    """
+    if not order_ids:
+        return
+    if AsyncOrderQueue.ENABLED and AsyncOrderQueue.push(order_ids):
+        return
+    from celery import group
+    group(process_autonomous_order.s(order_id) for order_id in order_ids).apply_async()
+
+# Orders are saved and dispatched in batches while the response is still streaming in
+INGEST_BATCH_SIZE = int(os.getenv('MATIK_INGEST_BATCH_SIZE', '200'))
+
+def _poll_matik_once(since_last_poll):
+    from itertools import islice
+    from core.models import SystemSetting
+    if not SystemSetting.get_settings().is_autonomous_active:
+        return 0, False
+
+    orders = MatikAPIService.iter_pending_orders()
+    totals = {'received': 0, 'new': 0, 'retried': 0, 'skipped': 0}
+    dispatched = 0
+    while True:
+        batch = list(islice(orders, INGEST_BATCH_SIZE))
+        if not batch:
+            break
+        order_ids, counts = ingest_matik_orders(batch, since_last_poll)
+        dispatch_autonomous_orders(order_ids)
+        dispatched += len(order_ids)
+        for key, value in counts.items():
+            totals[key] += value
+
+    logger.info(f"Polled Matik API: Found {totals['received']} orders ({totals}).")
+    return dispatched, MatikAPIService.last_fetch_failed
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def poll_matik_api():
+    """
+    Periodically checks the Matik API for new orders.
+    Creates Order objects and triggers processing.
+    Beat only ticks; MatikPollScheduler decides whether this tick polls.
+    """
+    from core.models import SystemSetting
+    settings = SystemSetting.get_settings()
+    if not settings.is_autonomous_active:
+        logger.info("Autonomous system is currently DISABLED. Skipping system polling.")
+        return
+
+    MatikPollScheduler.run(_poll_matik_once)
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def dispatch_callbacks():
+    """
+    Drains the Matik callback outbox (runs on the 'io' queue).
+    Triggered on every enqueue and by beat, which also picks up retries.
+    """
+    totals = CallbackOutboxService.dispatch()
+    if any(totals.values()):
+        logger.info(
+            f"Callback dispatch: {totals}, backlog {CallbackOutboxService.backlog()}, "
+            f"Matik callbacks: {MatikAPIService.callback_stats()}"
         )
-        
-        # Trigger processing
-        process_autonomous_order.delay(new_order.id)
+    return totals
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def sync_package_catalog(operator_id, upload_type, packages):
+    """Writes a scraped catalog into the Package table (runs on the 'catalog' queue, a diff, safe to repeat)."""
+    operator = Operator.objects.get(id=operator_id)
+    return PackageCatalogService.sync_to_db(operator, packages, upload_type)
 
 @shared_task
-def process_autonomous_order(order_id):
+def refresh_standby_pages():
     """
-    Autonomous flow for processing an API order.
+    Refreshes and tops up the standby pages of the browser worker process
+    that takes it (beat, every BROWSER_POOL_STANDBY_REFRESH seconds). A
+    process only takes it when idle, so no order waits for the navigation.
     """
-    try:
-        order = Order.objects.get(id=order_id)
-        order.status = Order.Status.PROCESSING
-        order.save()
-        
-        # Pull the globally selected default card
-        from core.models import SystemSetting
-        settings = SystemSetting.get_settings()
-        card = settings.default_card
+    browser_pool.refresh_standby()
 
-        if not card:
-            logger.error(f"No credit card available for order {order_id}")
-            order.status = Order.Status.FAILED
-            order.log_message = "No credit card available."
+def _run_order_steps(order, card, plan, pipeline, lease, operator, started):
+    """Steps of process_autonomous_order on a leased page, recorded by the pipeline."""
+    order_id = order.id
+    current_transaction_type = plan['upload_type']
+
+    if lease.resumed and operator.can_resume_at(pipeline.checkpoint):
+        pipeline.resume()
+    if lease.warm and not lease.resumed:
+        logger.info(f"Order {order_id}: Using hot standby page, skipping navigation.")
+        pipeline.skip('navigate', 'hot standby page')
+    elif pipeline.pending('navigate'):
+        # Step 1: Navigate, then select type
+        with pipeline.step('navigate'):
+            operator.navigate_to_base_url()
+            operator.select_upload_type(current_transaction_type)
+
+    # Step 2: Phone
+    if pipeline.pending('phone'):
+        with pipeline.step('phone'):
+            operator.fill_phone(order.phone_number)
+
+    # Step 3: Captcha
+    def captcha_callback(msg):
+        if msg == "CAPTCHA_PHASE_2":
+            logger.info(f"Order {order_id}: Moving to Captcha Phase 2 (2. defa deneniyor)")
+            order.log_message = "2. defa captcha deneniyor"
             order.save()
-            MatikAPIService.send_callback(order.external_ref, 2)
+
+    if pipeline.pending('captcha'):
+        with pipeline.step('captcha') as step:
+            if not operator.solve_captcha(log_callback=captcha_callback):
+                step.fail(str(operator.captcha_summary()))
+        if step.failed:
+            logger.error(f"Captcha failed for order {order_id}")
+            AutonomousOrderService.fail(order, "Captcha Failed")
             return
-            
-        # Bind card to order for usage statistics ("Günlük Kullanım")
-        order.selected_card = card
-        order.save()
 
-        # Check limit (Removed the strict validation lock)
-        # Usage will still be tracked for display on the front-end, but we will no longer
-        # block the transaction and fail the order if usage == 6.
+    # Step 4: Scrape - only needed to (re)build the shared catalog, selection below
+    # opens the tabs it needs by itself
+    if pipeline.pending('catalog'):
+        if PackageCatalogService.get('turkcell', current_transaction_type):
+            pipeline.skip('catalog', 'cached catalog')
+        else:
+            with pipeline.step('catalog'):
+                scraped_data = operator.scrape_packages(is_tl=plan['is_tl'])
+                try:
+                    turkcell = Operator.objects.filter(name__icontains='Turkcell').first()
+                    PackageCatalogService.refresh_in_background(turkcell, 'turkcell', current_transaction_type, scraped_data)
+                except Exception as catalog_err:
+                    logger.warning(f"Failed to refresh package catalog: {catalog_err}")
 
-        import json
+    # Step 5: Select Package
+    if pipeline.pending('select'):
+        with pipeline.step('select') as step:
+            selection_success = False
+            if plan['is_tl'] and plan['amount']:
+                selection_success = operator.select_package(amount=plan['amount'])
+            elif plan['package_id'] or plan['fallback_name']:
+                selection_success = operator.select_package(
+                    package_id=plan['package_id'], fallback_name=plan['fallback_name'],
+                    preferred_category=plan['preferred_category']
+                )
+            if not selection_success:
+                step.fail(f"no match for {plan['kontor']}")
+        if step.failed:
+            AutonomousOrderService.selection_failed(order, plan)
+            return
+        AutonomousOrderService.selected(
+            order, plan, getattr(operator, 'last_selected_name', ''), getattr(operator, 'last_selected_price', 0.0)
+        )
+
+    # Step 6: Payment
+    with pipeline.step('pay') as step:
+        if not operator.process_payment():
+            step.fail("payment form not submitted")
+    if step.failed:
+        logger.error("Payment processing failed")
+        AutonomousOrderService.fail(order)
+        return
+
+    AutonomousOrderService.waiting_3ds(order)
+
+    # Step 7: 3D Secure
+    with pipeline.step('3ds') as step:
+        success, message = operator.handle_3d_secure(
+            log_callback=lambda msg: logger.info(f"Order {order_id}: {msg}"),
+            order_id=order_id,
+            amount=order.amount
+        )
+        if not success:
+            step.fail(message)
+
+    # Step 8: Finalize
+    with pipeline.step('finalize'):
+        AutonomousOrderService.finish(order, card, success, message)
+
+        # Capture final screenshot before closing
         try:
-            raw_data = json.loads(order.raw_api_data)
-            api_operator = raw_data.get('api_operator', '')
-            api_kontor = raw_data.get('api_kontor', '')
-            api_paketadi = raw_data.get('api_paketadi', api_kontor) # Fallback to kontor if paketadi empty
-        except:
-            api_operator = ''
-            api_kontor = ''
-            api_paketadi = ''
-            
-        # Determine Transaction Type
-        current_transaction_type = "Package"
-        is_tl_load = False
-        if api_operator.lower() == 'turkcelltam':
-            current_transaction_type = "TL"
-            is_tl_load = True
+            final_screenshot_name = f"order_{order.id}_final"
+            operator.take_screenshot(final_screenshot_name)
+            AutonomousOrderService.attach_screenshot(order, f"debug_output/{final_screenshot_name}.png")
+        except Exception as ss_err:
+            logger.error(f"Failed to capture final screenshot: {ss_err}")
+
+    logger.info(f"Order {order_id}: {operator.routing_summary()}")
+    logger.info(f"Order {order_id}: {operator.wait_summary()}")
+    logger.info(f"Order {order_id}: {operator.phase_summary()}")
+    logger.info(f"Order {order_id}: {operator.captcha_summary()}")
+    logger.info(f"Order {order_id}: {pipeline.summary()}")
+    logger.info(f"Order {order_id}: processing {(time.perf_counter() - started) * 1000:.0f} ms (Matik callback queued)")
+    if plan['preferred_category']:
+        logger.info(f"Order {order_id}: Tab prediction stats {PackageCatalogService.tab_prediction_stats('turkcell')}")
+
+@shared_task
+def process_autonomous_order(order_id):
+    """
+    Autonomous flow for processing an API order.
+    """
+    started = time.perf_counter()
+    try:
+        order = AutonomousOrderService.start(order_id)
 
         # Matching Logic Before Browser Launch to save time and handle wait
-        matched_package_id = None
-        matched_amount = None
-        fallback_name = None
-        
-        if is_tl_load:
-            try:
-                matched_amount = float(api_kontor)
-            except ValueError:
-                logger.error(f"Invalid TL amount from API: {api_kontor}")
-                order.status = Order.Status.FAILED
-                order.log_message = f"Invalid TL amount: {api_kontor}"
-                order.save()
-                MatikAPIService.send_callback(order.external_ref, 2)
-                return
-        else:
-            # Package Loading - Check if code exists
-            from core.models import Package
-            turkcell = Operator.objects.first()
-            package_obj = Package.objects.filter(operator=turkcell, code=api_kontor).first()
-            
-            if package_obj:
-                if package_obj.package_id != 'UNDEFINED':
-                    # Exact ID match available
-                    matched_package_id = package_obj.package_id
-                    order.amount = package_obj.price
-                    # User might have populated package_id with the API kontor code incorrectly.
-                    # Send the readable name as fallback_name just in case!
-                    fallback_name = package_obj.name
-                else:
-                    # User manually defined it in the panel but didn't know the exact internal website ID. 
-                    # Use their defined "name" (e.g. "Fırsat 1GB") as the fuzzy match fallback!
-                    logger.info(f"Package {api_kontor} has no internal package_id, but user defined name '{package_obj.name}'. Using it for fuzzy match.")
-                    fallback_name = package_obj.name
-                    order.amount = package_obj.price
-            else:
-                logger.warning(f"Unknown or undefined package code: {api_kontor}. Will attempt fuzzy match in browser using: {api_paketadi}")
-                fallback_name = api_paketadi
-                # Do NOT return, we will proceed to launch the browser to find and fuzzy match the package
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-dev-shm-usage'])
-            context = browser.new_context()
-            page = context.new_page()
+        plan = AutonomousOrderService.plan(order)
+        if not plan:
+            return
+
+        # Check limit (Removed the strict validation lock)
+        # Usage will still be tracked for display on the front-end and the scheduler
+        # prefers cards under it, but we no longer fail the order if usage == 6.
+        card = AutonomousOrderService.assign_card(order, plan)
+        if not card:
+            return
+        current_transaction_type = plan['upload_type']
+
+        pipeline = OrderPipeline(order, current_transaction_type)
+        with browser_pool.lease(
+            standby=('turkcell', current_transaction_type), state_key='turkcell',
+            resume=pipeline.session_key if pipeline.checkpoint else None
+        ) as lease:
+            page = lease.page
             
             operator = OperatorFactory.get_operator('turkcell', page, card)
-            
-            # Step 1: Navigate
-            operator.navigate_to_base_url()
-            
-            # Step 2: Select Type & Phone
-            operator.select_upload_type(current_transaction_type)
-            operator.fill_phone(order.phone_number)
-            
-            # Step 3: Captcha
-            def captcha_callback(msg):
-                if msg == "CAPTCHA_PHASE_2":
-                    logger.info(f"Order {order_id}: Moving to Captcha Phase 2 (2. defa deneniyor)")
-                    order.log_message = "2. defa captcha deneniyor"
-                    order.save()
-                    
-            if not operator.solve_captcha(log_callback=captcha_callback):
-                logger.error(f"Captcha failed for order {order_id}")
-                order.status = Order.Status.FAILED
-                order.log_message = "Captcha Failed"
-                order.save()
-                MatikAPIService.send_callback(order.external_ref, 2) 
-                return
-
-            # Step 4: Scrape
-            scraped_data = operator.scrape_packages(is_tl=is_tl_load)
-            
-            # If we had a package ID, we don't need to match string anymore, we know it from db
-            # But let's verify if the scraped data has our matched_package_id
-            # This is optional, but good for sanity
-                  
-            # Step 5: Select Package
-            selection_success = False
-            if current_transaction_type == "TL" and matched_amount:
-                if operator.select_package(amount=matched_amount):
-                    selection_success = True
-                    order.amount = matched_amount
-                    order.resolved_package_name = getattr(operator, 'last_selected_name', f"{matched_amount} TL")
-                    order.save()
-            elif matched_package_id or fallback_name:
-                if operator.select_package(package_id=matched_package_id, fallback_name=fallback_name):
-                    selection_success = True
-                    order.resolved_package_name = getattr(operator, 'last_selected_name', fallback_name or matched_package_id)
-                    order.save()
-            
-            if not selection_success:
-                logger.error(f"Package selection failed for code {api_kontor}")
-                
-                if current_transaction_type == "Package":
-                    # Any package failure should wait for manual action (either unknown code or couldn't click)
-                    order.status = Order.Status.WAITING_MANUAL_ACTION
-                    order.log_message = f"Küpür bulunamadı veya eşleşmedi: {api_kontor}"
-                    order.save()
-                    
-                    from core.models import Package
-                    turkcell = Operator.objects.first()
-                    Package.objects.get_or_create(
-                        operator=turkcell,
-                        code=api_kontor,
-                        defaults={'name': f'Eşleşmeyen/Bilinmeyen Paket ({api_kontor})', 'package_id': 'UNDEFINED'}
-                    )
-                else:
-                    # TL loads fail outright because they don't have predefined buttons/names to map
-                    order.status = Order.Status.FAILED
-                    order.log_message = f"Could not match/select TL amount: {api_kontor}"
-                    order.save()
-                    MatikAPIService.send_callback(order.external_ref, 2) 
-                    
-                return
-                
-            elif fallback_name and not matched_package_id:
-                # We successfully fuzzy matched an unknown package! Auto-map it.
-                from core.models import Package
-                turkcell = Operator.objects.first()
-                matched_id = getattr(operator, 'last_selected_name', fallback_name)
-                scraped_price = getattr(operator, 'last_selected_price', 0.0)
-                
-                logger.info(f"Auto-mapping API code '{api_kontor}' to package '{matched_id}' with price {scraped_price}")
-                Package.objects.update_or_create(
-                    operator=turkcell,
-                    code=api_kontor,
-                    defaults={'name': matched_id, 'package_id': matched_id, 'price': scraped_price}
-                )
-                order.amount = scraped_price
-
-            # Step 6: Payment
-            if not operator.process_payment():
-                 logger.error("Payment processing failed")
-                 order.status = Order.Status.FAILED
-                 order.save()
-                 MatikAPIService.send_callback(order.external_ref, 2)
-                 return
-                 
-            order.status = Order.Status.WAITING_3DS
-            order.save()
-            
-            # Step 7: 3D Secure
-            success, message = operator.handle_3d_secure(log_callback=lambda msg: logger.info(f"Order {order_id}: {msg}"))
-            
-            if success:
-                order.status = Order.Status.COMPLETED
-                order.save()
-                MatikAPIService.send_callback(order.external_ref, 1)
-
-                # Deduct balance from card
-                try:
-                    if card and order.amount:
-                        card.balance -= order.amount
-                        card.save()
-                        logger.info(f"Deducted {order.amount} from card {card.alias} for autonomous order {order.id}. New balance: {card.balance}")
-                        if card.balance < 0:
-                            order.balance_went_negative = True
-                            order.save()
-                            logger.warning(f"Card {card.alias} balance went negative: {card.balance}")
-                except Exception as balance_err:
-                    logger.error(f"Balance deduction error in autonomous order: {balance_err}")
-            else:
-                order.status = Order.Status.FAILED
-                order.log_message = f"3DS Failed: {message}"
-                order.save()
-                MatikAPIService.send_callback(order.external_ref, 2)
-                
-            # Capture final screenshot before closing
-            import os
             try:
-                final_screenshot_name = f"order_{order.id}_final"
-                operator.take_screenshot(final_screenshot_name)
-                final_screenshot_path = f"debug_output/{final_screenshot_name}.png"
-                
-                if os.path.exists(final_screenshot_path):
-                    from django.core.files import File
-                    with open(final_screenshot_path, "rb") as f:
-                        order.final_screenshot.save(f"{order.id}_final.png", File(f), save=True)
-                    # Clean up the local file after saving to Django's media storage
-                    os.remove(final_screenshot_path)
-            except Exception as ss_err:
-                logger.error(f"Failed to capture final screenshot: {ss_err}")
-                
-            browser.close()
+                _run_order_steps(order, card, plan, pipeline, lease, operator, started)
+            finally:
+                # A session stopped at a checkpoint stays open for the retry of the order
+                if pipeline.park_at:
+                    lease.park(pipeline.session_key)
 
     except Exception as e:
         logger.error(f"Autonomous Processing Error: {e}\n{traceback.format_exc()}")
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = Order.Status.FAILED
-            order.log_message = str(e)
-            order.save()
-            MatikAPIService.send_callback(order.external_ref, 2)
-        except:
-            pass
+        AutonomousOrderService.fail_by_id(order_id, str(e))
 
 @shared_task
 def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"):
     """
     Starts the interactive flow:
-    1. Launches browser
+    1. Leases a browser context from the worker pool
+       (a cached catalog is offered for selection right away)
     2. Enters Phone & Solves Captcha
-    3. Scrapes Packages & Updates DB
+    3. Scrapes Packages & Refreshes the catalog (Redis + DB diff)
     4. Waits for user selection via Redis
     5. Completes Payment
     """
     import redis
     import json
     import time
-    from core.models import Package, Operator
+    from core.models import Operator
     
     # Redis connection
     r = redis.Redis(host='redis', port=6379, db=0)
@@ -365,21 +380,33 @@ def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"
         test_run.append_log(f"Starting Interactive Flow ({transaction_type})...")
         test_run.status = 'RUNNING'
         test_run.save()
+        r.set(f"transaction:{test_run_id}:type", transaction_type)
 
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-dev-shm-usage'])
-            context = browser.new_context()
-            page = context.new_page()
+        # Show the cached catalog immediately, the scrape below refreshes it
+        cached_catalog = PackageCatalogService.get('turkcell', transaction_type)
+        if cached_catalog:
+            age = time.time() - cached_catalog['scraped_at']
+            test_run.append_log(
+                f"Cached catalog v{cached_catalog['version']} ({len(cached_catalog['packages'])} options, "
+                f"{age:.0f}s old) available, refreshing in background."
+            )
+            r.set(f"transaction:{test_run_id}:status", "WAITING_SELECTION")
+
+        with browser_pool.lease(standby=('turkcell', transaction_type), state_key='turkcell') as lease:
+            page = lease.page
             
             # Initialize with dummy card, will update later
             operator = OperatorFactory.get_operator('turkcell', page, None)
             
             # Step 1: Entry
-            test_run.append_log("Navigating and identifying...")
-            operator.navigate_to_base_url()
-            
-            # Select Type (Package or TL)
-            operator.select_upload_type(transaction_type)
+            if lease.warm:
+                test_run.append_log("Using hot standby page (already on form)...")
+            else:
+                test_run.append_log("Navigating and identifying...")
+                operator.navigate_to_base_url()
+                
+                # Select Type (Package or TL)
+                operator.select_upload_type(transaction_type)
             
             operator.fill_phone(phone_number)
             
@@ -387,48 +414,29 @@ def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"
                 test_run.append_log("Captcha Failed.")
                 test_run.status = 'FAILED'
                 test_run.save()
+                # With a cached catalog the user may already have picked a package
+                raw_selection = r.get(f"transaction:{test_run_id}:selection")
+                if raw_selection:
+                    early_order_id = json.loads(raw_selection).get('order_id')
+                    if early_order_id:
+                        Order.objects.filter(id=early_order_id).update(status='FAILED')
                 r.set(f"transaction:{test_run_id}:status", "FAILED")
                 return "Captcha Failed"
                 
             test_run.append_log("Captcha Solved. Scraping packages...")
             
-            # Clear old packages for this operator to ensure fresh data
-            # Ideally we might want to flag them as inactive instead, but for now delete 
-            # to avoid mixing old/test data with live data.
-            try:
-                turkcell = Operator.objects.get(name__icontains='Turkcell')
-                Package.objects.filter(operator=turkcell).delete()
-                test_run.append_log("Cleared old cached packages.")
-            except Exception as e:
-                logger.warning(f"Could not clear packages: {e}")
-            
             # Step 2: Scrape
             # Pass is_tl=True if transaction_type is TL
             scraped_data = operator.scrape_packages(is_tl=(transaction_type == "TL"))
             test_run.append_log(f"Scraped {len(scraped_data)} options.")
             
-            # Update DB
-            turkcell = Operator.objects.get(name__icontains='Turkcell')
-            for pkg in scraped_data:
-                try:
-                    # Truncate to avoid DataError (max_length=100)
-                    safe_name = pkg['name'][:99]
-                    safe_category = pkg['category'][:99]
-                    safe_id = pkg['package_id'][:99]
-                    
-                    Package.objects.update_or_create(
-                        operator=turkcell,
-                        name=safe_name,
-                        defaults={
-                            'price': pkg['price'],
-                            'category': safe_category,
-                            'package_id': safe_id
-                        }
-                    )
-                except Exception as db_err:
-                    logger.warning(f"Failed to save package {pkg.get('name', 'Unknown')}: {db_err}")
-                    # Continue to next package instead of crashing
-                    continue
+            # Refresh catalog cache now, the DB diff (no delete-all) is written on the catalog queue
+            try:
+                turkcell = Operator.objects.get(name__icontains='Turkcell')
+                version = PackageCatalogService.refresh_in_background(turkcell, 'turkcell', transaction_type, scraped_data)
+                test_run.append_log(f"Catalog v{version} stored, package table sync queued.")
+            except Exception as db_err:
+                logger.warning(f"Failed to refresh package catalog: {db_err}")
             
             # Notify Frontend via Redis
             # Set status to WAITING_SELECTION
@@ -464,7 +472,6 @@ def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"
             operator.card = card # Update operator card
             
             order_id = selection_data.get('order_id')
-            from core.models import Order
             
             # Step 4: Select Package
             selection_result = False
@@ -505,7 +512,7 @@ def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"
                 
             # Step 6: 3D Secure
             test_run.append_log("Waiting for 3D Secure...")
-            success, message = operator.handle_3d_secure(log_callback=test_run.append_log)
+            success, message = operator.handle_3d_secure(log_callback=test_run.append_log, order_id=order_id)
             
             if success:
                  test_run.append_log("3D Secure Completed.")
@@ -537,7 +544,10 @@ def start_interactive_flow(test_run_id, phone_number, transaction_type="Package"
             r.set(f"transaction:{test_run_id}:status", test_run.status)
             
             operator.take_screenshot(f"final_{test_run_id}")
-            browser.close()
+            test_run.append_log(operator.routing_summary())
+            test_run.append_log(operator.wait_summary())
+            test_run.append_log(operator.phase_summary())
+            test_run.append_log(operator.captcha_summary())
 
     except Exception as e:
         error_msg = f"Interactive Flow Failed: {str(e)}\n{traceback.format_exc()}"
@@ -560,30 +570,25 @@ def run_test_flow(test_run_id, phone_number, package_id=None, card_id=None, amou
         card = CreditCard.objects.get(id=card_id)
         test_run.append_log(f"Using Card: {card.alias}")
 
-        with sync_playwright() as p:
-            # Must be True for Docker unless Xvfb is set up
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-dev-shm-usage']) 
-            # Note: On a server without display, use headless=True or xvfb
-            
-            context = browser.new_context()
-            page = context.new_page()
+        upload_type = "TL" if amount else "Package"
+        with browser_pool.lease(standby=('turkcell', upload_type), state_key='turkcell') as lease:
+            page = lease.page
             
             operator = OperatorFactory.get_operator('turkcell', page, card)
             test_run.append_log("Operator Initialized.")
 
-            # Step 1: Navigate
-            test_run.append_log("Navigating to Base URL...")
-            operator.navigate_to_base_url()
-            operator.take_screenshot(f"step1_{test_run_id}")
-            test_run.append_log("Navigation Complete.")
-
-            # Step 1.5: Select Type
-            if amount:
-                 test_run.append_log("Selecting Upload Type: TL")
-                 operator.select_upload_type("TL")
+            if lease.warm:
+                test_run.append_log(f"Using hot standby page (Upload Type: {upload_type} already selected).")
             else:
-                 test_run.append_log("Selecting Upload Type: Package")
-                 operator.select_upload_type("Package")
+                # Step 1: Navigate
+                test_run.append_log("Navigating to Base URL...")
+                operator.navigate_to_base_url()
+                operator.take_screenshot(f"step1_{test_run_id}")
+                test_run.append_log("Navigation Complete.")
+
+                # Step 1.5: Select Type
+                test_run.append_log(f"Selecting Upload Type: {upload_type}")
+                operator.select_upload_type(upload_type)
 
             # Step 2: Fill Phone
             test_run.append_log(f"Filling Phone: {phone_number}...")
@@ -640,7 +645,10 @@ def run_test_flow(test_run_id, phone_number, package_id=None, card_id=None, amou
 
             test_run.save()
             operator.take_screenshot(f"final_{test_run_id}")
-            browser.close()
+            test_run.append_log(operator.routing_summary())
+            test_run.append_log(operator.wait_summary())
+            test_run.append_log(operator.phase_summary())
+            test_run.append_log(operator.captcha_summary())
 
     except Exception as e:
         error_msg = f"Test Failed with Error: {str(e)}\n{traceback.format_exc()}"
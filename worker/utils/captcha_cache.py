@@ -0,0 +1,158 @@
+import io
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 16
+# Bits two hashes may differ in and still be the same challenge; measure with
+# benchmark_captcha_ocr.py on labelled samples before changing it
+MAX_DISTANCE = int(os.getenv('CAPTCHA_CACHE_MAX_DISTANCE', '12'))
+
+
+def image_hash(raw: bytes, hash_size: int = HASH_SIZE) -> str:
+    """
+    Difference hash (dHash) of the decoded image: the image is shrunk to
+    (hash_size + 1) x hash_size grayscale and every bit says whether a pixel
+    is brighter than its right neighbour. The same challenge re-served under
+    a new data: URL hashes the same, re-encoded it flips a few bits; different
+    texts differ in more bits (see CaptchaAnswerCache).
+    """
+    with Image.open(io.BytesIO(raw)) as img:
+        width, height = img.size
+        gray = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(gray.getdata())
+
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{width}x{height}:{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hash_distance(a: str, b: str):
+    """Number of differing bits, None for images of different sizes."""
+    size_a, bits_a = a.split(':')
+    size_b, bits_b = b.split(':')
+    if size_a != size_b:
+        return None
+    return (int(bits_a, 16) ^ int(bits_b, 16)).bit_count()
+
+
+class CaptchaAnswerCache:
+    """
+    Answers the site confirmed, keyed by image hash (LRU with a TTL).
+
+    An image matches an entry when the hashes differ in at most max_distance
+    of the 256 bits. Measured on 150x50 captchas: re-encoding the same image
+    as JPEG flips up to 6 bits at quality 95, 10 at quality 75 and 13 at 60,
+    while different texts on the same background can be as close as 15 bits
+    (a different background puts them 75+ apart). The default of 12 keeps
+    re-encodes down to quality 75 and stays 3 bits under the closest
+    different challenge; CAPTCHA_CACHE_MAX_DISTANCE overrides it.
+    Only answers reported correct by solve_captcha are stored; a cached answer
+    the site rejects is evicted at once. Each entry keeps how long solving it
+    took, which is what a hit saves.
+    """
+
+    def __init__(self, max_size: int = 2048, ttl: int = 21600, max_distance: int = MAX_DISTANCE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()   # hash -> (code, solve_ms, stored_at)
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'hits': 0, 'stored': 0, 'evicted': 0, 'expired': 0, 'saved_ms': 0.0}
+
+    def key_for(self, image):
+        """Hash of a CaptchaImage, None if it cannot be decoded."""
+        try:
+            return image_hash(image.raw)
+        except Exception as e:
+            logger.debug(f"Captcha cache: could not hash image: {e}")
+            return None
+
+    def _nearest(self, key):
+        """Stored key closest to key within max_distance, or None."""
+        if key in self._entries:
+            return key
+        best, best_distance = None, self.max_distance + 1
+        for stored in self._entries:
+            distance = hash_distance(key, stored)
+            if distance is not None and distance < best_distance:
+                best, best_distance = stored, distance
+        return best
+
+    def get(self, key):
+        if not key:
+            return None
+        with self._lock:
+            self._stats['lookups'] += 1
+            match = self._nearest(key)
+            if match is None:
+                return None
+            code, solve_ms, stored_at = self._entries[match]
+            if time.time() - stored_at > self.ttl:
+                del self._entries[match]
+                self._stats['expired'] += 1
+                return None
+            self._entries.move_to_end(match)
+            self._stats['hits'] += 1
+            self._stats['saved_ms'] += solve_ms
+        logger.info(f"Captcha cache hit: '{code}' (saves ~{solve_ms:.0f} ms)")
+        return code
+
+    def confirm(self, key, code: str, solve_ms: float):
+        """The site accepted code for this image."""
+        if not key or not code:
+            return
+        with self._lock:
+            match = self._nearest(key)
+            previous = self._entries.pop(match, None) if match else None
+            # A re-confirmed hit keeps the solve time of the original solve
+            if previous and previous[0] == code:
+                solve_ms = previous[1]
+            self._entries[key] = (code, solve_ms, time.time())
+            if not previous:
+                self._stats['stored'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, key):
+        """The site rejected the answer for this image."""
+        if not key:
+            return
+        with self._lock:
+            match = self._nearest(key)
+            if match and self._entries.pop(match, None) is not None:
+                self._stats['evicted'] += 1
+                logger.info("Captcha cache: rejected answer evicted.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        stats['saved_ms'] = round(stats['saved_ms'], 1)
+        stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 3) if stats['lookups'] else None
+        return stats
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def answer_cache() -> CaptchaAnswerCache:
+    """One answer cache per worker process, shared by all solvers."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = CaptchaAnswerCache(
+                max_size=int(os.getenv('CAPTCHA_CACHE_SIZE', '2048')),
+                ttl=int(os.getenv('CAPTCHA_CACHE_TTL', '21600')),
+                max_distance=MAX_DISTANCE,
+            )
+        return _answer_cache
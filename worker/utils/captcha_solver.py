@@ -1,60 +1,512 @@
 import os
-import sys
+import re
+import time
+import base64
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
 from twocaptcha import TwoCaptcha
+from twocaptcha.api import ApiClient, ApiException, NetworkException
+
+from .captcha_cache import answer_cache
+
+logger = logging.getLogger(__name__)
+
+# Shared by every solver in the process: backends run here while the browser
+# thread keeps working (focus the input, verify the previous answer, ...).
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CAPTCHA_SOLVER_THREADS', '4')),
+    thread_name_prefix='captcha'
+)
+
+_stats_lock = threading.Lock()
+_backend_stats = {}
+
+
+def _stats_for(name: str) -> dict:
+    return _backend_stats.setdefault(name, {
+        'calls': 0, 'errors': 0, 'answers': 0, 'wins': 0, 'skipped': 0,
+        'correct': 0, 'incorrect': 0, 'total_ms': 0.0, 'cost': 0.0,
+    })
+
+
+def _record(name: str, **deltas):
+    with _stats_lock:
+        stats = _stats_for(name)
+        for key, value in deltas.items():
+            stats[key] += value
+
+
+def solver_stats() -> dict:
+    """Per-backend latency, accuracy and cost counters of this process."""
+    with _stats_lock:
+        result = {}
+        for name, s in _backend_stats.items():
+            judged = s['correct'] + s['incorrect']
+            result[name] = {
+                'calls': s['calls'],
+                'errors': s['errors'],
+                'wins': s['wins'],
+                'skipped': s['skipped'],
+                'avg_ms': round(s['total_ms'] / s['calls'], 1) if s['calls'] else None,
+                'accuracy': round(s['correct'] / judged, 3) if judged else None,
+                'cost': round(s['cost'], 4),
+            }
+        return result
+
+
+class CaptchaImage:
+    """
+    A captcha image as the page gave it (data: URL / base64) or as bytes.
+    Decoding and encoding happen at most once and only if a backend or
+    cache asks for that form; nothing touches the disk.
+    """
+
+    def __init__(self, image):
+        self._raw = None
+        self._b64 = None
+        if isinstance(image, (bytes, bytearray)):
+            self._raw = bytes(image)
+        else:
+            self._b64 = image.split(",", 1)[1] if "," in image else image
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = base64.b64decode(self._b64)
+        return self._raw
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self._raw).decode('ascii')
+        return self._b64
+
+
+class SessionApiClient(ApiClient):
+    """
+    2Captcha API client on one pooled requests.Session (keep-alive to
+    2captcha.com instead of a new TLS connection per in.php/res.php call).
+    """
+
+    def __init__(self, post_url='2captcha.com', pool_size: int = 8):
+        super().__init__(post_url=post_url)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def _check(self, resp) -> str:
+        if resp.status_code != 200:
+            raise NetworkException(f'bad response: {resp.status_code}')
+        text = resp.content.decode('utf-8')
+        if 'ERROR' in text:
+            raise ApiException(text)
+        return text
+
+    def in_(self, files={}, **kwargs):
+        # Captchas are posted as base64 (method=base64); file uploads are only
+        # used by other captcha types (hint images) and keep working
+        handles = {key: open(path, 'rb') for key, path in files.items()}
+        try:
+            resp = self.session.post(f'https://{self.post_url}/in.php', data=kwargs, files=handles or None, timeout=30)
+        except requests.RequestException as e:
+            raise NetworkException(e)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return self._check(resp)
+
+    def res(self, **kwargs):
+        try:
+            resp = self.session.get(f'https://{self.post_url}/res.php', params=kwargs, timeout=30)
+        except requests.RequestException as e:
+            raise NetworkException(e)
+        return self._check(resp)
+
+
+_api_client = None
+_api_client_lock = threading.Lock()
+
+
+def shared_api_client() -> SessionApiClient:
+    """One 2Captcha session per worker process, shared by all solvers and threads."""
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = SessionApiClient()
+        return _api_client
+
+
+class CaptchaBackend:
+    """
+    One way of turning a captcha image into text.
+    solve() returns (code, confidence 0..1, meta); meta is handed back to
+    report() once the site told us whether the answer was right.
+    An answer with confidence >= min_confidence wins the race immediately.
+    Local backends run inside the worker; in escalate mode the remote ones
+    are only called when no local answer is confident.
+    """
+    name = 'base'
+    cost = 0.0
+    min_confidence = 0.0
+    local = False
+
+    def available(self) -> bool:
+        return True
+
+    def solve(self, image: CaptchaImage):
+        raise NotImplementedError
+
+    def report(self, meta, correct: bool):
+        pass
+
+
+class TwoCaptchaBackend(CaptchaBackend):
+    """Remote human solvers. No confidence is reported, their answers are trusted."""
+    name = '2captcha'
+    cost = float(os.getenv('TWOCAPTCHA_COST', '0.001'))
+    min_confidence = 0.9
+
+    def __init__(self, api_key=None):
+        self.client = None
+        if api_key:
+            # res.php is polled every pollingInterval seconds until the answer is ready
+            self.client = TwoCaptcha(api_key, pollingInterval=int(os.getenv('TWOCAPTCHA_POLLING_INTERVAL', '5')))
+            self.client.api_client = shared_api_client()
+
+    def available(self) -> bool:
+        return self.client is not None
+
+    def solve(self, image: CaptchaImage):
+        # Posted as base64 straight from memory (method=base64), no temp file
+        result = self.client.solve(method='base64', body=image.b64)
+        return result['code'].upper(), 0.9, result.get('captchaId')
+
+    def report(self, meta, correct: bool):
+        # Wrong answers are refunded by 2Captcha
+        if meta:
+            try:
+                self.client.report(meta, correct)
+            except Exception as e:
+                logger.debug(f"2Captcha report failed: {e}")
+
+
+# The site's captchas are alphanumeric and at least this long (see solve_captcha)
+MIN_CODE_LENGTH = int(os.getenv('CAPTCHA_MIN_LENGTH', '5'))
+
+
+def _ocr_confidence(result) -> float:
+    """
+    Confidence of a ddddocr probability=True result: newer versions report it
+    directly, older ones only give the per-step distributions (mean of the
+    per-step maxima, which is what newer versions compute).
+    """
+    if not isinstance(result, dict):
+        return 0.0
+    if 'confidence' in result:
+        return float(result['confidence'])
+    steps = result.get('probability') or []
+    if not len(steps):
+        return 0.0
+    return float(sum(max(step) for step in steps) / len(steps))
+
+
+class DdddOcrBackend(CaptchaBackend):
+    """
+    Offline OCR on the worker's CPU (ddddocr, in requirements.txt).
+    The model is loaded once per process. Answers that cannot be a valid
+    captcha (too short) get confidence 0 so they are escalated.
+    """
+    name = 'ddddocr'
+    cost = 0.0
+    min_confidence = float(os.getenv('LOCAL_OCR_MIN_CONFIDENCE', '0.9'))
+    local = True
+
+    _ocr = None
+    _load_failed = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def _engine(cls):
+        with cls._lock:
+            if cls._ocr is None and not cls._load_failed:
+                try:
+                    import ddddocr
+                    started = time.perf_counter()
+                    cls._ocr = ddddocr.DdddOcr(show_ad=False)
+                    logger.info(f"Local OCR model loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+                except Exception as e:
+                    # Not installed or model failed to load: remote backends only
+                    cls._load_failed = True
+                    logger.warning(f"Local OCR backend unavailable: {e}")
+            return cls._ocr
+
+    def available(self) -> bool:
+        return self._engine() is not None
+
+    def solve(self, image: CaptchaImage):
+        ocr = self._engine()
+        result = ocr.classification(image.raw, probability=True)
+        if isinstance(result, dict) and 'text' in result:
+            text = result['text']
+        else:
+            text = ocr.classification(image.raw)
+        code = re.sub(r'[^0-9A-Za-z]', '', text or '').upper()
+        confidence = _ocr_confidence(result) if len(code) >= MIN_CODE_LENGTH else 0.0
+        return code, confidence, None
+
+
+# name -> backend class; CAPTCHA_BACKENDS selects which ones are used
+BACKENDS = {
+    '2captcha': TwoCaptchaBackend,
+    'ddddocr': DdddOcrBackend,
+}
+
+
+def register_backend(backend_cls):
+    BACKENDS[backend_cls.name] = backend_cls
+    return backend_cls
+
+
+POLICIES = ('race', 'escalate')
+
+
+class CaptchaTicket:
+    """
+    A captcha handed to the pipeline. Solving starts as soon as the ticket is
+    created; result() waits for the first confident answer.
+
+    policy 'race': every backend starts at once.
+    policy 'escalate': local backends start at once, remote ones are queued
+    behind them and skip the call when a local answer is already confident.
+
+    With a cache, an image the site already accepted an answer for is not
+    solved again; report() confirms or evicts the cached answer.
+    """
+
+    def __init__(self, src, image: CaptchaImage, backends, policy: str = 'race', cache=None):
+        self.src = src
+        self.image = image
+        self.submitted_at = time.perf_counter()
+        self.answers = {}     # backend name -> (code, confidence, meta)
+        self.winner = None
+        self.code = ""
+        self.solve_ms = None
+        self._decided = False
+        self._reported = False
+        self._futures = {}
+
+        self.cache = cache
+        self.cache_key = cache.key_for(image) if cache else None
+        cached = cache.get(self.cache_key) if cache else None
+        if cached:
+            self.winner, self.code, self._decided = 'cache', cached, True
+            self.solve_ms = 0.0
+            return
+
+        local = [b for b in backends if b.local]
+        gated = policy == 'escalate' and local and len(local) < len(backends)
+        # Local futures are submitted first: the gated remote tasks wait on them
+        # and the executor starts tasks in submission order, so they cannot starve
+        for backend in local:
+            self._futures[_executor.submit(self._run, backend)] = backend
+        local_futures = dict(self._futures)
+        for backend in backends:
+            if backend.local:
+                continue
+            if gated:
+                future = _executor.submit(self._run_escalated, backend, local_futures)
+            else:
+                future = _executor.submit(self._run, backend)
+            self._futures[future] = backend
+
+    def _run(self, backend):
+        started = time.perf_counter()
+        try:
+            answer = backend.solve(self.image)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _record(backend.name, calls=1, answers=1 if answer[0] else 0, total_ms=elapsed_ms, cost=backend.cost)
+            logger.info(f"Captcha backend {backend.name}: '{answer[0]}' (confidence {answer[1]:.2f}) in {elapsed_ms:.0f} ms")
+            return answer
+        except Exception as e:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _record(backend.name, calls=1, errors=1, total_ms=elapsed_ms, cost=backend.cost)
+            logger.warning(f"Captcha backend {backend.name} failed after {elapsed_ms:.0f} ms: {e}")
+            raise
+
+    @staticmethod
+    def _local_confident(local_futures) -> bool:
+        wait(local_futures)
+        for future, backend in local_futures.items():
+            if future.exception() is None:
+                code, confidence, _ = future.result()
+                if code and confidence >= backend.min_confidence:
+                    return True
+        return False
+
+    def _run_escalated(self, backend, local_futures):
+        if self._local_confident(local_futures):
+            _record(backend.name, skipped=1)
+            return None
+        logger.info(f"Local captcha answer not confident, escalating to {backend.name}")
+        return self._run(backend)
+
+    def result(self, timeout: float = None) -> str:
+        """First answer at or above its backend's min_confidence, else the most confident one."""
+        if self._decided:
+            return self.code
+
+        deadline = time.perf_counter() + timeout if timeout else None
+        pending = set(self._futures)
+        best = None
+        while pending:
+            remaining = max(deadline - time.perf_counter(), 0) if deadline else None
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning("Captcha race timed out.")
+                break
+            for future in done:
+                backend = self._futures[future]
+                try:
+                    answer = future.result()
+                except Exception:
+                    continue
+                if answer is None:
+                    # Escalation not needed
+                    continue
+                code, confidence, meta = answer
+                self.answers[backend.name] = (code, confidence, meta)
+                if not code:
+                    continue
+                if confidence >= backend.min_confidence:
+                    return self._decide(backend.name, code)
+                if best is None or confidence > best[2]:
+                    best = (backend.name, code, confidence)
+
+        if best:
+            return self._decide(best[0], best[1])
+        self._decided = True
+        return ""
+
+    def _decide(self, name: str, code: str) -> str:
+        self.winner, self.code, self._decided = name, code, True
+        self.solve_ms = (time.perf_counter() - self.submitted_at) * 1000
+        _record(name, wins=1)
+        logger.info(f"Captcha race won by {name} in {self.solve_ms:.0f} ms")
+        return code
+
+    def report(self, correct: bool):
+        """
+        Feed the site's verdict back: the winner is judged directly, other
+        backends too when their answer agrees (same verdict) or when the
+        winner was right (a different answer was wrong).
+        """
+        if self._reported or not self.winner:
+            return
+        self._reported = True
+        if self.cache:
+            if correct:
+                self.cache.confirm(self.cache_key, self.code, self.solve_ms or 0.0)
+            else:
+                self.cache.evict(self.cache_key)
+        for future, backend in self._futures.items():
+            answer = self.answers.get(backend.name)
+            if not answer or not answer[0]:
+                continue
+            if answer[0] == self.code:
+                verdict = correct
+            elif correct:
+                verdict = False
+            else:
+                continue
+            _record(backend.name, correct=1 if verdict else 0, incorrect=0 if verdict else 1)
+            backend.report(answer[2], verdict)
+
 
 class CaptchaSolver:
     def __init__(self):
         self.api_key = os.getenv("CAPTCH_API_KEY")
         if not self.api_key:
-            print("WARNING: CAPTCH_API_KEY is not set.")
-            self.solver = None
-        else:
-            self.solver = TwoCaptcha(self.api_key)
+            logger.warning("CAPTCH_API_KEY is not set.")
 
-    def solve_base64(self, base64_str: str) -> str:
+        names = [n.strip() for n in os.getenv('CAPTCHA_BACKENDS', '2captcha').split(',') if n.strip()]
+        self.policy = os.getenv('CAPTCHA_POLICY', 'escalate')
+        if self.policy not in POLICIES:
+            logger.warning(f"Unknown CAPTCHA_POLICY '{self.policy}', using 'race'.")
+            self.policy = 'race'
+        self.cache = answer_cache() if os.getenv('CAPTCHA_CACHE', 'True') == 'True' else None
+        self.backends = []
+        for name in names:
+            backend_cls = BACKENDS.get(name)
+            if not backend_cls:
+                logger.warning(f"Unknown captcha backend '{name}', skipping.")
+                continue
+            backend = backend_cls(self.api_key) if backend_cls is TwoCaptchaBackend else backend_cls()
+            if backend.available():
+                self.backends.append(backend)
+
+        # Kept for callers that talk to 2Captcha directly (balance display)
+        remote = next((b for b in self.backends if isinstance(b, TwoCaptchaBackend)), None)
+        self.solver = remote.client if remote else None
+
+    def submit(self, image) -> CaptchaTicket:
         """
-        Solves base64 encoded captcha image using 2Captcha.
+        Start solving right away (bytes, base64 or data: URL) and return a
+        ticket; call ticket.result() when the answer is needed.
         """
-        if not self.solver:
-             print("Cannot solve: Solver not initialized (Missing API Key).")
-             return ""
-
-        # Remove header if present
-        if "," in base64_str:
-            base64_str = base64_str.split(",")[1]
+        return CaptchaTicket(
+            image if isinstance(image, str) else None, CaptchaImage(image),
+            self.backends, self.policy, cache=self.cache
+        )
 
+    def solve_image(self, image) -> str:
+        """
+        Solves a captcha given as bytes, base64 or data: URL, from memory.
+        """
+        if not self.backends:
+            logger.error("Cannot solve: no captcha backend available (Missing API Key?).")
+            return ""
         try:
-            # 2Captcha accepts base64 strings directly
-            # method='base64' is handled by the library if we pass the string correctly or save to file
-            # The library typically prefers file path, but supports base64 too.
-            # Ideally we save temp file to be safe and robust.
-            
-            import tempfile
-            import base64
-            
-            # Save base64 to temp file
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-                temp_file.write(base64.b64decode(base64_str))
-                temp_file_path = temp_file.name
-
-            try:
-                print(f"Sending captcha to 2Captcha... (File: {temp_file_path})")
-                result = self.solver.normal(temp_file_path)
-                print(f"2Captcha Result: {result}")
-                return result['code'].upper()
-            finally:
-                # Cleanup
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-            
+            return self.submit(image).result()
         except Exception as e:
-            print(f"2Captcha Failed: {e}")
+            logger.error(f"Captcha solving failed: {e}")
             return ""
 
+    def solve_base64(self, base64_str: str) -> str:
+        """
+        Solves base64 encoded captcha image with the configured backends.
+        """
+        return self.solve_image(base64_str)
+
     def solve(self, image_data: bytes) -> str:
         """
         Wrapper for raw bytes input.
         """
-        import base64
-        base64_str = base64.b64encode(image_data).decode('utf-8')
-        return self.solve_base64(base64_str)
+        return self.solve_image(image_data)
+
+    def solve_many(self, images, timeout: float = None) -> list:
+        """
+        Solves several captchas at once: all are submitted before any result
+        is awaited, so they are solved concurrently. Returns codes in order
+        ("" for failures).
+        """
+        if not self.backends:
+            logger.error("Cannot solve: no captcha backend available (Missing API Key?).")
+            return ["" for _ in images]
+        tickets = [self.submit(image) for image in images]
+        codes = []
+        for ticket in tickets:
+            try:
+                codes.append(ticket.result(timeout=timeout))
+            except Exception as e:
+                logger.error(f"Captcha solving failed: {e}")
+                codes.append("")
+        return codes
+
+    def stats(self) -> dict:
+        stats = solver_stats()
+        if self.cache:
+            stats['cache'] = self.cache.stats()
+        return stats
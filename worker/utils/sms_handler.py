@@ -5,40 +5,60 @@ from datetime import datetime, timedelta
 # We need to import the django models. 
 # Since this runs in the worker, Django is already setup by celery_app.py
 from core.models import SMSLog, Order
+from worker.services.sms_bus import SMSBus
 
 logger = logging.getLogger(__name__)
 
+def _code_from_db(order_id: int, timeout: int):
+    log = SMSLog.objects.filter(
+        related_order_id=order_id,
+        received_at__gte=datetime.now() - timedelta(seconds=timeout) # Optimization
+    ).order_by('-received_at').first()
+
+    if log:
+        # Extract Code
+        match = re.search(r'\b\d{6}\b', log.message_content)
+        if match:
+            return match.group(0)
+        logger.warning(f"SMS found but no 6-digit code: {log.message_content}")
+    return None
+
+
 def wait_for_sms(order_id: int, timeout: int = 120, check_interval: int = 2) -> str:
     """
-    Polls the database for an SMSLog associated with the given order_id
-    or a recent SMS if heuristics are used.
+    Waits for the SMS code of the given order_id: pushed by the webhook over
+    Redis, with the database as a fallback (checked first, then every
+    SMS_DB_FALLBACK_INTERVAL seconds; every check_interval if Redis is down).
     
     Returns the 6-digit code if found, else raises TimeoutError.
     """
     logger.info(f"Waiting for SMS for Order {order_id} (Timeout: {timeout}s)")
     
     start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        # Check for logs linked to this order
-        # Note: The webhook tries to link '3DS_WAITING' orders. 
-        # So we look for SMSLog where related_order_id == order_id
-        
-        log = SMSLog.objects.filter(
-            related_order_id=order_id,
-            received_at__gte=datetime.now() - timedelta(seconds=timeout) # Optimization
-        ).order_by('-received_at').first()
-        
-        if log:
-            # Extract Code
-            match = re.search(r'\b\d{6}\b', log.message_content)
-            if match:
-                code = match.group(0)
-                logger.info(f"SMS Code Found: {code}")
-                return code
+    # Note: The webhook tries to link '3DS_WAITING' orders and publishes on the
+    # order's channel, so only this order's SMS (related_order_id) count
+    subscription = SMSBus.subscribe(order_id, shared=False)
+    try:
+        last_db_check = 0.0
+        while time.time() - start_time < timeout:
+            interval = SMSBus.DB_FALLBACK_INTERVAL if subscription else check_interval
+            if time.time() - last_db_check >= interval:
+                last_db_check = time.time()
+                code = _code_from_db(order_id, timeout)
+                if code:
+                    logger.info(f"SMS Code Found: {code}")
+                    return code
+
+            remaining = min(interval, timeout - (time.time() - start_time))
+            if subscription:
+                pushed = subscription.wait(timeout=max(remaining, 0))
+                if pushed and str(pushed.get('order_id')) == str(order_id):
+                    logger.info(f"SMS Code Pushed: {pushed['code']}")
+                    return pushed['code']
             else:
-                logger.warning(f"SMS found but no 6-digit code: {log.message_content}")
-        
-        time.sleep(check_interval)
+                time.sleep(check_interval)
+    finally:
+        if subscription:
+            subscription.close()
         
     raise TimeoutError(f"SMS verification timed out for Order {order_id}")